@@ -6,7 +6,13 @@ import logging
 import argparse
 import re
 import os
+import pathlib
 import pdb
+import sys
+
+# The repository root, so the script can use the src package.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[4]))
+from src import profiling  # noqa: E402
 
 
 def get_var_info(var_list, lu_df):
@@ -177,6 +183,7 @@ def get_file_info(var_dict, lu_df):
 	return all_files, file_to_var
 
 
+@profiling.instrument('acs.build_acs_features')
 def build_acs_features_main(year, vars_file, 
 							lookup_file='acs_{year}_output/col_lookup.csv', 
 							acs_files_path='acs_{year}_output', 
@@ -255,8 +262,8 @@ def build_acs_features_main(year, vars_file,
 	states = [x for x in states if x[0].upper() == x[0]]
 	states = sorted(states)
 
-	# build df to hold features
-	comb = pd.DataFrame()
+	# build list of per-state features, combined once at the end
+	comb = []
 
 	# process raw files state by state, doing calculations on each
 	for s in states:
@@ -280,8 +287,8 @@ def build_acs_features_main(year, vars_file,
 		if do_transforms:
 			st_raw = do_transformations(st_raw, transforms)
 
-		comb = comb.append(st_raw)
-	comb = comb.reset_index()
+		comb.append(st_raw)
+	comb = pd.concat(comb).reset_index()
 
 	comb['geoid'] = ('#_' + comb['geoid']).where(comb['geoid'].str[:2] != '#_')
 
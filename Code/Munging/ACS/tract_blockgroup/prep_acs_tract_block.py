@@ -9,6 +9,11 @@ import argparse
 import re
 import pathlib
 import shutil
+import sys
+
+# The repository root, so the script can use the src package.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[4]))
+from src import profiling  # noqa: E402
 
 STATE_NAMES = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 
                'Colorado', 'Connecticut', 'Delaware', 'DistrictOfColumbia', 
@@ -315,6 +320,7 @@ def build_raw_file(state, year, col_lookup, geo_lookup, state_path=None,
         logging.info('updated column lookup written to col_lookup.csv')
 
 
+@profiling.instrument('acs.prep_acs')
 def prep_acs_main(state, year, template_folder=None, state_path=None, 
         check_types=False, max_vars=2000, output_path='acs_{year}_output/'):
     """ prep ACS data
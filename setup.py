@@ -9,12 +9,17 @@ setup(
     license='MIT',
     install_requires=[
         "gdown>=3.11.1",
-        "geopandas>=0.8.0",
+        "geopandas>=0.10.0",
         "pandas>=1.0.5",
         "pooch>=1.1.1",
+        "pyarrow>=1.0.0",
+        "requests>=2.23.0",
+        "scipy>=1.4.0",
+        "scikit-learn>=0.22",
         "Shapely>=1.7.0",
     ],
     extras_require={
         "tests": ["pytest>=5.4.3", "responses>=0.10.15"],
+        "benchmarks": ["pytest>=5.4.3", "pytest-benchmark>=3.2.0"],
     },
 )
@@ -0,0 +1,83 @@
+"""Benchmark address building against the original implementation.
+
+Run this module as a script to time :func:`src.data.address.build_address`
+against the row-wise string implementation it replaced in
+:func:`src.data.nfirs.ingest_raw_nfirs_data`. ::
+
+  $ python -m src.benchmarks.bench_address --rows 1000000
+
+"""
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+from src.data import address
+
+
+def legacy_build_address(df):
+    """Build addresses with the original row-wise implementation.
+
+    Args:
+        df (pandas.DataFrame): Data with the address part columns.
+
+    Returns:
+        pandas.Series: The combined addresses.
+    """
+    df = df.copy()
+    for part in address.ADDRESS_PARTS:
+        df[part] = df[part].fillna('').astype(str).str.upper()
+    df['street_pre'] = np.where(
+        df['street_pre'] == df['streetname'].str.split(' ').str[0],
+        '', df['street_pre'])
+    result = (df['num_mile'] + ' ' + df['street_pre'] + ' '
+              + df['streetname'] + ' ' + df['streettype'] + ' '
+              + df['streetsuf'])
+    return result.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def random_address_parts(rows, seed=0):
+    """Generate random NFIRS-like address parts.
+
+    Args:
+        rows (int): Number of rows.
+        seed (int): Random seed.
+
+    Returns:
+        pandas.DataFrame: The ADDRESS_PARTS columns.
+    """
+    rng = np.random.default_rng(seed)
+    directions = np.array([None, None, None, 'N', 'S', 'e', 'W', 'NE'],
+                          dtype=object)
+    names = np.array([f'{word} {i}' if i % 7 == 0 else f'{word}{i}'
+                      for i, word in enumerate(['Main', 'Oak', 'Elm', 'Pine',
+                                                'N Maple', 'Cedar'] * 500)],
+                     dtype=object)
+    types = np.array([None, 'St', 'AVE', 'Rd', 'blvd', 'Ct', 'Ln'],
+                     dtype=object)
+    return pd.DataFrame({
+        'num_mile': rng.integers(1, 20_000, rows).astype(str),
+        'street_pre': rng.choice(directions, rows),
+        'streetname': rng.choice(names, rows),
+        'streettype': rng.choice(types, rows),
+        'streetsuf': rng.choice(directions, rows),
+    })
+
+
+def main(rows, repeat):
+    df = random_address_parts(rows)
+    for name, func in [('legacy', legacy_build_address),
+                       ('build_address', address.build_address)]:
+        seconds = min(timeit.repeat(lambda: func(df), number=1,
+                                    repeat=repeat))
+        print(f'{name:>15}: {seconds:.3f} s for {rows:,} rows')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark build_address')
+    parser.add_argument('--rows', type=int, default=1_000_000,
+                        help='number of addresses (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timing repetitions (default %(default)s)')
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
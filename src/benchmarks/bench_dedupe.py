@@ -0,0 +1,122 @@
+"""Benchmark NFIRS de-duplication against the original implementation.
+
+Run this module as a script to time :func:`src.data.nfirs.dedupe_nfirs`
+against the string-keyed groupby, merge and drop_duplicates implementation it
+replaced. ::
+
+  $ python -m src.benchmarks.bench_dedupe --rows 1000000
+
+"""
+import argparse
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from src.data import nfirs
+
+
+def legacy_dedupe_nfirs(df):
+    """De-duplicate NFIRS data with the original implementation.
+
+    Args:
+        df (pandas.DataFrame): Cleaned NFIRS data.
+
+    Returns:
+        pandas.DataFrame: The de-duplicated data.
+    """
+    df = df.copy()
+    df['full_address_date'] = (df['address'].str.strip() + ', ' + df['city']
+                               + ', ' + df['state_id'] + ' - '
+                               + df['inc_date'].astype(str))
+    agg_funcs1 = {
+        'oth_inj': ['sum', 'max'],
+        'oth_death': ['sum', 'max'],
+        'prop_loss': ['sum', 'max'],
+        'cont_loss': ['sum', 'max'],
+        'tot_loss': ['sum', 'max'],
+        'apt_no': 'nunique',
+        'st_fdid': 'nunique',
+        'exp_no': 'nunique',
+        'state': 'size'
+    }
+    df_rollup = (df.groupby('full_address_date')
+                 .agg(agg_funcs1)
+                 .rename(columns={'state': 'num_records'}))
+    df_rollup.columns = df_rollup.columns.map('_'.join)
+    mask1 = df_rollup['apt_no_nunique'] > 1
+    base_col_names = ['oth_inj', 'oth_death', 'prop_loss', 'cont_loss',
+                      'tot_loss']
+    for name in base_col_names:
+        df_rollup[name] = np.where(mask1, df_rollup[name + '_sum'],
+                                   df_rollup[name + '_max'])
+    dropcols = ([name + '_sum' for name in base_col_names]
+                + [name + '_max' for name in base_col_names])
+    df_rollup = df_rollup.drop(dropcols, axis=1)
+    dropcols2 = [col for col in df.columns if col in df_rollup.columns]
+    return (df.drop(dropcols2, axis=1)
+            .merge(df_rollup, how='right', left_on='full_address_date',
+                   right_index=True)
+            .drop_duplicates('full_address_date')
+            .drop('full_address_date', axis=1))
+
+
+def random_cleaned_nfirs(rows, seed=0):
+    """Generate random data shaped like cleaned NFIRS data.
+
+    About a third of the rows repeat the address and date of another row,
+    some of them with different apartment numbers.
+
+    Args:
+        rows (int): Number of rows.
+        seed (int): Random seed.
+
+    Returns:
+        pandas.DataFrame: The columns used by dedupe_nfirs.
+    """
+    rng = np.random.default_rng(seed)
+    homes = rng.integers(0, rows * 2 // 3 + 1, rows)
+    states = np.array(['VA', 'MD', 'DC', 'CA', 'TX'], dtype=object)
+    apts = np.array([np.nan, np.nan, np.nan, '1', '2', '3A'], dtype=object)
+    df = pd.DataFrame({
+        'state': states[homes % 5],
+        'st_fdid': pd.Series(states[homes % 5]) + '_' + pd.Series(
+            (homes % 997).astype(str)).str.zfill(5),
+        'inc_date': pd.Timestamp('2016-01-01') + pd.to_timedelta(
+            homes % 366, unit='D'),
+        'exp_no': rng.choice(['000', '001'], rows, p=[0.9, 0.1]),
+        'address': pd.Series(homes.astype(str)) + ' MAIN ST',
+        'apt_no': rng.choice(apts, rows),
+        'city': pd.Series((homes % 101).astype(str)).radd('CITY '),
+        'state_id': states[homes % 5],
+        'oth_inj': rng.choice([0.0, 0.0, 1.0, np.nan], rows),
+        'oth_death': rng.choice([0.0, 0.0, 0.0, 1.0], rows),
+        'prop_loss': rng.integers(0, 10_000, rows).astype(float),
+        'cont_loss': rng.integers(0, 5_000, rows).astype(float),
+    })
+    df['tot_loss'] = df['prop_loss'] + df['cont_loss']
+    return df
+
+
+def main(rows, repeat):
+    df = random_cleaned_nfirs(rows)
+    for name, func in [('legacy', legacy_dedupe_nfirs),
+                       ('dedupe_nfirs', nfirs.dedupe_nfirs)]:
+        seconds = min(timeit.repeat(lambda: func(df), number=1,
+                                    repeat=repeat))
+        tracemalloc.start()
+        func(df)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print(f'{name:>12}: {seconds:.3f} s, peak {peak:,.0f} MB '
+              f'for {rows:,} rows')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark dedupe_nfirs')
+    parser.add_argument('--rows', type=int, default=1_000_000,
+                        help='number of records (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timing repetitions (default %(default)s)')
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
@@ -0,0 +1,99 @@
+"""Benchmark fuzzy address matching.
+
+Run this module as a script to time :meth:`src.data.fuzzy_match.FuzzyMatcher
+.match` on misspelled copies of random addresses, and to report how many of
+them are matched back to the address they were copied from. ::
+
+  $ python -m src.benchmarks.bench_fuzzy_match --rows 300000
+
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from src.benchmarks.bench_address import random_address_parts
+from src.data import address
+from src.data.fuzzy_match import FuzzyMatcher
+
+
+def random_addresses(rows, zips=500, seed=0):
+    """Generate random addresses.
+
+    Args:
+        rows (int): Number of addresses.
+        zips (int): Number of distinct ZIP codes.
+        seed (int): Random seed.
+
+    Returns:
+        pandas.DataFrame: Columns *address*, *city*, *state*, and *zip*.
+    """
+    rng = np.random.default_rng(seed)
+    zipcode = rng.integers(0, zips, rows)
+    return pd.DataFrame({
+        'address': address.build_address(random_address_parts(rows, seed)),
+        'city': pd.Series(zipcode).astype(str).radd('CITY '),
+        'state': 'VA',
+        'zip': pd.Series(zipcode + 20000).astype(str),
+    })
+
+
+def misspell(addresses, seed=0):
+    """Swap two adjacent letters in the longest word of each address.
+
+    Args:
+        addresses (pandas.DataFrame): Addresses from random_addresses.
+        seed (int): Random seed.
+
+    Returns:
+        pandas.DataFrame: The misspelled addresses.
+    """
+    rng = np.random.default_rng(seed)
+    addresses = addresses.copy()
+    misspelled = []
+    for value, r in zip(addresses['address'], rng.random(len(addresses))):
+        words = value.split(' ')
+        k = max(range(len(words)), key=lambda k: len(words[k]))
+        word = words[k]
+        if len(word) > 3:
+            # Keep the first letter, so the Soundex code usually stays.
+            i = 1 + int(r * (len(word) - 2))
+            words[k] = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        misspelled.append(' '.join(words))
+    addresses['address'] = misspelled
+    return addresses
+
+
+def main(rows, reference_rows, repeat):
+    reference = random_addresses(reference_rows)
+    sample = np.random.default_rng(1).choice(reference_rows, rows)
+    queries = misspell(reference.iloc[sample].reset_index(drop=True))
+
+    start = time.perf_counter()
+    matcher = FuzzyMatcher(reference)
+    print(f'{"index":>8}: {time.perf_counter() - start:.3f} s for '
+          f'{reference_rows:,} reference addresses')
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = matcher.match(queries)
+        seconds.append(time.perf_counter() - start)
+    correct = (reference['address'].to_numpy()[result['reference']]
+               == reference['address'].to_numpy()[sample]) & result['match']
+    print(f'{"match":>8}: {min(seconds):.3f} s for {rows:,} addresses, '
+          f'{result["match"].mean():.1%} matched, {correct.mean():.1%} '
+          'to the right address')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark fuzzy matching')
+    parser.add_argument('--rows', type=int, default=100_000,
+                        help='number of addresses to match '
+                             '(default %(default)s)')
+    parser.add_argument('--reference-rows', type=int, default=1_000_000,
+                        help='number of reference addresses '
+                             '(default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='timing repetitions (default %(default)s)')
+    args = parser.parse_args()
+    main(args.rows, args.reference_rows, args.repeat)
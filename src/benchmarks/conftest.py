@@ -0,0 +1,33 @@
+"""Options and fixtures for the benchmark suite."""
+import pytest
+from src import utils
+from src.benchmarks import synthetic
+
+
+def pytest_addoption(parser):
+    parser.addoption("--scales", default="1,10,100",
+                     help="comma-separated synthetic data scale factors "
+                          "(default %(default)s)")
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        scales = metafunc.config.getoption("scales").split(",")
+        metafunc.parametrize("scale", [int(scale) for scale in scales],
+                             ids=[f"{scale}x" for scale in scales],
+                             scope="session")
+
+
+@pytest.fixture(scope="session")
+def data_dir(scale, tmp_path_factory):
+    """Write a synthetic data directory at the requested scale."""
+    return synthetic.write_data_dir(tmp_path_factory.mktemp(f"data{scale}x"),
+                                    scale=scale)
+
+
+@pytest.fixture
+def data(data_dir, monkeypatch):
+    """Point src.utils.DATA at the synthetic data directory."""
+    for key in utils.DATA:
+        monkeypatch.setitem(utils.DATA, key, data_dir[key])
+    return data_dir
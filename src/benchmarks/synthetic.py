@@ -0,0 +1,380 @@
+"""Synthetic project data for benchmarks.
+
+The functions in this module write random data with the layout and file
+formats of the project's raw data, so that the pipelines can be timed without
+the private ``Data/`` tree. Every function takes a `scale` factor that
+multiplies the amount of data written at scale 1.
+
+- :func:`src.benchmarks.synthetic.write_nfirs` writes one year of raw NFIRS
+  tables.
+- :func:`src.benchmarks.synthetic.write_acs` writes raw ACS files, a column
+  lookup, and a variables file as used by ``build_acs_features.py``.
+- :func:`src.benchmarks.synthetic.write_tracts` writes 2010 Census tract
+  shapefiles.
+- :func:`src.benchmarks.synthetic.write_block_groups` writes 2010 Census
+  block group shapefiles.
+- :func:`src.benchmarks.synthetic.write_fire_stations` writes fire station
+  locations.
+- :func:`src.benchmarks.synthetic.write_data_dir` writes all of the above
+  to a directory laid out like ``Data/``.
+
+Run this module as a script to write a synthetic data directory. ::
+
+  $ python -m src.benchmarks.synthetic /tmp/synthetic --scale 10
+
+Attributes:
+    NFIRS_ROWS (int): Raw NFIRS incidents written at scale 1.
+    TRACTS (int): Census tracts per state at scale 1.
+    STATIONS (int): Fire stations written at scale 1.
+    STATES (dict): The synthetic states, with their full names and bounding
+        boxes (west, south, east, north).
+
+"""
+import argparse
+import pathlib
+
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely.geometry
+from src import utils
+from src.data import raw
+
+
+# Raw NFIRS incidents written at scale 1.
+NFIRS_ROWS = 2_000
+
+
+# Census tracts per state at scale 1.
+TRACTS = 64
+
+
+# Fire stations written at scale 1.
+STATIONS = 200
+
+
+# The synthetic states, with their full names and bounding boxes.
+STATES = {
+    "VA": ("Virginia", (-83.0, 36.5, -75.5, 39.5)),
+    "MD": ("Maryland", (-79.5, 37.9, -75.0, 39.7)),
+    "DC": ("DistrictOfColumbia", (-77.12, 38.8, -76.91, 39.0)),
+}
+
+
+# ACS variables written to each raw ACS file part, by part number.
+_ACS_PARTS = {
+    1: ["B01001_001", "B01001_002", "B01001_026"],
+    2: ["B25003_001", "B25003_002", "B25003_003"],
+    3: ["B19013_001"],
+}
+
+
+# Transformations written to the ACS variables file.
+_ACS_TRANSFORMS = [
+    ("tot_population", "=", "B01001_001", np.nan),
+    ("pct_male", "/", "B01001_002", "B01001_001"),
+    ("pct_female", "/", "B01001_026", "B01001_001"),
+    ("pct_owner_occ", "/", "B25003_002", "B25003_001"),
+    ("pct_renter_occ", "/", "B25003_003", "B25003_001"),
+    ("med_hh_income", "=", "B19013_001", np.nan),
+]
+
+
+def write_nfirs(directory, scale=1, seed=0):
+    """Write one year of synthetic raw NFIRS tables.
+
+    The tables have the columns in :data:`src.data.raw.NFIRS_COLUMNS` and the
+    quirks of the real data that the cleaning code handles: duplicate rows,
+    non-residential and non-fire incidents, incidents without a fire record,
+    repeated addresses, and missing values.
+
+    Args:
+        directory (path-like): Directory to write the tables to.
+        scale (float): Scale factor for the number of incidents.
+        seed (int): Random seed.
+
+    Returns:
+        pathlib.Path: The directory.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    rows = int(NFIRS_ROWS * scale)
+
+    states = np.array(list(STATES))[rng.integers(0, len(STATES), rows)]
+    days = rng.integers(0, 366, rows)
+    inc_date = (pd.Timestamp("2016-01-01") + pd.to_timedelta(days, unit="D"))
+    # NFIRS incident numbers are mostly digits with a few alphanumeric ones.
+    inc_no = pd.Series(np.arange(rows)).astype(str).str.zfill(7)
+    inc_no[rng.random(rows) < 0.02] = "A" + inc_no.str[1:]
+    keys = pd.DataFrame({
+        "STATE": states,
+        "FDID": (pd.Series(rng.integers(1, 1000, rows)).astype(str)
+                 .str.zfill(5)),
+        "INC_DATE": inc_date.strftime("%m%d%Y").str.lstrip("0"),
+        "INC_NO": inc_no,
+        "EXP_NO": rng.choice(["0", "1"], rows, p=[0.95, 0.05]),
+    })
+
+    basic = keys.assign(
+        INC_TYPE=rng.choice(raw.HOME_FIRE_INC_TYPES + [100, 131, 322], rows),
+        PROP_USE=rng.choice(["419", "429", "400", "161", None], rows),
+        AID=rng.choice(["N", "1", "3"], rows),
+        DEPT_STA=rng.choice(["1", "2", "12", None], rows),
+        OTH_INJ=rng.choice([np.nan, 0, 1], rows, p=[0.8, 0.15, 0.05]),
+        OTH_DEATH=rng.choice([np.nan, 0, 1], rows, p=[0.9, 0.09, 0.01]),
+        PROP_LOSS=_with_missing(rng, rng.integers(0, 100_000, rows), 0.3),
+        CONT_LOSS=_with_missing(rng, rng.integers(0, 50_000, rows), 0.4),
+    )
+    # Repeat some incidents to exercise de-duplication.
+    basic = pd.concat([basic, basic.sample(frac=0.01, random_state=seed)])
+
+    # About a third of the incidents share the address of another incident.
+    homes = rng.integers(0, max(rows * 2 // 3, 1), rows)
+    address = keys.assign(
+        LOC_TYPE="1",
+        NUM_MILE=(homes % 9_973 + 1).astype(str),
+        STREET_PRE=np.array(["", "N", "S", "E", "W"])[homes % 5],
+        STREETNAME=np.array(["Main", "Oak", "N Maple", "Elm", "Pine",
+                             "Washington", "Lake View"])[homes % 7],
+        STREETTYPE=np.array(["St", "Ave", "Rd", "Dr", "Ln",
+                             "Blvd"])[homes % 6],
+        STREETSUF=np.array(["", "", "", "NW", "SE"])[homes % 5],
+        APT_NO=rng.choice(["", "", "", "1", "2B"], rows),
+        CITY=pd.Series(homes % 101).astype(str).radd("City "),
+        STATE_ID=np.where(rng.random(rows) < 0.01, "", states),
+        ZIP5=rng.choice(["22201", "20814", "20001", "00000", ""], rows),
+        ZIP4="",
+        X_STREET="",
+    )
+    fire = keys.assign(
+        DETECTOR=rng.choice(["1", "N", "U"], rows),
+        DET_TYPE=rng.choice(["1", "2", ""], rows),
+        DET_POWER=rng.choice(["1", "2", ""], rows),
+        DET_OPERAT=rng.choice(["1", "2", ""], rows),
+        DET_EFFECT=rng.choice(["1", "2", ""], rows),
+        DET_FAIL=rng.choice(["1", ""], rows),
+        AES_PRES=rng.choice(["N", "1"], rows),
+        AES_TYPE="",
+        AES_OPER="",
+        NO_SPR_OP="",
+        AES_FAIL="",
+    ).sample(frac=0.9, random_state=seed)
+
+    for table, df in [("basic", basic), ("address", address),
+                      ("fire", fire)]:
+        df.to_csv(directory / raw.NFIRS_FILES[table], sep="^", index=False,
+                  encoding="latin-1")
+    return directory
+
+
+def write_acs(directory, year=2016, scale=1, seed=0):
+    """Write synthetic raw ACS data as prepared by prep_acs_tract_block.py.
+
+    The directory gets one ``{State}_raw_{part}.csv`` file per state and file
+    part with tract and block group estimates, the column lookup
+    ``col_lookup.csv``, and a tab-delimited variables file
+    ``acs_{year}_munging.txt`` with transformations of the raw variables.
+
+    Args:
+        directory (path-like): Directory to write the files to.
+        year (int): Four-digit ACS year.
+        scale (float): Scale factor for the number of tracts.
+        seed (int): Random seed.
+
+    Returns:
+        pathlib.Path: The variables file.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    tracts = int(TRACTS * scale)
+
+    lookup = pd.DataFrame([
+        {"file_num": 1, "field_num": i, "output_part_num": part,
+         "type": "Int32", "code": code, "label": f"Estimate {code}"}
+        for part, codes in _ACS_PARTS.items()
+        for i, code in enumerate(codes)
+    ])
+    lookup.to_csv(directory / "col_lookup.csv", index=False)
+
+    for state, (name, _) in STATES.items():
+        geoids = _tract_geoids(state, tracts)
+        # Tracts (summary level 140) and their block groups (150).
+        geoid = np.concatenate([
+            "14000US" + geoids,
+            np.char.add("15000US" + np.repeat(geoids, 3),
+                        np.tile(["1", "2", "3"], tracts)),
+        ])
+        for part, codes in _ACS_PARTS.items():
+            df = pd.DataFrame({"state": state.lower(), "geoid": geoid})
+            for code in codes:
+                values = rng.integers(0, 5_000, len(geoid)).astype(float)
+                df[code] = _with_missing(rng, values, 0.01)
+            df.to_csv(directory / f"{name}_raw_{part}.csv", index=False)
+
+    vars_file = directory / f"acs_{year}_munging.txt"
+    pd.DataFrame(_ACS_TRANSFORMS, columns=["variable_name", "operator",
+                                           "argument1", "argument2"]
+                 ).to_csv(vars_file, sep="\t", index=False)
+    return vars_file
+
+
+def write_tracts(directory, scale=1):
+    """Write synthetic 2010 Census tract shapefiles.
+
+    Each state's bounding box is split into a grid of rectangular tracts,
+    written to ``tl_2010_{fips}_tract10.shp`` like the Census TIGER/Line
+    files read by :func:`src.data.raw.read_shapefiles`.
+
+    Args:
+        directory (path-like): Directory to write the shapefiles to.
+        scale (float): Scale factor for the number of tracts.
+
+    Returns:
+        pathlib.Path: The directory.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for state in STATES:
+        geoids, boxes = _tract_boxes(state, scale)
+        tracts_df = geopandas.GeoDataFrame({
+            "STATEFP10": geoids.str[:2],
+            "COUNTYFP10": geoids.str[2:5],
+            "TRACTCE10": geoids.str[5:],
+            "GEOID10": geoids,
+        }, geometry=boxes, crs="EPSG:4269")
+        code = raw.STATES[state]
+        tracts_df.to_file(directory / f"tl_2010_{code}_tract10.shp")
+    return directory
+
+
+def write_block_groups(directory, scale=1):
+    """Write synthetic 2010 Census block group shapefiles.
+
+    Each tract written by :func:`write_tracts` is split into three block
+    groups side by side, written to ``tl_2010_{fips}_bg10.shp`` like the
+    files read by :mod:`src.data.geoids`.
+
+    Args:
+        directory (path-like): Directory to write the shapefiles to.
+        scale (float): Scale factor for the number of tracts.
+
+    Returns:
+        pathlib.Path: The directory.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for state in STATES:
+        geoids, boxes = _tract_boxes(state, scale)
+        bounds = np.repeat(shapely.bounds(np.asarray(boxes)), 3, axis=0)
+        part = np.tile(np.arange(3), len(boxes))
+        width = (bounds[:, 2] - bounds[:, 0]) / 3
+        west = bounds[:, 0] + part * width
+        groups = geopandas.GeoDataFrame({
+            "GEOID10": np.char.add(np.repeat(geoids.to_numpy().astype(str), 3),
+                                   (part + 1).astype(str)),
+        }, geometry=shapely.box(west, bounds[:, 1], west + width,
+                                bounds[:, 3]), crs="EPSG:4269")
+        code = raw.STATES[state]
+        groups.to_file(directory / f"tl_2010_{code}_bg10.shp")
+    return directory
+
+
+def write_fire_stations(path, scale=1, seed=0):
+    """Write synthetic fire station locations.
+
+    Args:
+        path (path-like): The CSV file to write.
+        scale (float): Scale factor for the number of stations.
+        seed (int): Random seed.
+
+    Returns:
+        pathlib.Path: The file.
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    rows = int(STATIONS * scale)
+
+    states = np.array(list(STATES))[rng.integers(0, len(STATES), rows)]
+    bounds = np.array([STATES[state][1] for state in states])
+    stations = pd.DataFrame({
+        "ID": np.arange(rows),
+        "NAME": pd.Series(np.arange(rows)).astype(str).radd("Station "),
+        "STATE": states,
+        "Latitude": rng.uniform(bounds[:, 1], bounds[:, 3]),
+        "Longitude": rng.uniform(bounds[:, 0], bounds[:, 2]),
+    })
+    stations.to_csv(path, index=False)
+    return path
+
+
+def write_data_dir(root, scale=1, year=2016, seed=0):
+    """Write a synthetic data directory laid out like ``Data/``.
+
+    Args:
+        root (path-like): The data directory to create.
+        scale (float): Scale factor for all data.
+        year (int): Four-digit year of the NFIRS and ACS data.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Paths to the data directories, with the keys of
+        :data:`src.utils.DATA`, plus ``"acs"`` (the ACS directory) and
+        ``"acs-vars"`` (the ACS variables file).
+    """
+    root = pathlib.Path(root)
+    data = {key: root / path.relative_to(utils.DATA["data"])
+            for key, path in utils.DATA.items()}
+    data["acs"] = data["raw"] / f"acs_{year}_output"
+    for path in data.values():
+        path.mkdir(parents=True, exist_ok=True)
+    write_nfirs(data["raw"] / "nfirs" / str(year), scale, seed)
+    data["acs-vars"] = write_acs(data["acs"], year, scale, seed)
+    write_tracts(data["shapefiles-census"], scale)
+    write_block_groups(data["shapefiles-census-bg"], scale)
+    write_fire_stations(data["master"] / "Fire Station Location Data.csv",
+                        scale, seed)
+    return data
+
+
+def _tract_boxes(state, scale):
+    # Split the state's bounding box into a grid of tracts.
+    tracts = int(TRACTS * scale)
+    side = int(np.ceil(np.sqrt(tracts)))
+    west, south, east, north = STATES[state][1]
+    xs = np.linspace(west, east, side + 1)
+    ys = np.linspace(south, north, side + 1)
+    boxes = [shapely.geometry.box(xs[i % side], ys[i // side],
+                                  xs[i % side + 1], ys[i // side + 1])
+             for i in range(tracts)]
+    return _tract_geoids(state, tracts), boxes
+
+
+def _tract_geoids(state, tracts):
+    # Tracts are numbered within 20 counties of the state.
+    numbers = np.arange(tracts)
+    county = pd.Series(numbers % 20 * 2 + 1).astype(str).str.zfill(3)
+    tract = pd.Series(numbers // 20 * 100 + 100).astype(str).str.zfill(6)
+    return raw.STATES[state] + county + tract
+
+
+def _with_missing(rng, values, fraction):
+    values = np.asarray(values, dtype=float)
+    values[rng.random(len(values)) < fraction] = np.nan
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic data directory")
+    parser.add_argument("root", help="data directory to create")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="scale factor (default %(default)s)")
+    parser.add_argument("--year", type=int, default=2016,
+                        help="data year (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default %(default)s)")
+    args = parser.parse_args()
+    write_data_dir(args.root, args.scale, args.year, args.seed)
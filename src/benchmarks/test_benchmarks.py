@@ -0,0 +1,106 @@
+"""Benchmarks of the data pipelines on synthetic data.
+
+The benchmarks use pytest-benchmark and run each pipeline stage on synthetic
+data (see :mod:`src.benchmarks.synthetic`) at 1x, 10x and 100x scale. ::
+
+  $ pytest src/benchmarks --benchmark-autosave
+  $ pytest src/benchmarks --scales 1,10 --benchmark-compare
+
+"""
+import importlib.util
+
+import pytest
+from src import utils
+from src.data import fire_stations, geoids, nfirs, raw
+from src.features import station_distance
+
+
+pytest.importorskip("pytest_benchmark")
+
+
+def load_acs_features():
+    """Import the ACS feature script, which is not part of the package."""
+    path = (utils.ROOT / "Code" / "Munging" / "ACS" / "tract_blockgroup"
+            / "build_acs_features.py")
+    spec = importlib.util.spec_from_file_location("build_acs_features", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def nfirs_dir(data):
+    return data["raw"] / "nfirs" / "2016"
+
+
+def test_read_nfirs(benchmark, nfirs_dir):
+    nfirs_dict = benchmark(raw.read_nfirs, nfirs_dir)
+    assert len(nfirs_dict["basic"]) > 0
+
+
+def test_read_nfirs_streaming(benchmark, nfirs_dir):
+    nfirs_dict = benchmark(raw.read_nfirs, nfirs_dir, chunksize=100_000)
+    assert len(nfirs_dict["basic"]) > 0
+
+
+def test_read_nfirs_cache(benchmark, nfirs_dir):
+    # The first read builds the cache, so only cached reads are timed.
+    raw.read_nfirs(nfirs_dir, cache=True)
+    nfirs_dict = benchmark(raw.read_nfirs, nfirs_dir, cache=True)
+    assert len(nfirs_dict["basic"]) > 0
+
+
+def test_ingest_raw_nfirs_data(benchmark, nfirs_dir):
+    nfirs_dict = raw.read_nfirs(nfirs_dir)
+    # ingest_raw_nfirs_data modifies its input tables, so copy them per round.
+    df = benchmark.pedantic(
+        nfirs.ingest_raw_nfirs_data,
+        setup=lambda: (({k: v.copy() for k, v in nfirs_dict.items()},), {}),
+        rounds=5)
+    assert len(df) > 0
+
+
+def test_dedupe_nfirs(benchmark, nfirs_dir):
+    df = nfirs.ingest_raw_nfirs_data(raw.read_nfirs(nfirs_dir))
+    result = benchmark(nfirs.dedupe_nfirs, df)
+    assert 0 < len(result) <= len(df)
+
+
+def test_read_shapefiles(benchmark, data):
+    # The first read builds the GeoParquet store, so only store reads are
+    # timed.
+    raw.read_shapefiles()
+    result = benchmark(raw.read_shapefiles, states=["VA", "MD"])
+    assert result.STATEFP10.isin(["51", "24"]).all()
+
+
+def test_fire_stations_process(benchmark, data):
+    result = benchmark(fire_stations.process)
+    assert result.GEOID10.notna().any()
+
+
+def test_assign_geoids(benchmark, data):
+    stations = raw.read_fire_stations()
+    stations["statefp"] = stations["STATE"].map(raw.STATES)
+    result = benchmark(geoids.assign_geoids, stations, lon="Longitude",
+                       lat="Latitude")
+    assert result.bg_geoid.notna().any()
+
+
+def test_nearest_stations(benchmark, data):
+    stations = raw.read_fire_stations()
+    # Points spread around the stations, 100 per station.
+    points = stations.sample(frac=100, replace=True, random_state=0)
+    points = points.assign(lon=points.Longitude + 0.01, lat=points.Latitude)
+    result = benchmark(station_distance.nearest_stations, points, stations)
+    assert result.distance.max() < 1
+
+
+def test_build_acs_features(benchmark, data, tmp_path):
+    acs = load_acs_features()
+    output_file = tmp_path / "acs_{year}_features"
+    benchmark(acs.build_acs_features_main, 2016, str(data["acs-vars"]),
+              lookup_file=str(data["acs"] / "col_lookup.csv"),
+              acs_files_path=str(data["acs"]),
+              output_file=str(output_file))
+    assert (tmp_path / "acs_2016_features.csv").exists()
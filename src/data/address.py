@@ -0,0 +1,360 @@
+"""Vectorized normalization of street addresses.
+
+NFIRS records each street address in five parts (house number, prefix
+direction, street name, street type, and suffix direction). Most values of
+each part repeat many times in a year of data, so the functions in this module
+normalize each *distinct* value once and broadcast the result back to the rows
+through integer codes, rather than running string operations on every row.
+
+- :func:`src.data.address.build_address` combines the address parts into the
+  single ``address`` field used by :mod:`src.data.nfirs`.
+- :func:`src.data.address.standardize_address` standardizes full addresses
+  with USPS street suffix and directional abbreviations, giving a key that
+  matches different spellings of the same address.
+- :func:`src.data.address.strip_unit` removes apartment and other unit
+  numbers from addresses.
+- :func:`src.data.address.map_distinct` applies a string function to the
+  distinct values of a column.
+
+Attributes:
+    ADDRESS_PARTS (list): The NFIRS address part columns, in address order.
+    DIRECTIONALS (dict): USPS directional abbreviations.
+    STREET_SUFFIXES (dict): USPS street suffix abbreviations (Publication 28,
+        Appendix C1) for common suffixes and their variants.
+    UNIT_DESIGNATORS (list): Words that start a unit number at the end of an
+        address (Publication 28, Appendix C2), with common variants.
+
+"""
+import numpy as np
+import pandas as pd
+
+
+# The NFIRS address part columns, in address order.
+ADDRESS_PARTS = ["num_mile", "street_pre", "streetname", "streettype",
+                 "streetsuf"]
+
+
+# Map directionals to USPS abbreviations.
+DIRECTIONALS = {
+    "NORTH": "N",
+    "SOUTH": "S",
+    "EAST": "E",
+    "WEST": "W",
+    "NORTHEAST": "NE",
+    "NORTHWEST": "NW",
+    "SOUTHEAST": "SE",
+    "SOUTHWEST": "SW",
+    "SO": "S",
+}
+
+
+# Map street suffixes and their common variants to USPS abbreviations.
+STREET_SUFFIXES = {
+    "ALLEY": "ALY", "ALLY": "ALY", "ALLEE": "ALY",
+    "ANNEX": "ANX", "ANEX": "ANX",
+    "ARCADE": "ARC",
+    "AVENUE": "AVE", "AV": "AVE", "AVEN": "AVE", "AVENU": "AVE", "AVN": "AVE",
+    "AVNUE": "AVE",
+    "BAYOU": "BYU",
+    "BEACH": "BCH",
+    "BEND": "BND",
+    "BLUFF": "BLF",
+    "BOTTOM": "BTM",
+    "BOULEVARD": "BLVD", "BOUL": "BLVD", "BOULV": "BLVD", "BLV": "BLVD",
+    "BRANCH": "BR",
+    "BRIDGE": "BRG",
+    "BROOK": "BRK",
+    "BYPASS": "BYP",
+    "CAMP": "CP",
+    "CANYON": "CYN",
+    "CAPE": "CPE",
+    "CAUSEWAY": "CSWY",
+    "CENTER": "CTR", "CENTRE": "CTR", "CENT": "CTR", "CNTR": "CTR",
+    "CIRCLE": "CIR", "CIRC": "CIR", "CIRCL": "CIR", "CRCL": "CIR",
+    "CLIFF": "CLF",
+    "CLUB": "CLB",
+    "COMMON": "CMN",
+    "CORNER": "COR",
+    "COURSE": "CRSE",
+    "COURT": "CT", "CRT": "CT",
+    "COVE": "CV",
+    "CREEK": "CRK",
+    "CRESCENT": "CRES", "CRSENT": "CRES",
+    "CREST": "CRST",
+    "CROSSING": "XING", "CRSSNG": "XING",
+    "CROSSROAD": "XRD",
+    "CURVE": "CURV",
+    "DALE": "DL",
+    "DAM": "DM",
+    "DIVIDE": "DV", "DIV": "DV",
+    "DRIVE": "DR", "DRIV": "DR", "DRV": "DR",
+    "ESTATE": "EST",
+    "ESTATES": "ESTS",
+    "EXPRESSWAY": "EXPY", "EXPR": "EXPY", "EXPRESS": "EXPY", "EXPW": "EXPY",
+    "EXTENSION": "EXT", "EXTN": "EXT",
+    "FALLS": "FLS",
+    "FERRY": "FRY",
+    "FIELD": "FLD",
+    "FIELDS": "FLDS",
+    "FLAT": "FLT",
+    "FORD": "FRD",
+    "FOREST": "FRST",
+    "FORGE": "FRG",
+    "FORK": "FRK",
+    "FORT": "FT",
+    "FREEWAY": "FWY", "FREEWY": "FWY", "FRWAY": "FWY", "FRWY": "FWY",
+    "GARDEN": "GDN",
+    "GARDENS": "GDNS",
+    "GATEWAY": "GTWY",
+    "GLEN": "GLN",
+    "GREEN": "GRN",
+    "GROVE": "GRV",
+    "HARBOR": "HBR",
+    "HAVEN": "HVN",
+    "HEIGHTS": "HTS", "HT": "HTS",
+    "HIGHWAY": "HWY", "HIGHWY": "HWY", "HIWAY": "HWY", "HIWY": "HWY",
+    "HWAY": "HWY",
+    "HILL": "HL",
+    "HILLS": "HLS",
+    "HOLLOW": "HOLW", "HLLW": "HOLW", "HOLLOWS": "HOLW", "HOLWS": "HOLW",
+    "ISLAND": "IS",
+    "JUNCTION": "JCT", "JCTION": "JCT", "JUNCTN": "JCT",
+    "KNOLL": "KNL",
+    "LAKE": "LK",
+    "LAKES": "LKS",
+    "LANDING": "LNDG",
+    "LANE": "LN",
+    "LIGHT": "LGT",
+    "LOOP": "LOOP",
+    "MANOR": "MNR",
+    "MEADOW": "MDW",
+    "MEADOWS": "MDWS",
+    "MILL": "ML",
+    "MOUNT": "MT",
+    "MOUNTAIN": "MTN",
+    "ORCHARD": "ORCH",
+    "OVAL": "OVAL",
+    "OVERPASS": "OPAS",
+    "PARKWAY": "PKWY", "PARKWY": "PKWY", "PKWAY": "PKWY", "PKY": "PKWY",
+    "PARKWAYS": "PKWY",
+    "PASSAGE": "PSGE",
+    "PIKE": "PIKE",
+    "PINES": "PNES",
+    "PLACE": "PL",
+    "PLAIN": "PLN",
+    "PLAINS": "PLNS",
+    "PLAZA": "PLZ", "PLZA": "PLZ",
+    "POINT": "PT",
+    "POINTE": "PT",
+    "PORT": "PRT",
+    "PRAIRIE": "PR",
+    "RANCH": "RNCH",
+    "RIDGE": "RDG",
+    "RIVER": "RIV", "RVR": "RIV",
+    "ROAD": "RD",
+    "ROUTE": "RTE",
+    "RUN": "RUN",
+    "SHORE": "SHR",
+    "SHORES": "SHRS",
+    "SPRING": "SPG",
+    "SPRINGS": "SPGS",
+    "SQUARE": "SQ", "SQR": "SQ", "SQU": "SQ",
+    "STATION": "STA", "STATN": "STA", "STN": "STA",
+    "STREET": "ST", "STR": "ST", "STRT": "ST",
+    "SUMMIT": "SMT",
+    "TERRACE": "TER", "TERR": "TER",
+    "TRACE": "TRCE",
+    "TRAIL": "TRL", "TRAILS": "TRL", "TRLS": "TRL",
+    "TRAILER": "TRLR",
+    "TUNNEL": "TUNL",
+    "TURNPIKE": "TPKE", "TRNPK": "TPKE", "TURNPK": "TPKE",
+    "UNION": "UN",
+    "VALLEY": "VLY",
+    "VIEW": "VW",
+    "VILLAGE": "VLG",
+    "VILLE": "VL",
+    "VISTA": "VIS",
+    "WALK": "WALK",
+    "WAY": "WAY", "WY": "WAY",
+    "WELLS": "WLS",
+}
+
+
+# Words that start a unit number at the end of an address.
+UNIT_DESIGNATORS = ["APARTMENT", "APT", "BASEMENT", "BSMT", "BUILDING", "BLDG",
+                    "DEPARTMENT", "DEPT", "FLOOR", "FL", "LOT", "NUMBER", "NO",
+                    "ROOM", "RM", "SPACE", "SPC", "SUITE", "STE", "TRAILER",
+                    "TRLR", "UNIT"]
+
+
+# Characters that are dropped from addresses before standardizing them ("#"
+# is split off as a unit designator first).
+_PUNCTUATION = r"[.,;:'\"]"
+
+
+def map_distinct(values, func):
+    """Apply a string function to the distinct values of a column.
+
+    Args:
+        values (pandas.Series): The column.
+        func (callable): Function from a pandas.Series of distinct values
+            (missing values excluded) to a pandas.Series of results.
+
+    Returns:
+        pandas.Series: The result for each row, aligned with `values`.
+            Missing values stay missing.
+    """
+    codes, uniques = pd.factorize(values)
+    results = np.asarray(func(pd.Series(uniques, dtype=object)), dtype=object)
+    # Code -1 marks missing values; map it to a trailing NaN.
+    results = np.append(results, np.nan)
+    return pd.Series(results[codes], index=values.index)
+
+
+def build_address(df):
+    """Combine NFIRS address parts into a single address string.
+
+    The address is the house number, prefix direction, street name, street
+    type and suffix direction, upper-cased and separated by single spaces.
+    Some street names include the prefix direction (e.g. "N N 21ST ST"), so
+    the prefix direction is dropped if it equals the first word of the street
+    name.
+
+    Args:
+        df (pandas.DataFrame): Data with the ADDRESS_PARTS columns.
+
+    Returns:
+        pandas.Series: The combined addresses.
+    """
+    parts = {}
+    for part in ADDRESS_PARTS:
+        codes, uniques = pd.factorize(df[part])
+        uniques = pd.Series(uniques, dtype=object).astype(str).str.upper()
+        # Missing values get code -1 and map to the trailing empty string.
+        parts[part] = (codes, np.append(uniques.to_numpy(dtype=object), ""))
+
+    # Compare the prefix direction with the street name's first word through
+    # codes into a shared vocabulary, so only distinct values are split.
+    pre_codes, pre_uniques = parts["street_pre"]
+    name_codes, name_uniques = parts["streetname"]
+    first_words = pd.Series(name_uniques).str.split(" ").str[0]
+    vocabulary = pd.Index(pd.unique(np.concatenate([pre_uniques,
+                                                    first_words])))
+    pre_words = vocabulary.get_indexer(pre_uniques)[pre_codes]
+    name_words = vocabulary.get_indexer(first_words)[name_codes]
+    drop_pre = pre_words == name_words
+
+    # Collapse whitespace in each distinct value and add a trailing separator
+    # to non-empty values, so the parts can simply be concatenated.
+    address = np.full(len(df), "", dtype=object)
+    for part in ADDRESS_PARTS:
+        codes, uniques = parts[part]
+        words = np.array([" ".join(value.split()) for value in uniques],
+                         dtype=object)
+        words = np.where(words == "", "", words + " ")
+        values = words[codes]
+        if part == "street_pre":
+            values = np.where(drop_pre, "", values)
+        address = address + values
+
+    return pd.Series(address, index=df.index).str[:-1]
+
+
+def standardize_address(address):
+    """Standardize addresses with USPS abbreviations.
+
+    Addresses are upper-cased and stripped of punctuation, and directionals
+    and street suffixes are replaced with their USPS abbreviations where they
+    stand in the address (e.g. "123 North Main Street." becomes
+    "123 N MAIN ST"): a suffix only as the last word of the street, before
+    any post-directional and unit number, and a directional only just before
+    or after the street name. Words of the street name itself are kept, so
+    "12 NORTH ST" and "12 COURT ST" are left alone. The work is done once per
+    distinct address.
+
+    Args:
+        address (pandas.Series): Full street addresses.
+
+    Returns:
+        pandas.Series: The standardized addresses. Missing values stay
+            missing.
+    """
+    return map_distinct(address, _standardize_distinct)
+
+
+def strip_unit(address):
+    """Remove unit numbers from the end of addresses.
+
+    A unit number is a unit designator (see UNIT_DESIGNATORS) or "#" at the
+    end of the address, followed by at most one word with a digit or a single
+    letter, e.g. "12 MAIN ST APT 3B" and "12 MAIN ST #3B" both become
+    "12 MAIN ST". The work is done once per distinct address.
+
+    Args:
+        address (pandas.Series): Full street addresses.
+
+    Returns:
+        pandas.Series: The addresses without unit numbers. Missing values stay
+            missing.
+    """
+    return map_distinct(address, _strip_unit_distinct)
+
+
+def _standardize_distinct(address):
+    words = (address.astype(str)
+             .str.upper()
+             .str.replace("#", " # ", regex=False)
+             .str.replace(_PUNCTUATION, " ", regex=True)
+             .str.split())
+    # Standardizing the words of each address in one pass is much faster than
+    # a groupby over exploded words.
+    return words.map(_standardize_words)
+
+
+def _standardize_words(words):
+    # Abbreviate the directionals and suffix of one address, split into words,
+    # by their positions: [number] [pre] name... [suffix] [post] [unit].
+    start = 1 if words and words[0][:1].isdigit() else 0
+    end = len(words)
+    for i in range(end - 1, max(start, end - 3), -1):
+        # A unit designator followed by at most one word with a digit or a
+        # single letter, as in _UNIT.
+        rest = words[i + 1:]
+        if words[i] in _UNIT_WORDS and (not rest or len(rest) == 1 and (
+                len(rest[0]) == 1 or any(c.isdigit() for c in rest[0]))):
+            end = i
+            break
+    words = words.copy()
+    if end - start >= 3 and words[end - 1] in _DIRECTIONALS:
+        words[end - 1] = _DIRECTIONALS[words[end - 1]]
+        end -= 1
+    if end - start >= 2 and words[end - 1] in _SUFFIXES:
+        words[end - 1] = _SUFFIXES[words[end - 1]]
+        end -= 1
+    if end - start >= 2 and words[start] in _DIRECTIONALS:
+        words[start] = _DIRECTIONALS[words[start]]
+    return " ".join([word for word in words if word != "#"])
+
+
+# Map directionals and suffixes, including their abbreviations, to the
+# abbreviations.
+_DIRECTIONALS = {**{abbr: abbr for abbr in DIRECTIONALS.values()},
+                 **DIRECTIONALS}
+_SUFFIXES = {**{abbr: abbr for abbr in STREET_SUFFIXES.values()},
+             **STREET_SUFFIXES}
+
+# Words that start a unit number, upper-cased.
+_UNIT_WORDS = set(UNIT_DESIGNATORS) | {"#"}
+
+
+# A unit designator or "#" at the end of an address, followed by at most one
+# word with a digit or a single letter (so "5 PARKING LOT RD" is left alone).
+_UNIT = (r"(?:\s+(?:" + "|".join(UNIT_DESIGNATORS) + r")\b\.?"
+         r"(?:\s*#?\s*(?:\S*\d\S*|\S))?"
+         r"|\s*#\s*\S*)\s*$")
+
+
+def _strip_unit_distinct(address):
+    return (address.astype(str)
+            .str.replace(_UNIT, "", regex=True, case=False)
+            .str.strip())
@@ -0,0 +1,313 @@
+"""Concurrent batch geocoding with rate limiting and backoff.
+
+The Census batch geocoder takes up to 1000 addresses per request and each
+request takes tens of seconds, so geocoding a year of NFIRS one batch at a
+time is slow, while sending every batch at once gets requests rejected. The
+scheduler in this module keeps a fixed number of batches in flight, starts
+new requests no faster than a token-bucket rate limit, retries failed
+batches with exponential backoff and jitter, and stops sending requests for a
+while when too many batches fail in a row (a circuit breaker).
+
+- :func:`src.data.batch_geocoder.geocode_batches` geocodes batches of
+  addresses concurrently and reports the latency and throughput of each.
+- :class:`src.data.batch_geocoder.CensusBackend` sends batches to the Census
+  batch geocoder API.
+
+Any object with a ``geocode(df)`` method can be used as the backend, such as
+:class:`src.data.tiger_geocoder.TigerGeocoder` or a test double. ::
+
+    from src.data.batch_geocoder import CensusBackend, geocode_batches
+
+    stats = geocode_batches(batches, CensusBackend(), callback=write_result)
+
+"""
+import io
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+import requests
+from src.data.tiger_geocoder import GEOCODE_COLUMNS
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """An error for requests refused by an open circuit breaker."""
+    pass
+
+
+class TokenBucket:
+    """A thread-safe token-bucket rate limiter.
+
+    Tokens are added at `rate` per second up to `capacity`; each request
+    takes one token, waiting until one is available.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the largest burst.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens
+                                   + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+
+class CircuitBreaker:
+    """A thread-safe circuit breaker.
+
+    After `threshold` consecutive failures the circuit opens and requests are
+    refused for `reset_timeout` seconds. The first request after that is let
+    through as a trial: if it succeeds the circuit closes, otherwise it opens
+    again.
+
+    Args:
+        threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds to wait before a trial request.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_request(self):
+        """Check that a request may be sent.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Circuit open after {self._failures} consecutive "
+                    f"failures; retry in {remaining:.0f} s")
+            # Let one trial request through; it re-opens on failure.
+            self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class CensusBackend:
+    """Geocode batches with the Census batch geocoder API.
+
+    The API is described at https://geocoding.geo.census.gov/.
+
+    Args:
+        url (str): The API root.
+        benchmark (str): The address range benchmark.
+        vintage (str): The geography vintage.
+        timeout (float): Seconds to wait for a response.
+    """
+
+    def __init__(self, url="https://geocoding.geo.census.gov/geocoder",
+                 benchmark="Public_AR_Current", vintage="Current_Current",
+                 timeout=600):
+        self.url = url.rstrip("/")
+        self.benchmark = benchmark
+        self.vintage = vintage
+        self.timeout = timeout
+
+    def geocode(self, df):
+        """Geocode a batch of addresses.
+
+        Args:
+            df (pandas.DataFrame): Addresses, with columns *id*, *address*,
+                *city*, *state*, and *zip* (at most 1000 rows).
+
+        Returns:
+            pandas.DataFrame: The GEOCODE_COLUMNS, one row per address.
+
+        Raises:
+            requests.HTTPError: If the API returns an error status.
+        """
+        buffer = io.StringIO()
+        df[["id", "address", "city", "state", "zip"]].to_csv(
+            buffer, index=False, header=False)
+        response = requests.post(
+            f"{self.url}/geographies/addressbatch",
+            data={"benchmark": self.benchmark, "vintage": self.vintage},
+            files={"addressFile": ("batch.csv", buffer.getvalue())},
+            timeout=self.timeout)
+        response.raise_for_status()
+        return parse_census_response(response.text)
+
+
+def parse_census_response(text):
+    """Parse a Census batch geocoder response.
+
+    Args:
+        text (str): The CSV response.
+
+    Returns:
+        pandas.DataFrame: The GEOCODE_COLUMNS, one row per address. Addresses
+        that matched several addresses equally well are not matched and
+        have matchtype "Tie".
+    """
+    names = ["id", "address", "match", "matchtype", "parsed", "coordinates",
+             "tigerlineid", "side", "statefp", "countyfp", "tract", "block"]
+    df = pd.read_csv(io.StringIO(text), header=None, names=names, dtype=str)
+    coordinates = df.pop("coordinates").str.split(",", expand=True)
+    coordinates = coordinates.reindex(columns=[0, 1])
+    df["lon"] = pd.to_numeric(coordinates[0], errors="coerce")
+    df["lat"] = pd.to_numeric(coordinates[1], errors="coerce")
+    df.loc[df["match"] == "Tie", "matchtype"] = "Tie"
+    df["match"] = df["match"] == "Match"
+    return df[GEOCODE_COLUMNS]
+
+
+def geocode_batches(batches, backend, callback=None, max_in_flight=4,
+                    rate=1.0, burst=1, max_retries=5, base_delay=1.0,
+                    max_delay=60.0, breaker=None):
+    """Geocode batches of addresses concurrently.
+
+    Up to `max_in_flight` batches are geocoded at a time, and requests
+    (including retries) start at no more than `rate` per second. A failed
+    batch is retried up to `max_retries` times after a random delay of up to
+    ``base_delay * 2 ** attempt`` seconds (capped at `max_delay`). Requests
+    refused by the circuit breaker count as failed attempts too.
+
+    Args:
+        batches (iterable): (name, pandas.DataFrame) pairs, where each
+            DataFrame is a batch of addresses for `backend`.
+        backend: An object with a method ``geocode(df)`` returning a
+            pandas.DataFrame of results.
+        callback (callable): Function ``callback(name, result)`` called in
+            the calling thread with the results of each successful batch.
+        max_in_flight (int): Maximum number of concurrent batches.
+        rate (float): Maximum requests started per second, or None for no
+            limit.
+        burst (int): Maximum requests started at once.
+        max_retries (int): Maximum retries per batch.
+        base_delay (float): Backoff delay in seconds before the first retry.
+        max_delay (float): Maximum backoff delay in seconds.
+        breaker (CircuitBreaker): The circuit breaker (default: one that
+            opens after 5 consecutive failures for 60 s).
+
+    Returns:
+        pandas.DataFrame: One row per batch with the batch *name*, *rows*,
+        *attempts*, *latency_s* (of the successful attempt),
+        *rows_per_s*, and *error* (the last error, if the batch failed).
+    """
+    bucket = TokenBucket(rate, burst) if rate is not None else None
+    breaker = CircuitBreaker() if breaker is None else breaker
+    retry = {"max_retries": max_retries, "base_delay": base_delay,
+             "max_delay": max_delay}
+
+    def run(name, df):
+        return _geocode_batch(name, df, backend, bucket, breaker, **retry)
+
+    records = []
+    start = time.perf_counter()
+    for stats, result in _schedule(batches, run, max_in_flight):
+        records.append(stats)
+        if result is not None:
+            logger.info("%s: %d rows in %.1f s (%.0f rows/s)",
+                        stats["name"], stats["rows"], stats["latency_s"],
+                        stats["rows_per_s"])
+            if callback is not None:
+                callback(stats["name"], result)
+        else:
+            logger.error("%s failed after %d attempts: %s", stats["name"],
+                         stats["attempts"], stats["error"])
+
+    stats = pd.DataFrame(records, columns=["name", "rows", "attempts",
+                                           "latency_s", "rows_per_s", "error"])
+    elapsed = time.perf_counter() - start
+    geocoded = stats.loc[stats["error"].isna(), "rows"].sum()
+    logger.info("Geocoded %d of %d rows in %.1f s (%.0f rows/s)", geocoded,
+                stats["rows"].sum(), elapsed, geocoded / max(elapsed, 1e-9))
+    return stats
+
+
+def _geocode_batch(name, df, backend, bucket, breaker, max_retries,
+                   base_delay, max_delay):
+    """Geocode one batch, retrying with backoff (see geocode_batches)."""
+    stats = {"name": name, "rows": len(df), "attempts": 0,
+             "latency_s": None, "rows_per_s": None, "error": None}
+    for attempt in range(max_retries + 1):
+        if attempt:
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+            time.sleep(random.uniform(0, delay))
+        if bucket is not None:
+            bucket.acquire()
+        stats["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            breaker.before_request()
+            result = backend.geocode(df)
+        except CircuitOpenError as error:
+            stats["error"] = str(error)
+            continue
+        except Exception as error:
+            breaker.record_failure()
+            stats["error"] = f"{type(error).__name__}: {error}"
+            logger.warning("%s failed on attempt %d: %s", name, attempt + 1,
+                           stats["error"])
+            continue
+        breaker.record_success()
+        latency = time.perf_counter() - start
+        stats.update(latency_s=latency, rows_per_s=len(df) / latency,
+                     error=None)
+        return stats, result
+    return stats, None
+
+
+def _schedule(batches, function, max_in_flight):
+    """Apply a function to batches in threads, yielding results as they
+    finish."""
+    batches = iter(batches)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = set()
+        while True:
+            # Keep max_in_flight batches queued without reading all of them.
+            while len(pending) < max_in_flight:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.add(executor.submit(function, *batch))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,149 @@
+"""A columnar cache for large raw text files.
+
+Raw source files such as the NFIRS tables are multi-GB text files that never
+change once published, yet parsing them dominates the time it takes to read
+them. The functions in this module keep a typed Parquet copy of a source file
+in a ``.cache`` directory next to it, so later reads only need to load the
+columns they use.
+
+- :func:`src.data.cache.cached_path` returns the Parquet copy of a source
+  file, converting the source first if the copy is missing or stale.
+- :func:`src.data.cache.read_chunks` reads a Parquet copy in chunks.
+
+Cache entries are keyed by the size, modification time, and SHA256 hash of the
+source file. The size and modification time are checked on every call; the
+source is only re-hashed if one of them changed, and the entry is rebuilt
+(and the stale copy deleted) only if the hash changed too.
+
+"""
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Name of the cache directory created next to each source file.
+CACHE_DIR = ".cache"
+
+
+def file_hash(path, blocksize=2**20):
+    """Calculate the SHA256 hash of a file.
+
+    Args:
+        path (path-like): The file to hash.
+        blocksize (int): Number of bytes to read at a time.
+
+    Returns:
+        str: The hex digest.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def file_key(path, known=None):
+    """Identify the content of a file by size, modification time, and hash.
+
+    If `known` (a previous result of this function for the same file) has the
+    same size and modification time as the file on disk, its hash is reused
+    instead of re-reading the file.
+
+    Args:
+        path (path-like): The file to identify.
+        known (dict): A previous key for the same file, if any.
+
+    Returns:
+        dict: The file's ``size``, ``mtime_ns``, and ``sha256``.
+    """
+    stat = os.stat(path)
+    key = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if known and all(known.get(name) == key[name] for name in key):
+        key["sha256"] = known["sha256"]
+    else:
+        key["sha256"] = file_hash(path)
+    return key
+
+
+def cached_path(source, convert):
+    """Get the path to an up-to-date Parquet copy of a source file.
+
+    Args:
+        source (path-like): The source file.
+        convert (callable): A function ``convert(source, destination)`` that
+            writes a Parquet copy of `source` to `destination`. It is only
+            called if the cache is missing or stale.
+
+    Returns:
+        pathlib.Path: The Parquet copy.
+    """
+    source = pathlib.Path(source)
+    cache_dir = source.parent / CACHE_DIR
+    meta_path = cache_dir / f"{source.name}.json"
+
+    meta = None
+    if meta_path.exists():
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    key = file_key(source, known=meta)
+    if meta and meta["sha256"] == key["sha256"]:
+        path = cache_dir / meta["file"]
+        if path.exists():
+            if meta["mtime_ns"] != key["mtime_ns"]:
+                _write_meta(meta_path, dict(meta, **key))
+            return path
+
+    # Evict stale copies before converting the new source.
+    for path in cache_dir.glob(f"{source.name}.*.parquet"):
+        path.unlink()
+
+    cache_dir.mkdir(exist_ok=True)
+    path = cache_dir / f"{source.name}.{key['sha256'][:16]}.parquet"
+    temp_path = path.with_suffix(".tmp")
+    convert(source, temp_path)
+    os.replace(temp_path, path)
+    _write_meta(meta_path, dict(key, file=path.name))
+    return path
+
+
+def read_chunks(path, columns=None, chunksize=None):
+    """Read a Parquet file in chunks.
+
+    Args:
+        path (path-like): The Parquet file.
+        columns (list): Columns to read, or None for all columns.
+        chunksize (int): Maximum rows per chunk, or None for a single chunk.
+
+    Yields:
+        pandas.DataFrame: The chunks, with the same dtypes and missing values
+        as pandas.read_csv would give. Integer columns use pandas' nullable
+        Int64 dtype so that missing values don't turn them into floats.
+    """
+    parquet = pq.ParquetFile(path)
+    if chunksize is None:
+        yield _to_pandas(parquet.read(columns=columns))
+        return
+    for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+        yield _to_pandas(batch)
+
+
+def _to_pandas(table):
+    df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    # Arrow gives None for missing strings, where read_csv gives NaN.
+    for name in df.columns[df.dtypes == object]:
+        df[name] = df[name].where(df[name].notna(), np.nan)
+    return df
+
+
+def _write_meta(path, meta):
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(temp_path, path)
@@ -16,47 +16,49 @@ save the processed data to the default data directory. ::
 """
 import geopandas
 import pandas as pd
-import shapely
-from src import utils
-from src.data import raw
+from src import profiling, utils
+from src.data import geoids, raw
 
 
 # Path to processed fire station data.
 PATH = utils.DATA["processed"] / "fire-stations.csv"
 
 
-def process():
+@profiling.instrument("fire_stations.process")
+def process(n_jobs=4):
     """Process the raw fire stations data.
 
     This function reads raw fire station data and appends column *GEOID10*,
     which identifies the 2010 Census tract that each station belongs to. The
-    calculation occurs in three steps.
+    calculation occurs in two steps.
 
     1. Identify fire station locations from latitude and longitude.
-    2. Identify 2010 Census tract boundaries from raw shape files.
-    3. Perform a spatial left-join, matching stations to surrounding tracts.
+    2. Find the tract containing each station in a spatial index of the
+       tracts of its state, processing the states in parallel (see
+       :func:`src.data.geoids.assign_geoids`).
+
+    The tract indexes are built from GeoParquet copies of the raw shape files,
+    cached after the first run. Stations outside all tracts of their state
+    (e.g. with a wrong *STATE*) are looked up in every state. Stations on a
+    tract boundary get the tract with the smallest GEOID.
 
     The resulting pandas.DataFrame has the same row count as the raw data.
 
+    Args:
+        n_jobs (int): Number of states to process at once.
+
     Returns:
         pandas.DataFrame: Processed fire station data.
     """
     stations = raw.read_fire_stations()
-    tracts = raw.read_shapefiles()[["GEOID10", "geometry"]]
-    
-    # Create points for the lon-lat pair at each fire station.
-    geometry = calculate_points(stations.Longitude,
-                                stations.Latitude,
-                                crs=tracts.crs)
-    
-    # Append the points to the fire station data.
-    stations = geopandas.GeoDataFrame(stations, geometry=geometry)
+    stations["statefp"] = stations["STATE"].map(raw.STATES)
 
     # Find the Tract geoid for each station.
-    result = geopandas.sjoin(stations, tracts, op="within", how="left")
-
-    # Return a pandas.DataFrame without geometries.
-    return pd.DataFrame(result).drop("geometry", axis=1)
+    result = geoids.assign_geoids(stations, lon="Longitude", lat="Latitude",
+                                  n_jobs=n_jobs, level="tract",
+                                  search_all=True)
+    stations["GEOID10"] = result["tract_geoid"]
+    return stations.drop(columns="statefp")
 
 
 def read(process_if_needed=False):
@@ -95,9 +97,7 @@ def calculate_points(long, lat, *args, **kwargs):
     Returns:
         geopandas.GeoSeries: Points for the coordinates given.
     """
-    geometry = []
-    for coord in zip(long, lat):
-        geometry.append(shapely.geometry.Point(coord))
+    geometry = geopandas.points_from_xy(long, lat)
     return geopandas.GeoSeries(geometry, *args, **kwargs)
 
 
@@ -0,0 +1,319 @@
+"""Fuzzy matching of unmatched addresses against known addresses.
+
+Addresses the geocoder can't match are usually misspelled versions of
+addresses it can: "12 MAPEL AVE" for "12 MAPLE AVE", or a street type that
+was left out. This module matches them against a reference list of known
+addresses, such as the addresses matched by the geocoder in earlier years
+(see :func:`reference_from_geocodes`), in three vectorized steps.
+
+1. *Blocking*: each address gets a key per place (its ZIP code, and its city
+   and state) combined with the Soundex code of its street name, so only
+   addresses in the same place whose street names sound alike are compared.
+2. *Candidates*: the reference addresses are sorted by block key and house
+   number, and a binary search finds the `max_candidates` reference addresses
+   with the closest house numbers in each block of an address, so the
+   candidates grow with the number of addresses rather than the block sizes.
+3. *Scoring*: the street names of the candidates are compared by the cosine
+   similarity of their character n-grams, and the house numbers by their
+   distance. The best candidate's combined score is its confidence.
+
+Each distinct street name is only vectorized once and each distinct pair of
+street names is only scored once. ::
+
+    from src.data.fuzzy_match import FuzzyMatcher, reference_from_geocodes
+
+    matcher = FuzzyMatcher(reference_from_geocodes(geocodes))
+    matches = matcher.match(unmatched)
+
+:meth:`FuzzyMatcher.geocode` returns the geocoder result columns, so a
+matcher can also be used as the geocoder of
+:func:`src.data.geocode_nfirs.retry_geocodes`.
+
+"""
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from src.data.address import DIRECTIONALS, map_distinct
+from src.data.tiger_geocoder import GEOCODE_COLUMNS, parse_address
+
+
+# Soundex codes of letters; vowels and H, W, Y get code 0, which is dropped.
+_SOUNDEX = {letter: str(code) for code, letters in enumerate(
+    ["AEIOUHWY", "BFPV", "CGJKQSXZ", "DT", "L", "MN", "R"])
+    for letter in letters}
+
+# Number of street pairs scored at a time.
+_CHUNKSIZE = 200_000
+
+# Street name words skipped when choosing the word to block on.
+_SKIPPED = set(DIRECTIONALS.values()) | {"OLD", "SAINT", "ST", "MT", "FT"}
+
+
+class FuzzyMatcher:
+    """Match addresses against a reference list of known addresses.
+
+    Args:
+        reference (pandas.DataFrame): Known addresses, with columns *address*,
+            *city*, *state*, and *zip*, and any other columns to return with
+            the matches (e.g. *lat* and *lon*).
+        max_candidates (int): Maximum candidates scored per address.
+        street_weight (float): Weight of the street name score in the
+            confidence; the house number score gets the rest.
+        number_scale (float): House number distance at which the house
+            number score drops to 1/e.
+    """
+
+    def __init__(self, reference, max_candidates=20, street_weight=0.8,
+                 number_scale=50):
+        self.reference = reference.reset_index(drop=True)
+        self.max_candidates = max_candidates
+        self.street_weight = street_weight
+        self.number_scale = number_scale
+        self._vectorizer = HashingVectorizer(
+            analyzer="char_wb", ngram_range=(1, 3), n_features=2**18,
+            alternate_sign=False, norm="l2")
+        self._parsed = _parse(self.reference)
+        self._index = _block_index(self._parsed)
+        # Vectorize each distinct reference street once (the vectorizer
+        # fails on no streets, e.g. before anything was geocoded).
+        codes, streets = pd.factorize(self._parsed["street"])
+        self._street_codes = codes
+        self._street_vectors = (self._vectorizer.transform(streets)
+                                if len(streets) else None)
+
+    def match(self, df, min_confidence=0.85):
+        """Find the best reference address for each address.
+
+        Args:
+            df (pandas.DataFrame): Addresses, with columns *address*, *city*,
+                *state*, and *zip*.
+            min_confidence (float): Minimum confidence of a match.
+
+        Returns:
+            pandas.DataFrame: With the index of `df`, the position of the
+            best reference address (*reference*, -1 if there is no match),
+            its *confidence*, *street_score*, and *number_score*, the number
+            of *candidates* scored, and *match* (whether the confidence is at
+            least `min_confidence`).
+        """
+        query = _parse(df.reset_index(drop=True))
+        pairs = self._candidates(query)
+        pairs["street_score"] = self._street_scores(query["street"], pairs)
+        pairs["confidence"] = (self.street_weight * pairs["street_score"]
+                               + (1 - self.street_weight)
+                               * pairs["number_score"])
+
+        # Keep the best candidate of each address.
+        pairs = pairs.sort_values(["query", "confidence"],
+                                  ascending=[True, False], kind="stable")
+        counts = np.bincount(pairs["query"], minlength=len(query))
+        best = pairs.drop_duplicates("query").set_index("query")
+        best = best.reindex(np.arange(len(query)))
+
+        result = pd.DataFrame({
+            "reference": best["reference"].fillna(-1).astype(np.int64)
+                                                     .to_numpy(),
+            "confidence": best["confidence"].to_numpy(),
+            "street_score": best["street_score"].to_numpy(),
+            "number_score": best["number_score"].to_numpy(),
+            "candidates": counts,
+        }, index=df.index)
+        result["match"] = result["confidence"] >= min_confidence
+        result.loc[~result["match"], "reference"] = -1
+        return result
+
+    def geocode(self, df, min_confidence=0.85):
+        """Geocode addresses with the results of their best matches.
+
+        Args:
+            df (pandas.DataFrame): Addresses, with columns *id*, *address*,
+                *city*, *state*, and *zip*, as in the Census batch geocoder
+                input.
+            min_confidence (float): Minimum confidence of a match.
+
+        Returns:
+            pandas.DataFrame: The GEOCODE_COLUMNS, one row per input row,
+            with matchtype "Fuzzy" for matches. Columns missing from the
+            reference are left missing.
+        """
+        df = df.reset_index(drop=True)
+        matches = self.match(df, min_confidence)
+        matched = matches["match"].to_numpy()
+        rows = matches["reference"].to_numpy()[matched]
+        reference = self.reference.iloc[rows]
+
+        result = pd.DataFrame({
+            "id": df["id"].astype(str),
+            "address": (df["address"].astype(str) + ", "
+                        + df["city"].astype(str) + ", "
+                        + df["state"].astype(str) + ", "
+                        + df["zip"].astype(str)),
+            "match": matched,
+            "matchtype": np.where(matched, "Fuzzy", None),
+        })
+        for name in GEOCODE_COLUMNS[4:]:
+            result[name] = np.nan if name in ["lat", "lon"] else None
+        result.loc[matched, "parsed"] = reference["address"].to_numpy()
+        for name in GEOCODE_COLUMNS[5:]:
+            if name in reference.columns:
+                result.loc[matched, name] = reference[name].to_numpy()
+        return result[GEOCODE_COLUMNS]
+
+    def _candidates(self, query):
+        # Find the reference addresses with the same block keys and the
+        # closest house numbers, half below and half above each address.
+        if self._street_vectors is None:
+            return pd.DataFrame({"query": np.zeros(0, dtype=np.int64),
+                                 "reference": np.zeros(0, dtype=np.int64),
+                                 "number_score": np.zeros(0)})
+        blocks, keys, references = self._index
+        n = len(query)
+        codes = blocks.get_indexer(pd.concat([query["zip_key"],
+                                              query["city_key"]]))
+        found = codes >= 0
+        queries = np.tile(np.arange(n), 2)[found]
+        combined = _combined(codes[found],
+                             np.tile(query["number"].to_numpy(), 2)[found])
+        half = max(self.max_candidates // 2, 1)
+        positions = (np.searchsorted(keys, combined)[:, None]
+                     + np.arange(-half, half))
+        positions = np.clip(positions, 0, max(len(keys) - 1, 0))
+        same = (keys[positions] >> 32) == (combined >> 32)[:, None]
+        pairs = pd.DataFrame({
+            "query": np.broadcast_to(queries[:, None], positions.shape)[same],
+            "reference": references[positions[same]],
+        }).drop_duplicates(ignore_index=True)
+
+        numbers = query["number"].to_numpy(dtype=np.float64, na_value=np.nan)
+        reference = self._parsed["number"].to_numpy(dtype=np.float64,
+                                                    na_value=np.nan)
+        distance = np.abs(numbers[pairs["query"]]
+                          - reference[pairs["reference"]])
+        pairs["number_score"] = np.where(np.isnan(distance), 0.5,
+                                         np.exp(-distance / self.number_scale))
+        pairs = pairs.sort_values(["query", "number_score"],
+                                  ascending=[True, False], kind="stable")
+        pairs = pairs[pairs.groupby("query").cumcount() < self.max_candidates]
+        return pairs.reset_index(drop=True)
+
+    def _street_scores(self, streets, pairs):
+        # Cosine similarity of the n-grams of the streets of each pair, scored
+        # once per distinct pair of streets.
+        if not len(pairs):
+            return np.zeros(0)
+        codes, distinct = pd.factorize(streets)
+        vectors = self._vectorizer.transform(distinct)
+        left = codes[pairs["query"].to_numpy()].astype(np.int64)
+        right = self._street_codes[pairs["reference"].to_numpy()]
+        n = self._street_vectors.shape[0]
+        keys, unique = pd.factorize(left * n + right)
+        scores = np.empty(len(unique))
+        # Score in chunks to bound the memory of the sparse products.
+        for start in range(0, len(unique), _CHUNKSIZE):
+            chunk = unique[start:start + _CHUNKSIZE]
+            products = vectors[chunk // n].multiply(
+                self._street_vectors[chunk % n])
+            scores[start:start + _CHUNKSIZE] = np.asarray(
+                products.sum(axis=1)).ravel()
+        return scores[keys]
+
+
+def reference_from_geocodes(geocodes):
+    """Build a reference list from matched geocoder results.
+
+    The input address of each result is recovered from its echo in the
+    *address* column ("address, city, state, zip").
+
+    Args:
+        geocodes (pandas.DataFrame): Geocoder results with the
+            GEOCODE_COLUMNS.
+
+    Returns:
+        pandas.DataFrame: The distinct matched addresses, with columns
+        *address*, *city*, *state*, and *zip*, and the other result columns.
+    """
+    matched = geocodes[geocodes["match"].astype(bool)]
+    parts = matched["address"].str.rsplit(", ", n=3, expand=True)
+    parts = parts.reindex(columns=range(4))
+    parts.columns = ["address", "city", "state", "zip"]
+    reference = pd.concat([parts, matched.drop(columns=["id", "address",
+                                                        "match"])], axis=1)
+    return reference.drop_duplicates(["address", "city", "state", "zip"],
+                                     ignore_index=True)
+
+
+def soundex(words):
+    """Calculate the Soundex codes of words.
+
+    Args:
+        words (pandas.Series): Words. The work is done once per distinct
+            word.
+
+    Returns:
+        pandas.Series: The four-character Soundex codes (e.g. "R163" for
+            "ROBERT"). Words without letters get an empty code; missing
+            values stay missing.
+    """
+    return map_distinct(words, lambda values: values.map(_soundex))
+
+
+def _soundex(word):
+    letters = [letter for letter in str(word).upper() if letter.isalpha()]
+    if not letters:
+        return ""
+    code, last = letters[0], _SOUNDEX.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = _SOUNDEX.get(letter, "")
+        if digit not in ("", "0") and digit != last:
+            code += digit
+        # H and W don't separate letters with the same code.
+        if letter not in "HW":
+            last = digit
+    return (code + "000")[:4]
+
+
+def _block_index(parsed):
+    # Sort the reference addresses by block key and house number, each
+    # address once under each of its keys.
+    keys = pd.concat([parsed["zip_key"], parsed["city_key"]])
+    references = np.tile(np.arange(len(parsed)), 2)
+    valid = keys.notna().to_numpy()
+    codes, blocks = pd.factorize(keys[valid])
+    combined = _combined(codes, np.tile(parsed["number"].to_numpy(), 2)[valid])
+    order = np.argsort(combined, kind="stable")
+    return pd.Index(blocks), combined[order], references[valid][order]
+
+
+def _combined(codes, numbers):
+    # Block codes and house numbers (below 2**32) sort as one integer;
+    # missing house numbers sort first.
+    numbers = pd.array(numbers, dtype="Int64").fillna(0).to_numpy()
+    numbers = np.clip(numbers, 0, 2**32 - 1)
+    return (codes.astype(np.int64) << 32) + numbers
+
+
+def _parse(df):
+    # Split the addresses and build their block keys.
+    number, street = parse_address(df["address"])
+    word = map_distinct(street, _block_words)
+    phonetic = soundex(word).fillna("")
+    zipcode = df["zip"].astype("string").str.strip().str[:5]
+    zipcode = zipcode.where(zipcode.str.fullmatch(r"\d{5}").fillna(False))
+    city = (df["city"].astype("string").str.upper().str.strip() + "|"
+            + df["state"].astype("string").str.upper().str.strip())
+    has_street = (phonetic != "").to_numpy()
+    return pd.DataFrame({
+        "number": number,
+        "street": street.to_numpy(dtype=object),
+        "zip_key": (zipcode + "|" + phonetic).where(has_street),
+        "city_key": (city + "|" + phonetic).where(has_street),
+    })
+
+
+def _block_words(streets):
+    # The first word of each street name which isn't a directional or a
+    # common prefix, or the first word if all of them are.
+    words = streets.str.split()
+    return words.map(lambda words: next(
+        (word for word in words if word not in _SKIPPED),
+        words[0] if words else ""))
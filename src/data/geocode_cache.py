@@ -0,0 +1,177 @@
+"""A persistent cache of geocoded addresses.
+
+Most addresses in NFIRS show up again in later years, so geocoding each
+cleaned year from scratch repeats most of the work. This module keeps every
+geocoder response in a SQLite database, ``Data/interim/geocode_cache.sqlite``,
+keyed on the normalized address, city, state, and ZIP code, so that only
+addresses never seen before are sent to the geocoder.
+
+- :func:`src.data.geocode_cache.address_keys` normalizes addresses to keys.
+- :func:`src.data.geocode_cache.lookup` finds cached responses for keys.
+- :func:`src.data.geocode_cache.store` adds responses to the cache.
+
+Matched addresses are kept forever. Addresses the geocoder could not match
+are retried once their cached response is older than NEGATIVE_TTL_DAYS, since
+the reference data and the geocoder improve over time.
+
+Attributes:
+    NEGATIVE_TTL_DAYS (float): Age in days after which cached non-matches
+        expire.
+    RESPONSE_COLUMNS (list): The geocoder response columns stored.
+
+"""
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+from src import utils
+from src.data.address import map_distinct, standardize_address
+
+
+# Age in days after which cached non-matches expire.
+NEGATIVE_TTL_DAYS = 90
+
+
+# The geocoder response columns stored in the cache.
+RESPONSE_COLUMNS = ["match", "matchtype", "parsed", "tigerlineid", "side",
+                    "statefp", "countyfp", "tract", "block", "lat", "lon"]
+
+
+def cache_path():
+    """Get the path to the geocode cache database.
+
+    Returns:
+        pathlib.Path: The database file.
+    """
+    return utils.DATA["interim"] / "geocode_cache.sqlite"
+
+
+def connect(path=None):
+    """Open the geocode cache, creating it if needed.
+
+    Args:
+        path (path-like): The database file (default: see cache_path).
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    path = cache_path() if path is None else path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS geocodes (
+            key TEXT PRIMARY KEY,
+            match INTEGER NOT NULL,
+            matchtype TEXT,
+            parsed TEXT,
+            tigerlineid TEXT,
+            side TEXT,
+            statefp TEXT,
+            countyfp TEXT,
+            tract TEXT,
+            block TEXT,
+            lat REAL,
+            lon REAL,
+            geocoded_at REAL NOT NULL
+        )
+    """)
+    return con
+
+
+def address_keys(address, city, state, zipcode):
+    """Normalize addresses to cache keys.
+
+    The street address is standardized with USPS abbreviations (see
+    :func:`src.data.address.standardize_address`), the city and state are
+    upper-cased with whitespace collapsed, and the ZIP code is cut to five
+    digits. Each column is normalized once per distinct value.
+
+    Args:
+        address (pandas.Series): Street addresses.
+        city (pandas.Series): Cities.
+        state (pandas.Series): State abbreviations.
+        zipcode (pandas.Series): ZIP codes.
+
+    Returns:
+        pandas.Series: Keys of the form "ADDRESS|CITY|STATE|ZIP".
+    """
+    parts = [
+        standardize_address(address),
+        map_distinct(city, _normalize_text),
+        map_distinct(state, _normalize_text),
+        map_distinct(zipcode, lambda values: values.astype(str).str.strip()
+                     .str[:5]),
+    ]
+    keys = parts[0].fillna("")
+    for part in parts[1:]:
+        keys = keys + "|" + part.fillna("")
+    return keys
+
+
+def lookup(keys, ttl_days=NEGATIVE_TTL_DAYS, path=None):
+    """Find the cached geocoder responses for keys.
+
+    Args:
+        keys (pandas.Series): Cache keys (see address_keys).
+        ttl_days (float): Age in days after which non-matches expire.
+        path (path-like): The database file (default: see cache_path).
+
+    Returns:
+        pandas.DataFrame: The RESPONSE_COLUMNS for the keys found in the
+        cache, indexed like `keys`. Keys that are missing or expired are
+        left out.
+    """
+    expires = time.time() - ttl_days * 86400
+    with connect(path) as con:
+        con.execute("CREATE TEMP TABLE lookup (key TEXT PRIMARY KEY)")
+        con.executemany("INSERT INTO lookup VALUES (?)",
+                        ((key,) for key in pd.unique(keys)))
+        found = pd.read_sql_query(
+            f"""SELECT g.key, {', '.join('g.' + c for c in RESPONSE_COLUMNS)}
+            FROM lookup l JOIN geocodes g ON g.key = l.key
+            WHERE g.match = 1 OR g.geocoded_at >= ?""",
+            con, params=(expires,))
+    con.close()
+
+    found["match"] = found["match"].astype(bool)
+    found = found.set_index("key")
+    hits = keys[keys.isin(found.index)]
+    result = found.loc[hits.to_numpy()]
+    result.index = hits.index
+    return result
+
+
+def store(keys, responses, path=None):
+    """Add geocoder responses to the cache.
+
+    Existing entries for the same keys are replaced.
+
+    Args:
+        keys (pandas.Series): Cache keys (see address_keys).
+        responses (pandas.DataFrame): Geocoder responses with the
+            RESPONSE_COLUMNS, aligned with `keys`.
+        path (path-like): The database file (default: see cache_path).
+
+    Returns:
+        int: The number of entries written.
+    """
+    df = responses[RESPONSE_COLUMNS].copy()
+    df.insert(0, "key", np.asarray(keys))
+    df["match"] = df["match"].fillna(False).astype(bool).astype(int)
+    df["geocoded_at"] = time.time()
+    df = df.drop_duplicates("key", keep="last")
+    # Missing values are stored as NULL.
+    df = df.astype(object).where(df.notna(), None)
+
+    placeholders = ", ".join("?" * len(df.columns))
+    with connect(path) as con:
+        con.executemany(
+            f"INSERT OR REPLACE INTO geocodes VALUES ({placeholders})",
+            df.itertuples(index=False, name=None))
+    con.close()
+    return len(df)
+
+
+def _normalize_text(values):
+    return values.astype(str).str.upper().str.split().str.join(" ")
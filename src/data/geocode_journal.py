@@ -0,0 +1,180 @@
+"""A per-address status journal for geocoding runs.
+
+Geocoding a year of NFIRS addresses takes hours, so a run must be able to
+stop at any point and resume without repeating work, and addresses the
+geocoder could not match are worth a second, cheaper pass with a different
+form of the address. This module records the status of every distinct address
+of a run in a SQLite database:
+
+- ``"pending"``: not geocoded yet,
+- ``"matched"``: matched by the geocoder,
+- ``"tie"``: matched several addresses equally well,
+- ``"no_match"``: not matched, and
+- ``"error"``: its batch failed.
+
+Along with the status, the journal keeps the number of attempts, the address
+forms tried (see :data:`src.data.geocode_nfirs.ADDRESS_FORMS`), the last
+error, and the result part file that holds the address's current result.
+Each update is a single transaction, made after the part file it refers to is
+written, so the journal never points at missing results. ::
+
+    from src.data.geocode_journal import GeocodeJournal
+
+    journal = GeocodeJournal(path)
+    journal.add(address_ids)
+    todo = journal.select(["pending", "error"])
+
+Attributes:
+    STATUSES (list): The address statuses, from least to most resolved.
+
+"""
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# Address statuses, from least to most resolved.
+STATUSES = ["pending", "error", "no_match", "tie", "matched"]
+
+
+class GeocodeJournal:
+    """The status journal of a geocoding run.
+
+    Args:
+        path (path-like): The database file, created if needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.con = sqlite3.connect(path)
+        with self.con:
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS addresses (
+                    address_id INTEGER PRIMARY KEY,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    forms TEXT NOT NULL DEFAULT ',',
+                    part TEXT,
+                    error TEXT,
+                    updated_at REAL
+                )
+            """)
+
+    def close(self):
+        self.con.close()
+
+    def add(self, address_ids):
+        """Add addresses as pending, leaving known addresses unchanged.
+
+        Args:
+            address_ids (array-like): Integer address ids.
+        """
+        with self.con:
+            self.con.executemany(
+                "INSERT OR IGNORE INTO addresses (address_id) VALUES (?)",
+                ((int(i),) for i in address_ids))
+
+    def select(self, statuses, form=None):
+        """Find the addresses with some statuses.
+
+        Args:
+            statuses (list): The statuses (see STATUSES).
+            form (str): If given, skip addresses already tried in this form.
+
+        Returns:
+            numpy.ndarray: The sorted address ids.
+        """
+        query = (f"SELECT address_id FROM addresses WHERE status IN "
+                 f"({', '.join('?' * len(statuses))})")
+        params = list(statuses)
+        if form is not None:
+            query += " AND instr(forms, ?) = 0"
+            params.append(f",{form},")
+        rows = self.con.execute(query + " ORDER BY address_id", params)
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def record(self, address_ids, statuses, form, part=None, error=None,
+               only_improve=False):
+        """Record an attempt to geocode addresses.
+
+        Args:
+            address_ids (array-like): Integer address ids.
+            statuses (array-like): The new status of each address.
+            form (str): The address form tried.
+            part (str): The result part file with the new results, if any.
+            error (str): The error, for failed attempts. Failed attempts
+                don't count as tries of the form (see select).
+            only_improve (bool): Keep the status and part of addresses whose
+                new status is less resolved than their current one (e.g. a
+                retry that matched nothing); their attempt is still counted.
+        """
+        address_ids = [int(i) for i in address_ids]
+        statuses = np.broadcast_to(np.asarray(statuses, dtype=object),
+                                   len(address_ids))
+        now = time.time()
+        with self.con:
+            if only_improve:
+                current = self.statuses(address_ids)
+                rank = {status: i for i, status in enumerate(STATUSES)}
+                improved = [rank[new] > rank[old]
+                            for new, old in zip(statuses, current)]
+            else:
+                improved = [True] * len(address_ids)
+            self.con.executemany(
+                """UPDATE addresses SET
+                       status = CASE WHEN ? THEN ? ELSE status END,
+                       part = CASE WHEN ? AND ? IS NOT NULL THEN ?
+                                   ELSE part END,
+                       error = ?,
+                       attempts = attempts + 1,
+                       forms = CASE WHEN ? IS NULL AND instr(forms, ?) = 0
+                                    THEN forms || ? ELSE forms END,
+                       updated_at = ?
+                   WHERE address_id = ?""",
+                ((better, status, better, part, part, error, error,
+                  f",{form},", f"{form},", now, address_id)
+                 for address_id, status, better
+                 in zip(address_ids, statuses, improved)))
+
+    def statuses(self, address_ids):
+        """Get the current status of addresses.
+
+        Args:
+            address_ids (array-like): Integer address ids.
+
+        Returns:
+            list: The status of each address, or None for unknown addresses.
+        """
+        address_ids = [int(i) for i in address_ids]
+        known = {}
+        # Stay below SQLite's limit on query parameters.
+        for start in range(0, len(address_ids), 900):
+            chunk = address_ids[start:start + 900]
+            known.update(self.con.execute(
+                f"SELECT address_id, status FROM addresses WHERE address_id "
+                f"IN ({', '.join('?' * len(chunk))})", chunk))
+        return [known.get(i) for i in address_ids]
+
+    def parts(self):
+        """Get the result part file of each address with results.
+
+        Returns:
+            pandas.DataFrame: Columns *address_id* and *part*.
+        """
+        return pd.read_sql_query(
+            "SELECT address_id, part FROM addresses WHERE part IS NOT NULL "
+            "ORDER BY address_id", self.con)
+
+    def counts(self):
+        """Count the addresses with each status.
+
+        Returns:
+            pandas.Series: The number of addresses with each status, indexed
+            by STATUSES.
+        """
+        counts = dict(self.con.execute(
+            "SELECT status, COUNT(*) FROM addresses GROUP BY status"))
+        return pd.Series({status: counts.get(status, 0)
+                          for status in STATUSES})
@@ -1,190 +1,508 @@
 """
 Functions and script to geocode nfirs data.
+
+Geocoding a year streams batches of distinct addresses from the cleaned nfirs data to
+the geocoder and collects the results in memory. Every few batches the results are
+committed to a parquet part file in ``Data/interim/nfirs/temp_{year}/results`` and the
+status of each address is updated in a journal (see src.data.geocode_journal), so a
+crashed or interrupted run resumes where it stopped when it is started again. Second
+passes (retry_geocodes) send only the unmatched addresses to the geocoder again, in
+another form (see address_form).
+
+Once every address is geocoded, consolidate_geocodes reads the parts in parallel and fans
+the results out to the rows of the cleaned data, and write_geocodes saves them as a
+parquet dataset partitioned by state (see src.data.interim.read_geocoded_nfirs).
 """
 
 
+import argparse
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-import os
-from src import utils
-from src.data.interim import read_cleaned_nfirs
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src import profiling, utils
+from src.data import batch_geocoder, geocode_cache
+from src.data.address import standardize_address, strip_unit
+from src.data.geocode_journal import GeocodeJournal
+from src.data.interim import (GEOCODE_COLUMNS, geocoded_nfirs_path,
+                              read_cleaned_nfirs)
+from src.data.tiger_geocoder import TigerGeocoder
+
+
+# Data types of the geocoder results
+GEOCODE_DTYPES = {'id':'str','address':'str','match':'bool','matchtype': 'str','parsed': 'str',
+                  'tigerlineid': 'str','side': 'str','statefp': 'str','countyfp': 'str','tract': 'str',
+                  'block': 'str','lat': 'float64','lon': 'float64'}
 
-import pathlib
-from datetime import datetime, timedelta
-from time import sleep
+# Address forms tried by retry_geocodes, and the retry passes of geocode_all_uncoded_nfirs
+ADDRESS_FORMS = ['original', 'no_apartment', 'street_types', 'no_zip']
+RETRY_FORMS = ['no_apartment', 'street_types', 'no_zip']
 
-import censusgeocode as cg
+# Arrow schema of the result parts and the geocoded dataset
+GEOCODE_SCHEMA = pa.schema([(name, pa.string() if dtype == 'str' else pa.from_numpy_dtype(np.dtype(dtype)))
+                            for name, dtype in GEOCODE_DTYPES.items()])
+
+
+def temp_dir(year):
+    """Get the directory with the intermediate geocoding files of a year.
+
+    Args:
+        year: int, year of nfirs data
+
+    Returns:
+        pathlib.Path to the directory
+    """
+
+    return utils.DATA['interim'] / 'nfirs' / f'temp_{year}'
+
+def distinct_addresses(df):
+    """Find the distinct addresses of nfirs rows.
+
+    Rows are grouped by their normalized address, city, state, and zip (see
+    src.data.geocode_cache.address_keys), and each distinct address gets an integer id.
 
-def create_nfirs_temp(df, year, nrows = 1000):
-    """Create the temp directory and the input files to be passed to the 
-    geocoder. If the temp directory already exists, it will raise an exception, telling you
-    to delete the temp folder. NOTE: The temp folder isn't deleted automatically to reduce
-    risk of user error. It must be manually deleted.
-    
     Args:
         df: pandas dataframe containing nfirs data to be geocoded
-        nrows: int number of rows per input file to use (must be <= 1000)
-        
+
     Returns:
-        None
+        addresses: pandas dataframe with one row per distinct address, indexed by address
+            id, with columns id (the address id), address, city, state, zip, and key
+            (the geocode cache key)
+        address_ids: numpy array with the address id of each row of df
     """
-    
-    assert nrows <= 1000, "Max number of rows is 1000 (larger values tend to result in timeout errors with Census API)"
-    
-    # Directory paths
-    nfirs_interim = utils.DATA['interim'] / 'nfirs'
-    temp_input = nfirs_interim / f'temp_{year}' / 'input'
-    temp_output = nfirs_interim / f'temp_{year}' / 'output'
-    
-    if os.path.exists(temp_input):
-        raise Exception(f'Error, temp_{year} folder already exists. Delete folder before running this function.')
+
+    keys = geocode_cache.address_keys(df['address'], df['city'], df['state_id'], df['zip5'])
+    address_ids, unique_keys = pd.factorize(keys)
+    first_rows = np.unique(address_ids, return_index=True)[1]
+    addresses = pd.DataFrame({
+        'id': np.arange(len(unique_keys)),
+        'address': df['address'].to_numpy()[first_rows],
+        'city': df['city'].to_numpy()[first_rows],
+        'state': df['state_id'].to_numpy()[first_rows],
+        'zip': df['zip5'].to_numpy()[first_rows],
+        'key': unique_keys,
+    })
+    return addresses, address_ids
+
+def open_journal(year):
+    """Open the status journal of the geocoding run of a year.
+
+    Args:
+        year: int, year of nfirs data
+
+    Returns:
+        src.data.geocode_journal.GeocodeJournal, with one entry per distinct address
+    """
+
+    os.makedirs(temp_dir(year), exist_ok=True)
+    return GeocodeJournal(temp_dir(year) / 'journal.sqlite')
+
+def address_form(addresses, form):
+    """Rewrite addresses in one of the ADDRESS_FORMS.
+
+    Args:
+        addresses: pandas dataframe, geocoder input with columns address, city, state, zip
+        form: str, one of ADDRESS_FORMS: 'original' (unchanged), 'no_apartment' (unit
+            numbers typed into the address removed, see src.data.address.strip_unit;
+            apt_no is a separate nfirs column which is never part of the geocoder
+            input, so there is nothing to remove for it), 'street_types' (street types
+            and directionals abbreviated, see src.data.address.standardize_address), or
+            'no_zip' (zip code removed)
+
+    Returns:
+        addresses: pandas dataframe, the rewritten addresses
+    """
+
+    addresses = addresses.copy()
+    if form == 'no_apartment':
+        addresses['address'] = strip_unit(addresses['address'])
+    elif form == 'street_types':
+        addresses['address'] = standardize_address(addresses['address'])
+    elif form == 'no_zip':
+        addresses['zip'] = ''
+    elif form != 'original':
+        raise ValueError(f'Unknown address form {form}, expected one of {ADDRESS_FORMS}')
+    return addresses
+
+def geocode_nfirs(df, year, geocoder=None, use_cache=True, batch_size=1000, flush_rows=50_000,
+                  max_in_flight=4, rate=1.0):
+    """Geocode one year of cleaned nfirs data.
+
+    The distinct addresses of the data (see distinct_addresses) are split into batches
+    of batch_size addresses and streamed to the geocoder, several at a time, with a rate
+    limit, retries with exponential backoff, and a circuit breaker (see
+    src.data.batch_geocoder). Uses the census geocoder api, described at
+    https://geocoding.geo.census.gov/, unless a local geocoder is given (see
+    src.data.tiger_geocoder).
+
+    If use_cache is True, addresses found in the geocode cache (see src.data.geocode_cache)
+    are not sent to the geocoder, and new results are added to the cache.
+
+    Results are committed to parquet part files about every flush_rows addresses, and
+    the status of each address (see src.data.geocode_journal) is updated in the same
+    step. Addresses already geocoded by an earlier call for the same data are skipped, so
+    an interrupted run resumes where it stopped. Addresses in batches that fail get the
+    status 'error' and are retried by the next call. Use retry_geocodes for second passes
+    over unmatched addresses, and consolidate_geocodes to combine the results.
+
+    Args:
+        df: pandas dataframe containing nfirs data to be geocoded
+        year: int, year of nfirs data
+        geocoder: backend with a geocode(df) method to use instead of the census
+            geocoder api (e.g. a TigerGeocoder), or None
+        use_cache: bool, use and update the geocode cache
+        batch_size: int, number of addresses per geocoder request (must be <= 1000)
+        flush_rows: int, number of addresses to collect before committing a part
+        max_in_flight: int, maximum number of batches geocoded at once
+        rate: float, maximum geocoder requests started per second
+
+    Returns:
+        dict with the number of rows, distinct addresses, cached addresses, geocoded
+        addresses, failed batches, the reduction in geocoded addresses from geocoding
+        distinct addresses only, and the number of addresses with each status
+    """
+
+    directory = temp_dir(year)
+    index_path = directory / 'address_index.parquet'
+
+    df = df[['address','city','state_id','zip5']].reset_index()
+    addresses, address_ids = distinct_addresses(df)
+    address_index = pd.DataFrame({'id': df['index'].astype(str), 'address_id': address_ids})
+
+    # Start over if the data changed since the last run
+    if os.path.exists(index_path) and not pd.read_parquet(index_path).equals(address_index):
+        print(f'nfirs {year} data changed, discarding earlier geocoding results.')
+        shutil.rmtree(directory)
+    os.makedirs(directory / 'results', exist_ok=True)
+    address_index.to_parquet(index_path, index=False)
+    addresses.to_parquet(directory / 'addresses.parquet', index=False)
+
+    summary = {'rows': len(df), 'distinct': len(addresses)}
+    summary['reduction'] = 1 - len(addresses) / max(len(df), 1)
+    print(f"{summary['distinct']} distinct addresses in {summary['rows']} rows "
+          f"({summary['reduction']:.1%} reduction)")
+
+    journal = open_journal(year)
+    try:
+        journal.add(addresses['id'])
+        todo = journal.select(['pending', 'error'])
+        if len(todo) < len(addresses):
+            print(f'Resuming: {len(addresses) - len(todo)} of {len(addresses)} addresses already geocoded.')
+        summary.update(_geocode_pass(addresses.loc[todo], year, journal, 'original', geocoder,
+                                     use_cache, batch_size, flush_rows, max_in_flight, rate))
+        summary['statuses'] = journal.counts().to_dict()
+    finally:
+        journal.close()
+    return summary
+
+def retry_geocodes(year, form, statuses=('no_match', 'tie'), geocoder=None, use_cache=True,
+                   batch_size=1000, flush_rows=50_000, max_in_flight=4, rate=1.0):
+    """Geocode the unmatched addresses of a year again in another form.
+
+    Only addresses with the given statuses which haven't been tried in this form yet are
+    geocoded (see address_form). Their status and result are replaced only if the new
+    status is better (e.g. a no_match that now matches); the form is recorded either way,
+    so running the same pass again does nothing. Must be called after geocode_nfirs.
+    Cached non-matches are ignored, so addresses whose cache key doesn't change with the
+    form are sent to the geocoder again.
+
+    Args:
+        year: int, year of nfirs data
+        form: str, one of ADDRESS_FORMS
+        statuses: list of str, statuses of the addresses to retry (see
+            src.data.geocode_journal.STATUSES)
+        geocoder, use_cache, batch_size, flush_rows, max_in_flight, rate: see geocode_nfirs
+
+    Returns:
+        dict with the form, the number of addresses retried, cached addresses, geocoded
+        addresses, failed batches, and newly matched addresses
+    """
+
+    addresses = pd.read_parquet(temp_dir(year) / 'addresses.parquet')
+    journal = open_journal(year)
+    try:
+        todo = journal.select(statuses, form=form)
+        matched = journal.counts()['matched']
+        retry = address_form(addresses.loc[todo], form)
+        retry['key'] = geocode_cache.address_keys(retry['address'], retry['city'], retry['state'], retry['zip'])
+        summary = {'form': form, 'addresses': len(todo)}
+        print(f'Retrying {len(todo)} addresses in form {form}')
+        summary.update(_geocode_pass(retry, year, journal, form, geocoder, use_cache,
+                                     batch_size, flush_rows, max_in_flight, rate))
+        summary['matched'] = int(journal.counts()['matched'] - matched)
+    finally:
+        journal.close()
+    print(f"{summary['matched']} more addresses matched in form {form}.")
+    return summary
+
+def _geocode_pass(addresses, year, journal, form, geocoder, use_cache, batch_size, flush_rows,
+                  max_in_flight, rate):
+    # Geocode addresses in one form, committing their results and statuses together
+    assert batch_size <= 1000, "Max batch size is 1000 (larger values tend to result in timeout errors with Census API)"
+
+    results_dir = temp_dir(year) / 'results'
+    summary = {'cached': 0, 'geocoded': 0, 'failed_batches': 0}
+
+    # Remove parts that were never recorded, and number new parts after the others
+    parts = set(journal.parts()['part'])
+    for path in results_dir.glob('part-*.parquet'):
+        if path.name not in parts:
+            path.unlink()
+    numbers = [int(part[5:-8]) for part in parts]
+    next_part = iter(range(max(numbers, default=-1) + 1, 2**31))
+
+    # Look up the cache once for all addresses
+    if use_cache:
+        hits = geocode_cache.lookup(addresses['key'])
+        if form != 'original':
+            hits = hits[hits['match']]
+        hits.insert(0, 'id', addresses.loc[hits.index, 'id'])
+        hits.insert(1, 'address', _echo_address(addresses.loc[hits.index]))
+        summary['cached'] = len(hits)
+        print(f'{len(hits)} of {len(addresses)} addresses found in the geocode cache')
     else:
-        os.makedirs(temp_input)
-        os.makedirs(temp_output)
-        
-    # Subset nfirs columns to use
-    usecols = ['address','city','state_id','zip5']
-    df = df[usecols]
-    df = df.reset_index()
-
-    # split into blocks of length defined by nrows argument
-    nrow = len(df.index)
-    file_num = 1
-    cur_row = 0
-
-    while cur_row <= nrow -1:
-        temp_df = df.iloc[cur_row:cur_row + nrows - 1, :].copy()
-        filename = os.path.join(temp_input, f'nfirs_{year}_part_{file_num:04}.csv')
-        temp_df.to_csv(filename, index=False, header=False)
-        file_num += 1
-        cur_row += nrows
-    max_file = file_num - 1
-    print('files 1 to {0} created'.format(max_file))
-    
-    return
+        hits = pd.DataFrame(columns=GEOCODE_COLUMNS)
+    batch_numbers = pd.Series(np.arange(len(addresses)) // batch_size, index=addresses.index)
+    hit_batches = dict(list(hits.groupby(batch_numbers.loc[hits.index])))
+    misses = addresses[~addresses.index.isin(hits.index)]
+    miss_batches = dict(list(misses.groupby(batch_numbers.loc[misses.index])))
+
+    buffer = []
+    def commit():
+        if not buffer:
+            return
+        part = f'part-{next(next_part):06d}.parquet'
+        results = _typed(pd.concat([result for _, result in buffer], ignore_index=True))
+        results.to_parquet(results_dir / f'{part}.tmp', index=False)
+        os.replace(results_dir / f'{part}.tmp', results_dir / part)
+        journal.record(results['id'].astype(int), _statuses(results), form, part,
+                       only_improve=form != 'original')
+        buffer.clear()
+
+    def collect(batch, results):
+        if batch in hit_batches:
+            results = pd.concat([hit_batches[batch], results], ignore_index=True)
+        buffer.append((batch, results))
+        if sum(len(result) for _, result in buffer) >= flush_rows:
+            commit()
+
+    def batches():
+        for batch in range(-(-len(addresses) // batch_size)):
+            if batch in miss_batches:
+                yield batch, miss_batches[batch]
+            else:
+                # Fully cached batches need no geocoding
+                collect(batch, pd.DataFrame(columns=GEOCODE_COLUMNS))
+
+    def on_result(batch, results):
+        if use_cache:
+            cache_results(miss_batches[batch], results)
+        summary['geocoded'] += len(results)
+        collect(batch, results)
+
+    backend = batch_geocoder.CensusBackend() if geocoder is None else geocoder
+    # Local geocoders need no rate limit
+    if geocoder is not None:
+        rate = None
+    stats = batch_geocoder.geocode_batches(batches(), backend, callback=on_result,
+                                           max_in_flight=max_in_flight, rate=rate)
+    commit()
 
-def geocode_nfirs(year):
-    """Geocode files within temp directory (created with create_nfirs_temp function).
-    Writes output geocoded files to temp_output folder.
-    Uses censusgeocode library to access the census geocoder api, described at
-    https://geocoding.geo.census.gov/ 
+    # Record the failed batches, keeping the cached results of their addresses
+    for batch, error in stats.loc[stats['error'].notna(), ['name', 'error']].itertuples(index=False):
+        journal.record(miss_batches[batch]['id'], 'error', form, error=error, only_improve=True)
+        if batch in hit_batches:
+            collect(batch, pd.DataFrame(columns=GEOCODE_COLUMNS))
+    commit()
+
+    summary['failed_batches'] = int(stats['error'].notna().sum())
+    print(f"\n\nFinished geocoding. {summary['geocoded']} addresses geocoded, "
+          f"{summary['failed_batches']} batches failed.")
+    if len(stats):
+        print(f"Median latency {stats['latency_s'].median():.1f} s, "
+              f"throughput {stats['rows_per_s'].median():.0f} rows/s per batch.\n")
+    return summary
+
+def cache_results(inputs, results):
+    """Add geocoder results to the geocode cache.
 
     Args:
-        year: int, year to consolidate
-        
+        inputs: pandas dataframe, geocoder input with columns id, address, city, state, zip
+        results: pandas dataframe, geocoder results with an id column
+
     Returns:
         None
     """
-    
-    # Directory paths
-    nfirs_interim = utils.DATA['interim'] / 'nfirs'
-    temp_input = nfirs_interim / f'temp_{year}' / 'input'
-    temp_output = nfirs_interim / f'temp_{year}' / 'output'
-
-    # Start and current time
-    start_time = datetime.now()
-    cur_time = datetime.now()
-
-    # Geocode the files
-    for filename in os.listdir(temp_input):
-        
-        input_path = os.path.join(temp_input, filename)
-        output_path = os.path.join(temp_output, f'{filename[:-4]}_output.csv')
-                
-        if os.path.exists(output_path):
-            print(f'{filename} already geocoded.')
-            continue
 
-        #Try up to 10 attempts to geocode file. Sometimes the connection to Census API will
-        #time out and cause the particular file to fail to be geocoded on that attempt.
-        for attempt in range(10):
-            try:
-                # Sleep random amount to keep from being banned from geocoder api
-                sleep(np.random.randint(1,5))
-
-                # Print time info
-                cur_time = datetime.now()
-                print('\nCurrent time:',cur_time.strftime('%H:%M:%S'))
-                print(f'Geocoding: {filename}')
-
-                # Geocode file
-                results = pd.DataFrame(cg.addressbatch(input_path)).sort_values('id')
-                results.to_csv(output_path, index = False)
-
-                # Print time info
-                step_time = (datetime.now() - cur_time).total_seconds() / 60
-                total_time = (datetime.now() - start_time).total_seconds() / 60
-                print(f'Step time elapsed: {step_time:.02f} minutes')
-                print(f'Total time elapsed: {total_time:.02f} minutes')
-
-                break
-            except:
-                print(f'Failed on try {attempt}')
-                continue
-    
-    print('\n\nFinished geocoding.\n')
+    results = results.astype({'id': str}).set_index('id').reindex(inputs['id'].astype(str))
+    results = results[results['match'].notna()]
+    inputs = inputs.set_index(inputs['id'].astype(str)).loc[results.index]
+    keys = geocode_cache.address_keys(inputs['address'], inputs['city'], inputs['state'], inputs['zip'])
+    geocode_cache.store(keys, results)
     return
 
-def consolidate_geocodes(year):
+def consolidate_geocodes(year, n_jobs=4):
     """Consolidate geocoded records.
-    
+
+    The result parts recorded in the journal are read in parallel with the fixed
+    GEOCODE_SCHEMA (so parts where a column is all missing don't change its type) and
+    concatenated once, keeping the current result of each distinct address (see
+    retry_geocodes). Their results are fanned back out to the
+    rows of the cleaned nfirs data with the address ids saved by geocode_nfirs, so the id
+    column refers to the cleaned data again.
+
     Args:
         year: int, year to consolidate
-        
+        n_jobs: int, number of parts to read at once
+
     Returns:
         geocodes: pandas dataframe, contains geocoded nfirs addresses
     """
-    
-    # Directory paths
-    nfirs_interim = utils.DATA['interim'] / 'nfirs'
-    temp_input = nfirs_interim / f'temp_{year}' / 'input'
-    temp_output = nfirs_interim / f'temp_{year}' / 'output'
-
-    # Data types to read in
-    dtypes = {'id':'str','address':'str','match':'bool','matchtype': 'str','parsed': 'str',
-             'tigerlineid': 'str','side': 'str','statefp': 'str','countyfp': 'str','tract': 'str','block': 'str',
-             'lat': 'float64','lon': 'float64'}
-    
-    geocodes = pd.DataFrame()
-
-    # Read in all individual geocoded files and join together
-    for filename in os.listdir(temp_output):
-        input_path = os.path.join(temp_output,filename)
-        df_temp = pd.read_csv(input_path, dtype = dtypes)
-        geocodes = geocodes.append(df_temp)
-        
+
+    directory = temp_dir(year)
+    journal = open_journal(year)
+    try:
+        parts = journal.parts()
+    finally:
+        journal.close()
+
+    # Read in all result parts and join together, keeping each address's current result
+    names = parts['part'].unique()
+    read = lambda part: pq.read_table(directory / 'results' / part, schema=GEOCODE_SCHEMA)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        tables = list(executor.map(read, names))
+    geocodes = pa.concat_tables(tables) if tables else GEOCODE_SCHEMA.empty_table()
+    geocodes = geocodes.to_pandas()
+    row_parts = np.repeat(np.arange(len(tables)), [len(table) for table in tables])
+    current = pd.Series(pd.Index(names).get_indexer(parts['part']), index=parts['address_id'])
+    geocodes = geocodes[current.reindex(geocodes['id'].astype(int)).to_numpy() == row_parts]
+
+    # Broadcast the result of each distinct address to its rows
+    address_index = pd.read_parquet(directory / 'address_index.parquet')
+    positions = np.full(len(address_index), -1)
+    positions[geocodes['id'].astype(int)] = np.arange(len(geocodes))
+    positions = positions[address_index['address_id']]
+    found = positions >= 0
+    geocodes = geocodes.iloc[positions[found]].reset_index(drop=True)
+    geocodes['id'] = address_index['id'].to_numpy()[found]
+
     return(geocodes)
 
-def geocode_all_uncoded_nfirs():
+def write_geocodes(geocodes, year):
+    """Write geocoded records as a parquet dataset partitioned by state.
+
+    Each state's geocodes are written to their own statefp=XX directory, so one state can
+    be read without loading the rest (see src.data.interim.read_geocoded_nfirs).
+    Addresses without a state fips code (no match) go to the
+    statefp=__HIVE_DEFAULT_PARTITION__ directory. A summary with the number of rows,
+    matched rows, and match rate of each state is written to _summary.csv in the
+    dataset directory. The dataset is written to a temporary directory first and then
+    moved into place, replacing an earlier dataset for the year.
+
+    Args:
+        geocodes: pandas dataframe, geocoded nfirs addresses (see consolidate_geocodes)
+        year: int, year of nfirs data
+
+    Returns:
+        summary: pandas dataframe indexed by statefp with columns rows, matched, and
+        match_rate, with a 'total' row at the end
+    """
+
+    path = geocoded_nfirs_path(year)
+    temp_path = path.with_name(path.name + '.tmp')
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+
+    geocodes = _typed(geocodes)
+    table = pa.Table.from_pandas(geocodes, schema=GEOCODE_SCHEMA, preserve_index=False)
+    pq.write_to_dataset(table, temp_path, partition_cols=['statefp'])
+
+    summary = geocodes.groupby('statefp', dropna=False)['match'].agg(rows='size', matched='sum')
+    summary.loc['total'] = summary.sum()
+    summary['match_rate'] = summary['matched'] / summary['rows']
+    summary.to_csv(temp_path / '_summary.csv', index_label='statefp')
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(temp_path, path)
+    return(summary)
+
+def _typed(results):
+    # Cast the results to GEOCODE_DTYPES, keeping missing strings missing
+    results = results[GEOCODE_COLUMNS].copy()
+    for name, dtype in GEOCODE_DTYPES.items():
+        if dtype == 'str':
+            values = results[name]
+            results[name] = values.where(values.isna(), values.astype(str)).astype(object)
+    results['match'] = results['match'].fillna(False).astype(bool)
+    return results.astype({'lat': 'float64', 'lon': 'float64'})
+
+def _statuses(results):
+    # The journal status of each geocoder result
+    return np.select([results['match'].astype(bool), results['matchtype'] == 'Tie'],
+                     ['matched', 'tie'], 'no_match')
+
+def _echo_address(addresses):
+    # The geocoder echoes each input address as "address, city, state, zip"
+    return (addresses['address'].astype(str) + ', ' + addresses['city'].astype(str) + ', '
+            + addresses['state'].astype(str) + ', ' + addresses['zip'].astype(str))
+
+@profiling.instrument('geocode.geocode_all_uncoded_nfirs')
+def geocode_all_uncoded_nfirs(offline=False, retry_forms=RETRY_FORMS):
     """Geocode all nfirs data which hasn't already been geocoded, and write those
-    files to the interim folder.
-    
+    datasets to the interim folder (see write_geocodes).
+
+    After the first pass over each year, the addresses without a match are retried in
+    each of retry_forms (see retry_geocodes). A year is written only once all of its
+    batches are geocoded; the intermediate files are then removed. Years with failed
+    batches keep their intermediate files and journal, and resume on the next call.
+
     Args:
-        None
-        
+        offline: bool, geocode locally with the TIGER/Line shapefiles in
+            utils.DATA['shapefiles-tiger'] instead of the census geocoder api
+        retry_forms: list of str, address forms of the retry passes (see ADDRESS_FORMS)
+
     Returns:
         None
     """
-    
+
     nfirs_interim = utils.DATA['interim'] / 'nfirs'
-    
+    geocoder = TigerGeocoder.from_files() if offline else None
+
     cleaned_years = [filename[-8:-4] for filename in os.listdir(nfirs_interim) if filename[:-9] == 'nfirs_cleaned']
-    geocoded_years = [filename[-8:-4] for filename in os.listdir(nfirs_interim) if filename[:-9] == 'nfirs_geocoded_addresses']
-    
+
     for year in cleaned_years:
-        filename = f'nfirs_geocoded_addresses_{year}.csv'
-        filepath = nfirs_interim / filename
+        filepath = geocoded_nfirs_path(year)
+        filename = filepath.name
         if os.path.exists(filepath):
             print(f'{filename} already geocoded.')
             continue
         else:
             df = read_cleaned_nfirs(year)
-            create_nfirs_temp(df, year, nrows = 1000)
-            geocode_nfirs(year)
+            summary = geocode_nfirs(df, year, geocoder)
+            failed = summary['failed_batches']
+            for form in retry_forms:
+                failed += retry_geocodes(year, form, geocoder=geocoder)['failed_batches']
+            if failed:
+                print(f'{filename} not written: rerun to retry the failed batches.')
+                continue
             geocodes = consolidate_geocodes(year)
-            geocodes.to_csv(filepath, index=False)
-            
+            summary = write_geocodes(geocodes, year)
+            print(f"{filename}: {summary.loc['total', 'match_rate']:.1%} of "
+                  f"{summary.loc['total', 'rows']} rows matched.")
+            shutil.rmtree(temp_dir(year))
+
     return
 
 if __name__ == "__main__":
-    geocode_all_uncoded_nfirs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Geocode cleaned nfirs data')
+    parser.add_argument('--offline', action='store_true',
+                        help='geocode locally with TIGER/Line shapefiles')
+    parser.add_argument('--retry-forms', nargs='*', default=RETRY_FORMS, choices=ADDRESS_FORMS[1:],
+                        help='address forms to retry unmatched addresses in')
+    args = parser.parse_args()
+    geocode_all_uncoded_nfirs(offline=args.offline, retry_forms=args.retry_forms)
@@ -0,0 +1,280 @@
+"""Assign 2010 Census block group and tract GEOIDs to points.
+
+Geocoded NFIRS addresses and fire stations come with a longitude and
+latitude, so their Census geography can be found locally instead of asking
+the Census geocoder again. This module finds the 2010 Census block group (or
+tract) containing each point with a vectorized point-in-polygon query against
+a shapely STRtree of the block group (or tract) polygons of its state.
+
+- :class:`src.data.geoids.GeoidIndex` holds the block group polygons of one
+  state and assigns their GEOIDs to points.
+- :func:`src.data.geoids.assign_geoids` assigns GEOIDs to the points of
+  many states, processing the states in parallel.
+- :func:`src.data.geoids.diagnostics` summarizes the match status by state.
+- :func:`src.data.geoids.state_codes` lists the states with shapefiles.
+
+The block group shapefiles (``tl_2010_{fips}_bg10.shp``, one file per state)
+are expected in ``utils.DATA["shapefiles-census-bg"]``, and the tract
+shapefiles (``tl_2010_{fips}_tract10.shp``) in
+``utils.DATA["shapefiles-census"]`` (see LEVELS). The first time a state is
+used, its GEOIDs and polygons are saved to a GeoParquet file in the
+``.cache`` directory next to the shapefile (see :mod:`src.data.cache`), which
+loads much faster than the shapefile; the STRtree is then rebuilt from it in
+well under a second. ::
+
+    from src.data.geoids import assign_geoids, diagnostics
+
+    geoids = assign_geoids(geocodes, lon="lon", lat="lat", state="statefp")
+    print(diagnostics(geoids, geocodes["statefp"]))
+
+Points and polygons are both in NAD83 longitude and latitude, the coordinate
+system of the Census geocoder and the TIGER/Line shapefiles.
+
+Attributes:
+    LEVELS (dict): The data directory key and shapefile name template of
+        each geography level, ``"block_group"`` and ``"tract"``.
+    STATUSES (list): Match statuses of the points, which are
+
+        - ``"matched"``: inside exactly one block group,
+        - ``"boundary"``: on the boundary of several block groups (the one
+          with the smallest GEOID is assigned),
+        - ``"nearest"``: outside all block groups but within `max_distance`
+          of one (see :meth:`GeoidIndex.assign`),
+        - ``"no_match"``: outside all block groups,
+        - ``"missing"``: without coordinates, and
+        - ``"no_state"``: without a state.
+
+"""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely
+from src import utils
+from src.data import cache as raw_cache
+from src.data import raw
+
+
+STATUSES = ["matched", "boundary", "nearest", "no_match", "missing",
+            "no_state"]
+
+# Templates for block group and tract shapefile names.
+BLOCK_GROUP_FILE = "tl_2010_{code}_bg10.shp"
+TRACT_FILE = "tl_2010_{code}_tract10.shp"
+
+LEVELS = {
+    "block_group": ("shapefiles-census-bg", BLOCK_GROUP_FILE),
+    "tract": ("shapefiles-census", TRACT_FILE),
+}
+
+
+class GeoidIndex:
+    """A spatial index of Census polygons and their GEOIDs.
+
+    Args:
+        geoids (array-like): GEOID strings.
+        polygons (array-like): Shapely polygons, one for each GEOID.
+    """
+
+    def __init__(self, geoids, polygons):
+        self.geoids = np.asarray(geoids, dtype=object)
+        self.polygons = np.asarray(polygons)
+        self.tree = shapely.STRtree(self.polygons)
+        # Rank of each polygon by GEOID, to break ties consistently.
+        self._rank = np.argsort(np.argsort(self.geoids.astype(str)))
+
+    @classmethod
+    def from_state(cls, fips, level="block_group"):
+        """Create an index of the block groups (or tracts) of a state.
+
+        Args:
+            fips (str): Two-digit state FIPS code.
+            level (str): Geography level (see LEVELS).
+
+        Returns:
+            GeoidIndex: The index.
+
+        Raises:
+            src.data.raw.BadPathError: If the state has no shapefile.
+        """
+        directory, template = LEVELS[level]
+        path = utils.DATA[directory] / template.format(code=fips)
+        if not path.exists():
+            raise raw.BadPathError(f"File {path} not found")
+        return _load_index(raw_cache.cached_path(path, _convert_shapefile))
+
+    def assign(self, lon, lat, max_distance=None):
+        """Find the polygon containing each point.
+
+        Args:
+            lon (array-like): Longitudes.
+            lat (array-like): Latitudes.
+            max_distance (float): If given, points outside all polygons get
+                the GEOID of the nearest polygon within this distance (in
+                degrees), with status "nearest".
+
+        Returns:
+            pandas.DataFrame: The *geoid* and *status* (see STATUSES) of each
+            point, in the order of the points.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        missing = ~(np.isfinite(lon) & np.isfinite(lat))
+        points = shapely.points(lon, lat)
+        points[missing] = None
+
+        point, polygon = self.tree.query(points, predicate="intersects")
+        counts = np.bincount(point, minlength=len(points))
+        # Sort by point and GEOID, and keep the first polygon of each point.
+        order = np.lexsort((self._rank[polygon], point))
+        point, polygon = point[order], polygon[order]
+        first = np.r_[True, point[1:] != point[:-1]][:len(point)]
+        match = np.full(len(points), -1)
+        match[point[first]] = polygon[first]
+
+        status = np.full(len(points), "no_match", dtype=object)
+        status[counts == 1] = "matched"
+        status[counts > 1] = "boundary"
+        status[missing] = "missing"
+        if max_distance is not None:
+            todo = np.flatnonzero((match < 0) & ~missing)
+            point, polygon = self.tree.query_nearest(
+                points[todo], max_distance=max_distance, all_matches=False)
+            match[todo[point]] = polygon
+            status[todo[point]] = "nearest"
+
+        geoid = np.full(len(points), None, dtype=object)
+        geoid[match >= 0] = self.geoids[match[match >= 0]]
+        return pd.DataFrame({"geoid": geoid, "status": status})
+
+
+def assign_geoids(df, lon="lon", lat="lat", state="statefp", n_jobs=4,
+                  max_distance=None, level="block_group", search_all=False):
+    """Assign 2010 Census block group and tract GEOIDs to points.
+
+    The points of each state are assigned with the index of that state's
+    block groups (see :meth:`GeoidIndex.from_state`). States are processed in
+    parallel; shapely releases the GIL during the queries, so threads are
+    enough. Points of states without a shapefile get status "no_match".
+
+    Args:
+        df (pandas.DataFrame): The points.
+        lon (str): Column of longitudes.
+        lat (str): Column of latitudes.
+        state (str): Column of two-digit state FIPS codes.
+        n_jobs (int): Number of states to process at once.
+        max_distance (float): See :meth:`GeoidIndex.assign`.
+        level (str): Geography level of the polygons (see LEVELS). With
+            "tract", only tract GEOIDs are assigned.
+        search_all (bool): Look up points without a state, or outside all
+            polygons of their state, in the index of every state with a
+            shapefile, for points whose state is missing or wrong.
+
+    Returns:
+        pandas.DataFrame: The block group GEOID (*bg_geoid*, for the
+        "block_group" level only), tract GEOID (*tract_geoid*), and *status*
+        (see STATUSES) of each point, with the index of `df`.
+    """
+    states = df[state].astype("string").to_numpy(dtype=object, na_value=None)
+    rows = pd.Series(np.arange(len(df))).groupby(states, dropna=True)
+    rows = {code: group.to_numpy() for code, group in rows}
+
+    def assign(code, rows, max_distance=max_distance):
+        points = df.iloc[rows]
+        try:
+            index = GeoidIndex.from_state(code, level)
+        except raw.BadPathError:
+            # States without a shapefile (e.g. territories) have no polygons.
+            index = GeoidIndex([], [])
+        return index.assign(points[lon], points[lat],
+                            max_distance=max_distance)
+
+    geoid = np.full(len(df), None, dtype=object)
+    status = np.full(len(df), "no_state", dtype=object)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = executor.map(assign, rows, rows.values())
+        for code, result in zip(rows, results):
+            geoid[rows[code]] = result["geoid"].to_numpy()
+            status[rows[code]] = result["status"].to_numpy()
+
+        if search_all:
+            coordinates = (np.isfinite(df[lon].to_numpy(dtype=np.float64))
+                           & np.isfinite(df[lat].to_numpy(dtype=np.float64)))
+            todo = np.flatnonzero(np.isin(status, ["no_match", "no_state"])
+                                  & coordinates)
+            codes = state_codes(level) if len(todo) else []
+            results = executor.map(assign, codes, [todo] * len(codes),
+                                   [None] * len(codes))
+            # States are searched in order, so points on a state line get
+            # the smallest GEOID.
+            found = np.zeros(len(todo), dtype=bool)
+            for result in results:
+                new = result["geoid"].notna().to_numpy()
+                status[todo[new & found]] = "boundary"
+                new &= ~found
+                geoid[todo[new]] = result["geoid"].to_numpy()[new]
+                status[todo[new]] = result["status"].to_numpy()[new]
+                found |= new
+
+    geoid = pd.Series(geoid, index=df.index, dtype="string")
+    if level == "tract":
+        geoids = {"tract_geoid": geoid}
+    else:
+        geoids = {"bg_geoid": geoid, "tract_geoid": geoid.str[:11]}
+    return pd.DataFrame({
+        **geoids,
+        "status": pd.Categorical(status, categories=STATUSES),
+    }, index=df.index)
+
+
+def diagnostics(result, states):
+    """Summarize the match status of assigned GEOIDs by state.
+
+    Args:
+        result (pandas.DataFrame): Output of :func:`assign_geoids`.
+        states (pandas.Series): The state FIPS code of each point.
+
+    Returns:
+        pandas.DataFrame: The number of points with each status in each
+        state, with the total number of points (*rows*) and the fraction with
+        a GEOID (*match_rate*), and a "total" row at the end.
+    """
+    states = pd.Series(states, index=result.index).astype("string")
+    summary = pd.crosstab(states.fillna("none"), result["status"],
+                          dropna=False).reindex(columns=STATUSES, fill_value=0)
+    summary.columns = list(summary.columns)
+    summary.loc["total"] = summary.sum()
+    summary["rows"] = summary[STATUSES].sum(axis=1)
+    summary["match_rate"] = (summary[["matched", "boundary", "nearest"]]
+                             .sum(axis=1) / summary["rows"])
+    summary.index.name = "statefp"
+    return summary
+
+
+def state_codes(level="block_group"):
+    """List the states with a shapefile.
+
+    Args:
+        level (str): Geography level (see LEVELS).
+
+    Returns:
+        list: The two-digit state FIPS codes, in order.
+    """
+    directory, template = LEVELS[level]
+    prefix, suffix = template.split("{code}")
+    paths = utils.DATA[directory].glob(prefix + "*" + suffix)
+    return sorted(path.name[len(prefix):-len(suffix)] for path in paths)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_index(path):
+    # Keyed by the cached copy, whose name changes with the shapefile.
+    polygons = geopandas.read_parquet(path)
+    return GeoidIndex(polygons["GEOID10"], polygons.geometry.values)
+
+
+def _convert_shapefile(source, destination):
+    polygons = geopandas.read_file(source)[["GEOID10", "geometry"]]
+    polygons.to_parquet(destination, index=False)
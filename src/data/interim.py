@@ -5,8 +5,103 @@ These functions read in interim data in the correct format.
 """
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 from src import utils
+from src.data import raw
+
+# Compact dtypes for the cleaned nfirs data. Low-cardinality codes are categoricals, counts
+# are nullable small integers, losses are float32, and the keys and free text are stored in
+# contiguous Arrow string arrays instead of one Python object per value.
+NFIRS_SCHEMA = {
+    'state': 'category',
+    'fdid': 'category',
+    'st_fdid': 'category',
+    'dept_sta': 'category',
+    'inc_no': 'string[pyarrow]',
+    'exp_no': 'category',
+    'inc_type': 'category',
+    'prop_use': 'category',
+    'aid': 'category',
+    'address': 'string[pyarrow]',
+    'apt_no': 'string[pyarrow]',
+    'x_street': 'string[pyarrow]',
+    'city': 'category',
+    'state_id': 'category',
+    'zip5': 'category',
+    'detector': 'category',
+    'det_type': 'category',
+    'det_power': 'category',
+    'det_operat': 'category',
+    'det_effect': 'category',
+    'det_fail': 'category',
+    'aes_pres': 'category',
+    'aes_type': 'category',
+    'aes_oper': 'category',
+    'no_spr_op': 'category',
+    'aes_fail': 'category',
+    'unique_id': 'string[pyarrow]',
+    'apt_no_nunique': 'Int16',
+    'st_fdid_nunique': 'Int16',
+    'exp_no_nunique': 'Int16',
+    'num_records_size': 'Int16',
+    'oth_inj': 'Int16',
+    'oth_death': 'Int16',
+    'prop_loss': 'float32',
+    'cont_loss': 'float32',
+    'tot_loss': 'float32',
+}
+
+# Columns of the geocoded nfirs data, as returned by the Census batch geocoder.
+GEOCODE_COLUMNS = ['id', 'address', 'match', 'matchtype', 'parsed',
+                   'tigerlineid', 'side', 'statefp', 'countyfp', 'tract',
+                   'block', 'lat', 'lon']
+
+def apply_nfirs_schema(df):
+    """Convert cleaned nfirs data to the compact dtypes in NFIRS_SCHEMA.
+    
+    Codes are converted to strings before they become categoricals, so the categories are
+    the same whether the data come straight from the cleaning steps or from a csv file.
+    Columns which aren't in the schema are left unchanged.
+    
+    Args:
+        df: pandas dataframe containing cleaned nfirs data
+        
+    Returns:
+        df: pandas dataframe with compact dtypes
+    """
+    
+    df = df.copy()
+    for col, dtype in NFIRS_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'category' and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('string').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    
+    return(df)
+
+def nfirs_memory_savings(df):
+    """Report how much memory NFIRS_SCHEMA saves for a dataframe.
+    
+    Args:
+        df: pandas dataframe containing cleaned nfirs data, e.g. read without the schema
+        
+    Returns:
+        report: pandas dataframe with the memory use in MB of each column before and after
+        applying the schema, and their ratio, with a 'total' row at the end
+    """
+    
+    before = df.memory_usage(index = False, deep = True)
+    after = apply_nfirs_schema(df).memory_usage(index = False, deep = True)
+    report = pd.DataFrame({'before_mb': before / 2**20, 'after_mb': after / 2**20})
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['after_mb'] / report['before_mb']
+    
+    return(report)
 
 def read_cleaned_nfirs(year):
     """Read in cleaned and de-duped nfirs data (but not geocoded)
@@ -15,24 +110,59 @@ def read_cleaned_nfirs(year):
         year: int, year of nfirs data to read
         
     Returns:
-        df: pandas dataframe containing nfirs data for that year
+        df: pandas dataframe containing nfirs data for that year, with the dtypes in
+        NFIRS_SCHEMA
     """
     
-    dtypes = {
-        'state':'str',
-        'fdid':'str',
-        'st_fdid':'str',
-        'dept_sta':'str',
-        'inc_no':'str',
-        'exp_no':'str',
-        'inc_type':'str',
-        'zip5':'str'
-    }
-    
     path = utils.DATA['interim'] / 'nfirs' / f'nfirs_cleaned_{year}.csv'
     
     df = pd.read_csv(path,
-                    dtype = dtypes,
+                    dtype = NFIRS_SCHEMA,
                     parse_dates = ['inc_date'])
     
-    return(df)
\ No newline at end of file
+    return(df)
+
+def geocoded_nfirs_path(year):
+    """Get the path of the geocoded nfirs dataset of a year.
+    
+    Args:
+        year: int, year of nfirs data
+        
+    Returns:
+        pathlib.Path to the dataset directory
+    """
+    
+    return utils.DATA['interim'] / 'nfirs' / f'nfirs_geocoded_addresses_{year}'
+
+def read_geocoded_nfirs(year, states=None, fips=None):
+    """Read in geocoded nfirs addresses.
+    
+    The geocodes are stored as a parquet dataset partitioned by state fips code (see
+    src.data.geocode_nfirs.write_geocodes), so only the files of the selected states are
+    read. Unmatched addresses, which have no state, are only read when no states are
+    selected. Only one of states and fips may be given.
+    
+    Args:
+        year: int, year of nfirs data to read
+        states: list of two-letter state abbreviation strings, or None for all states
+        fips: list of two-digit state FIPS code strings, or None for all states
+        
+    Returns:
+        df: pandas dataframe with the geocoder results, whose id column refers to the rows
+        of the cleaned nfirs data (see read_cleaned_nfirs)
+    """
+    
+    if states is not None and fips is not None:
+        raise ValueError("Only one of [states/fips] may be selected.")
+    if states is not None:
+        fips = [raw.STATES[state] for state in states]
+    filters = [('statefp', 'in', list(fips))] if fips is not None else None
+    
+    path = geocoded_nfirs_path(year)
+    partitioning = ds.partitioning(pa.schema([('statefp', pa.string())]), flavor = 'hive')
+    table = pq.read_table(path, filters = filters, partitioning = partitioning)
+    
+    # The partition column is read last, put it back in place
+    df = table.select(GEOCODE_COLUMNS).to_pandas()
+    
+    return(df)
@@ -0,0 +1,212 @@
+"""Join geocodes to the cleaned nfirs data.
+
+The geocodes of a year (see src.data.geocode_nfirs) have one row per row of
+the cleaned nfirs data, and their id column is the position of that row in
+``nfirs_cleaned_{year}.csv``. This module joins them by that integer
+position, so no string keys are compared, and adds typed Census GEOID columns
+at the state, county, tract, and block group levels. The result is the final
+geocoded nfirs data, written to
+``Data/processed/nfirs/nfirs_geocoded_{year}.parquet``.
+
+Run this module as a script to build the geocoded nfirs data of every
+geocoded year. ::
+
+    $ python -m src.data.merge_geocodes
+
+"""
+
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from src import profiling, utils
+from src.data import geoids
+from src.data.interim import (apply_nfirs_schema, geocoded_nfirs_path,
+                              read_cleaned_nfirs, read_geocoded_nfirs)
+
+
+# Geocoder result columns added to the cleaned nfirs data
+GEOCODE_COLUMNS = ['match', 'matchtype', 'lat', 'lon']
+
+# Dtypes of the GEOID columns. States and counties have few distinct values,
+# tracts and block groups are stored as Arrow strings.
+GEOID_SCHEMA = {
+    'state_geoid': 'category',
+    'county_geoid': 'category',
+    'tract_geoid': 'string[pyarrow]',
+    'bg_geoid': 'string[pyarrow]',
+}
+
+
+def processed_nfirs_path(year):
+    """Get the path of the geocoded nfirs data of a year.
+
+    Args:
+        year: int, year of nfirs data
+
+    Returns:
+        pathlib.Path to the parquet file
+    """
+
+    return (utils.DATA['processed'] / 'nfirs'
+            / f'nfirs_geocoded_{year}.parquet')
+
+
+def build_geoids(geocodes):
+    """Build Census GEOIDs from geocoder results.
+
+    Args:
+        geocodes: pandas dataframe with the statefp, countyfp, tract, and
+            block columns of the geocoder results
+
+    Returns:
+        pandas dataframe with the GEOID_SCHEMA columns, aligned with
+        geocodes. GEOIDs are missing where the geocoder didn't return that
+        level.
+    """
+
+    codes = {name: geocodes[name].astype('string[pyarrow]')
+             for name in ['statefp', 'countyfp', 'tract', 'block']}
+    df = pd.DataFrame(index=geocodes.index)
+    df['state_geoid'] = codes['statefp']
+    df['county_geoid'] = df['state_geoid'] + codes['countyfp']
+    df['tract_geoid'] = df['county_geoid'] + codes['tract']
+    # The block group is the first digit of the block
+    df['bg_geoid'] = df['tract_geoid'] + codes['block'].str[0]
+    return (df.astype(GEOID_SCHEMA))
+
+
+def merge_geocodes(df, geocodes, locate=False):
+    """Join geocodes to the cleaned nfirs data by row position.
+
+    Args:
+        df: pandas dataframe containing the cleaned nfirs data, in the order
+            of the cleaned csv file (see src.data.interim.read_cleaned_nfirs)
+        geocodes: pandas dataframe with the geocoder results, whose id column
+            is the row position in df (see
+            src.data.interim.read_geocoded_nfirs)
+        locate: bool, assign the GEOIDs of matched rows the geocoder returned
+            no tract for from their coordinates (see
+            src.data.geoids.assign_geoids)
+
+    Returns:
+        df: pandas dataframe, the cleaned nfirs data with the GEOCODE_COLUMNS
+        and the GEOID_SCHEMA columns. Rows without geocodes have match False
+        and missing values elsewhere.
+    """
+
+    positions = geocodes['id'].astype(np.int64).to_numpy()
+    if len(positions) and (positions.min() < 0 or positions.max() >= len(df)
+                           or len(np.unique(positions)) < len(positions)):
+        raise ValueError(f'Geocode ids must be distinct row positions of the '
+                         f'{len(df)} nfirs rows; the cleaned data may have '
+                         'changed since it was geocoded')
+
+    geocodes = geocodes.set_axis(positions)
+    located = build_geoids(geocodes)
+    if locate:
+        todo = geocodes['match'].astype(bool) & located['tract_geoid'].isna()
+        assigned = geoids.assign_geoids(geocodes[todo], lon='lon', lat='lat',
+                                        state='statefp')
+        assigned = assigned[assigned['bg_geoid'].notna()]
+        bg_geoid = assigned['bg_geoid']
+        located = located.astype('string[pyarrow]')
+        located.loc[assigned.index, 'bg_geoid'] = bg_geoid
+        located.loc[assigned.index, 'tract_geoid'] = assigned['tract_geoid']
+        located.loc[assigned.index, 'county_geoid'] = bg_geoid.str[:5]
+        located.loc[assigned.index, 'state_geoid'] = bg_geoid.str[:2]
+        located = located.astype(GEOID_SCHEMA)
+
+    # Align on the integer row positions; rows without geocodes get missing
+    # values
+    rows = pd.RangeIndex(len(df))
+    added = pd.concat([geocodes[GEOCODE_COLUMNS], located],
+                      axis=1).reindex(rows)
+    added['match'] = (added['match'].astype('boolean').fillna(False)
+                      .astype(bool))
+    added['matchtype'] = added['matchtype'].astype('category')
+
+    df = df.reset_index(drop=True)
+    return (pd.concat([df, added], axis=1))
+
+
+@profiling.instrument('merge_geocodes.build_geocoded_nfirs')
+def build_geocoded_nfirs(year, locate=False):
+    """Join the geocodes of a year to its cleaned nfirs data and write the
+    result to the processed folder (see processed_nfirs_path).
+
+    Args:
+        year: int, year of nfirs data
+        locate: bool, see merge_geocodes
+
+    Returns:
+        df: pandas dataframe, the geocoded nfirs data
+    """
+
+    df = merge_geocodes(read_cleaned_nfirs(year), read_geocoded_nfirs(year),
+                        locate=locate)
+
+    path = processed_nfirs_path(year)
+    os.makedirs(path.parent, exist_ok=True)
+    df.to_parquet(f'{path}.tmp', index=False)
+    os.replace(f'{path}.tmp', path)
+    return (df)
+
+
+def read_processed_nfirs(year, columns=None):
+    """Read in geocoded nfirs data.
+
+    Args:
+        year: int, year of nfirs data to read
+        columns: list of str, columns to read, or None for all columns
+
+    Returns:
+        df: pandas dataframe containing the geocoded nfirs data for that
+        year, with the dtypes in src.data.interim.NFIRS_SCHEMA and
+        GEOID_SCHEMA
+    """
+
+    df = apply_nfirs_schema(pd.read_parquet(processed_nfirs_path(year),
+                                            columns=columns))
+    # Parquet doesn't keep the storage of string columns
+    schema = {name: dtype for name, dtype in GEOID_SCHEMA.items()
+              if name in df.columns}
+    return (df.astype(schema))
+
+
+def build_all_geocoded_nfirs(locate=False):
+    """Build the geocoded nfirs data of every geocoded year (see
+    build_geocoded_nfirs).
+
+    Args:
+        locate: bool, see merge_geocodes
+
+    Returns:
+        None
+    """
+
+    nfirs_interim = utils.DATA['interim'] / 'nfirs'
+    cleaned_years = [filename[-8:-4] for filename in os.listdir(nfirs_interim)
+                     if filename[:-9] == 'nfirs_cleaned']
+
+    for year in cleaned_years:
+        if not os.path.exists(geocoded_nfirs_path(year)):
+            print(f'nfirs {year} not geocoded yet.')
+            continue
+        df = build_geocoded_nfirs(year, locate=locate)
+        print(f"nfirs {year}: {df['tract_geoid'].notna().mean():.1%} of "
+              f"{len(df)} rows have a tract.")
+
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Join geocodes to cleaned nfirs data')
+    parser.add_argument('--locate', action='store_true',
+                        help='assign GEOIDs missing from the geocodes from '
+                             'block group shapefiles')
+    args = parser.parse_args()
+    build_all_geocoded_nfirs(locate=args.locate)
@@ -1,8 +1,17 @@
 import pandas as pd
 import numpy as np
+import argparse
+import hashlib
+import inspect
+import json
+import multiprocessing
 import os
-from src import utils
-from src.data.raw import read_nfirs
+import resource
+from src import profiling, utils
+from src.data import cache, raw, unique_id_index
+from src.data.address import build_address, map_distinct
+from src.data.interim import NFIRS_SCHEMA, apply_nfirs_schema
+from src.data.raw import read_nfirs, is_home_fire
 
 def ingest_raw_nfirs_data(nfirs_dict):
     """Ingest single year of raw nfirs data, perform basic cleaning, merging, and filtering to 
@@ -29,12 +38,7 @@ def ingest_raw_nfirs_data(nfirs_dict):
     fire = fire.drop_duplicates(merge_cols)
     
     # Subset the basic data by inc_type and prop_use values which correspond to home fires
-    inc_type_vals = [111, 113, 114, 115, 116, 117, 118, 119, 120, 121, 122]
-    
-    mask1 = basic['inc_type'].isin(inc_type_vals)
-    mask2 = basic['prop_use'].str.startswith('4')
-
-    basic = basic[mask1 & mask2]
+    basic = basic[is_home_fire(basic)]
     
     # Left join the address and fire tables to the basic table
     df = (basic.merge(address, how = 'inner', on = merge_cols)
@@ -44,20 +48,10 @@ def ingest_raw_nfirs_data(nfirs_dict):
     # Convert the address to a datetime object
     df['inc_date'] = pd.to_datetime(df['inc_date'].astype(str).str.zfill(8), format = '%m%d%Y')
         
-    ### Combine the street address parts into a single address field
-    # Clean address parts
-    address_parts = ['num_mile','street_pre','streetname','streettype','streetsuf']
-    for part in address_parts:
-        df[part] = df[part].fillna('').astype(str).str.upper()
-
-    # Some streetnames included the street_pre as part of the field (i.e. N N 21st st, or E E John Blvd). This
-    # line replaces street_pre with '' if that is the case
-    df['street_pre'] = np.where(df['street_pre'] == df['streetname'].str.split(' ').str[0], '', df['street_pre'])
-
-    # Combines and cleans the address parts into a single address field
-    df['address'] = df['num_mile'] + ' ' + df['street_pre'] + ' ' + df['streetname'] + ' ' + df['streettype'] + ' ' +\
-                    df['streetsuf']
-    df['address'] = df['address'].str.replace('\s+',' ', regex=True).str.strip()
+    # Combine the street address parts into a single address field. Some streetnames include
+    # the street_pre as part of the field (i.e. N N 21st st, or E E John Blvd), in which case
+    # street_pre is left out. See src.data.address.build_address.
+    df['address'] = build_address(df)
     
     # Replace erroneous zip codes with null values
     erroneous_zip_codes = ['00000','11111','22222','99999']
@@ -117,6 +111,12 @@ def dedupe_nfirs(df):
     isn't counted twice. For buildings with more than one household (apartment buildings,
     condos, etc.), roll those up into a single record.
     
+    Records are grouped on a 64-bit hash of (address, city, state_id, inc_date), so the
+    grouping, aggregation and selection of the first record of each group all work on
+    integer codes. Records missing an address, city or state_id are dropped. The output is
+    sorted by the 'address, city, state_id - inc_date' string, which is only built for the
+    one record kept per group.
+    
     Args:
         df: pandas dataframe containing cleaned nfirs data (output of ingest_raw_nfirs_data function)
         
@@ -124,58 +124,201 @@ def dedupe_nfirs(df):
         df2: pandas dataframe de-duplicated nfirs data (not geocoded yet)
     """
     
-    df['full_address_date'] = df['address'].str.strip() + ', ' + df['city'] + ', ' + df['state_id'] + ' - ' + df['inc_date'].astype(str)
-    
-    # Aggregations to do to get needed data
-    agg_funcs1 = {
-        'oth_inj':['sum','max'],
-        'oth_death':['sum','max'],
-        'prop_loss':['sum','max'],
-        'cont_loss':['sum','max'],
-        'tot_loss':['sum','max'],
-        'apt_no':'nunique',
-        'st_fdid':'nunique',
-        'exp_no':'nunique',
-        'state':'size'
-    }
-
-    # Group by full_address_date combination, and perform aggregations
-    df_rollup = (df.groupby('full_address_date')
-                 .agg(agg_funcs1)
-                 .rename(columns = {'state':'num_records'})
-                )
-
-    df_rollup.columns = df_rollup.columns.map('_'.join)
+    address = map_distinct(df['address'], lambda values: values.str.strip())
+    keys = pd.DataFrame({'address': address, 'city': df['city'], 'state_id': df['state_id'],
+                         'inc_date': df['inc_date']})
+    valid = keys[['address','city','state_id']].notna().all(axis = 1).values
+    codes, _ = pd.factorize(pd.util.hash_pandas_object(keys[valid], index = False).values)
+    df = df[valid]
+    
+    # Aggregations to do to get needed data, all over the same integer grouping
+    base_col_names = ['oth_inj','oth_death','prop_loss','cont_loss','tot_loss']
+    grouped = df.groupby(codes)
+    df_rollup = grouped[['apt_no','st_fdid','exp_no']].nunique().add_suffix('_nunique')
+    df_rollup['num_records_size'] = grouped.size()
+    sums = grouped[base_col_names].sum()
+    maxs = grouped[base_col_names].max()
 
     # Choose sum or max based on whether the record refers to multiple apartments or not (sum if multiple apartments, max if not)
     mask1 = df_rollup['apt_no_nunique'] > 1
-    base_col_names = ['oth_inj','oth_death','prop_loss','cont_loss','tot_loss']
     for name in base_col_names:
-        df_rollup[name] = np.where(mask1, df_rollup[name + '_sum'], df_rollup[name + '_max'])
-
-    dropcols = [name + '_sum' for name in base_col_names] + [name + '_max' for name in base_col_names]
-    df_rollup = df_rollup.drop(dropcols, axis=1)
+        df_rollup[name] = np.where(mask1, sums[name], maxs[name])
     
+    # Keep the first record of each group. pd.factorize numbers the groups in order of
+    # first appearance, so this lines up with the rollup.
+    first = np.unique(codes, return_index = True)[1]
     dropcols2 = [col for col in df.columns if col in df_rollup.columns]
-    df2 = (df.drop(dropcols2, axis=1)
-           .merge(df_rollup, how = 'right', left_on='full_address_date', right_index=True)
-           .drop_duplicates('full_address_date')
-           .drop('full_address_date', axis = 1)
-          )
+    df2 = df.iloc[first].drop(dropcols2, axis = 1)
+    for col in df_rollup.columns:
+        df2[col] = df_rollup[col].values
+    
+    # Sort by the string key. Dates are formatted once per distinct date, and the keys are
+    # sorted as a fixed-width unicode array, which is much faster than sorting objects.
+    date_codes, dates = pd.factorize(df2['inc_date'])
+    dates = np.append(pd.Series(dates).astype(str).values, 'NaT')[date_codes]
+    full_address_date = (address[valid].iloc[first] + ', ' + df2['city'] + ', ' + df2['state_id'] +
+                         ' - ' + dates)
+    df2 = df2.iloc[np.argsort(full_address_date.values.astype(str), kind = 'stable')]
     
     return(df2)
 
-def ingest_all_nfirs():
+# Number of raw rows to read at a time in ingest_all_nfirs.
+CHUNKSIZE = 500_000
+
+def ingest_nfirs_year(year_path, output_path):
+    """Read, clean, and de-dupe a single year of raw nfirs data and write it
+    to output_path. The output is written to a temporary file first and then
+    moved into place, so an interrupted run never leaves a partial output file
+    behind. The year's unique ids are then indexed with
+    src.data.unique_id_index.build. A year which fails (e.g. with a
+    MemoryError, or on a malformed raw file) returns its error instead of
+    raising, so the other years are still ingested.
+    
+    Args:
+        year_path: nfirs directory with one year of raw data
+        output_path: path of the cleaned csv file to write
+        
+    Returns:
+        dict with the year, number of output rows, wall time in seconds, peak
+        resident memory of the process in MB and error message (None if the
+        year succeeded)
+    """
+    
+    year = os.path.basename(os.path.normpath(year_path))
+    
+    with profiling.stage('nfirs.ingest_year') as record:
+        try:
+            nfirs_dict = read_nfirs(year_path, chunksize = CHUNKSIZE, cache = True)
+            record['rows_in'] = len(nfirs_dict['basic'])
+            df = ingest_raw_nfirs_data(nfirs_dict)
+            del nfirs_dict
+            df = apply_nfirs_schema(dedupe_nfirs(df))
+            
+            temp_path = f'{output_path}.tmp'
+            df.to_csv(temp_path, index = False)
+            os.replace(temp_path, output_path)
+            unique_id_index.build(df['unique_id'], year)
+            record['rows_out'], error = len(df), None
+        except MemoryError:
+            error = 'MemoryError: exceeded the per-worker memory ceiling'
+            record['error'] = error
+        except Exception as e:
+            # Any other failure (e.g. a malformed raw file) fails only this year
+            error = f'{type(e).__name__}: {e}'
+            record['error'] = error
+    
+    if error is not None and os.path.exists(f'{output_path}.tmp'):
+        os.remove(f'{output_path}.tmp')
+    
+    return {'year': year,
+            'rows': record['rows_out'],
+            'wall_time_s': record['wall_s'],
+            'peak_rss_mb': record['peak_rss_mb'],
+            'error': error}
+
+def cleaning_code_version():
+    """Version the code which turns raw nfirs data into cleaned nfirs data.
+    
+    The version is a hash of the source code of the reading, cleaning and de-duping
+    functions and of the settings they use, so it changes whenever any of them is edited.
+    
+    Returns:
+        str: hex digest identifying the cleaning code
+    """
+    
+    functions = [raw.read_nfirs, raw._stream_nfirs, raw._read_nfirs_chunks, raw.is_home_fire,
+                 raw.hash_nfirs_keys, build_address, map_distinct,
+                 ingest_raw_nfirs_data, dedupe_nfirs, apply_nfirs_schema]
+    settings = [raw.NFIRS_COLUMNS, raw.NFIRS_DTYPES, raw.HOME_FIRE_INC_TYPES, NFIRS_SCHEMA]
+    
+    sha256 = hashlib.sha256()
+    for function in functions:
+        sha256.update(inspect.getsource(function).encode())
+    sha256.update(repr(settings).encode())
+    return sha256.hexdigest()
+
+def read_manifest():
+    """Read the manifest of ingested nfirs years from data/interim/nfirs/manifest.json.
+    
+    For each ingested year, the manifest records the size, modification time and hash of
+    each raw input file, the cleaning code version, the output file, and the number of
+    rows. It returns an empty dictionary if no year has been ingested yet.
+    
+    Returns:
+        manifest: dictionary keyed by year
+    """
+    
+    path = utils.DATA['interim'] / 'nfirs' / 'manifest.json'
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_manifest(manifest):
+    """Atomically write the manifest of ingested nfirs years."""
+    
+    path = utils.DATA['interim'] / 'nfirs' / 'manifest.json'
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent = 2, sort_keys = True)
+    os.replace(temp_path, path)
+
+def _input_keys(year_path, known = None):
+    """Identify the raw input files of a year (see src.data.cache.file_key)."""
+    
+    known = known or {}
+    return {fname: cache.file_key(os.path.join(year_path, fname), known = known.get(fname))
+            for fname in raw.NFIRS_FILES.values()}
+
+def _limit_memory(max_memory_gb):
+    """Pool initializer which caps the address space of a worker process."""
+    
+    if max_memory_gb is not None:
+        limit = int(max_memory_gb * 2**30)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+@profiling.instrument('nfirs.ingest_all')
+def ingest_all_nfirs(n_jobs = 1, max_memory_gb = None, force = False):
     
     """This function calls the ingest_raw_nfirs_data function on each
     directory within data/raw/nfirs, and saves the cleaned output files to
     data/interim/nfirs, ready to be geocoded.
+    
+    Years are only re-ingested when they are stale: when their raw input
+    files, or the cleaning code (see cleaning_code_version), changed since the
+    last time they were ingested according to the manifest (see
+    read_manifest), or when the output file is missing. Pass force = True to
+    re-ingest every year.
+    
+    With n_jobs > 1 the years are ingested concurrently in a process pool.
+    Each year gets a fresh worker process (so the reported peak memory is per
+    year), and max_memory_gb caps the address space of each worker. A year
+    which exceeds the cap fails with a MemoryError. Failed years (for any
+    reason) are reported in the summary and listed at the end, without
+    stopping the other years. Each year is written to its own output file, so
+    the outputs don't depend on the number of workers or the order in which
+    years finish.
+    
+    Args:
+        n_jobs: int, number of years to ingest at the same time
+        max_memory_gb: float, per-worker memory ceiling in GB (None for no
+            limit)
+        force: bool, re-ingest all years even if they are up to date
+        
+    Returns:
+        summary: pandas dataframe with the rows, wall time, peak memory and
+        error of each year, and whether it was skipped as up to date, sorted
+        by year
     """
     
     raw_nfirs_path = utils.DATA["raw"] / 'nfirs'
     interim_nfirs_path = utils.DATA['interim'] / 'nfirs'
 
-    for year in os.listdir(raw_nfirs_path):
+    manifest = read_manifest()
+    code_version = cleaning_code_version()
+
+    tasks, inputs, skipped = [], {}, []
+    for year in sorted(os.listdir(raw_nfirs_path)):
         year_path = os.path.join(raw_nfirs_path, year)
 
         if not os.path.isdir(year_path):
@@ -184,12 +327,56 @@ def ingest_all_nfirs():
         output_name = f'nfirs_cleaned_{year}.csv'
         output_path = os.path.join(interim_nfirs_path, output_name)
         
-        nfirs_dict = read_nfirs(year_path)
-        df = ingest_raw_nfirs_data(nfirs_dict)
-        df = dedupe_nfirs(df)
-        df.to_csv(output_path, index = False)
+        # Skip years whose inputs, code and output are unchanged since they were ingested
+        entry = manifest.get(year, {})
+        inputs[year] = _input_keys(year_path, known = entry.get('inputs'))
+        hashes = {fname: key['sha256'] for fname, key in inputs[year].items()}
+        up_to_date = (entry.get('code_version') == code_version and
+                      {fname: key['sha256'] for fname, key in entry.get('inputs', {}).items()} == hashes and
+                      os.path.exists(output_path) and
+                      year in unique_id_index.indexed_years())
+        if up_to_date and not force:
+            skipped.append({'year': year, 'rows': entry['rows'], 'skipped': True})
+            continue
+        
+        tasks.append((year_path, output_path))
+    
+    # The memory ceiling is only applied to worker processes, never to the caller
+    if n_jobs == 1 and max_memory_gb is None:
+        results = [ingest_nfirs_year(*task) for task in tasks]
+    else:
+        with multiprocessing.Pool(n_jobs, initializer = _limit_memory,
+                                  initargs = (max_memory_gb,), maxtasksperchild = 1) as pool:
+            results = pool.starmap(ingest_nfirs_year, tasks, chunksize = 1)
+    
+    # Record the years which were ingested successfully
+    for result in results:
+        if result['error'] is None:
+            year = result['year']
+            manifest[year] = {'inputs': inputs[year],
+                              'code_version': code_version,
+                              'output': f'nfirs_cleaned_{year}.csv',
+                              'rows': result['rows']}
+    _write_manifest(manifest)
+    
+    results = [dict(result, skipped = False) for result in results]
+    summary = pd.DataFrame(results + skipped,
+                           columns = ['year','rows','wall_time_s','peak_rss_mb','error','skipped'])
+    summary = summary.sort_values('year').reset_index(drop = True)
+    print(summary.to_string(index = False))
+    failed = summary[summary.error.notna()]
+    if len(failed):
+        print(f'Failed years: {", ".join(failed.year)}')
     
-    return
+    return(summary)
 
 if __name__ == "__main__":
-    ingest_all_nfirs()
+    parser = argparse.ArgumentParser(description = 'Ingest raw nfirs data')
+    parser.add_argument('-j', '--n_jobs', type = int, default = 1,
+                        help = 'number of years to ingest concurrently (default %(default)s)')
+    parser.add_argument('-m', '--max_memory_gb', type = float, default = None,
+                        help = 'memory ceiling per worker in GB (default no limit)')
+    parser.add_argument('-f', '--force', action = 'store_true',
+                        help = 're-ingest all years, even those which are up to date')
+    args = parser.parse_args()
+    ingest_all_nfirs(n_jobs = args.n_jobs, max_memory_gb = args.max_memory_gb, force = args.force)
@@ -3,14 +3,23 @@
 The following top-level functions can be useful for reading raw data.
 
 - :func:`src.data.raw.read_shapefiles` reads 2010 Census tract shapefiles.
+- :func:`src.data.raw.shapefile_store` returns a GeoParquet store of the
+  tract shapefiles, used by read_shapefiles.
 - :func:`src.data.raw.read_fire_stations` reads fire station data.
+- :func:`src.data.raw.read_nfirs` reads one year of raw NFIRS data.
 
 """
 import geopandas
+import json
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
+import shapely
 
 from src import utils
+from src.data import cache as raw_cache
 
 
 # Map state names to state FIPS codes.
@@ -74,12 +83,75 @@ STATES = {
 }
 
 
+# Raw NFIRS table file names.
+NFIRS_FILES = {
+    'basic': 'basicincident.txt',
+    'address': 'incidentaddress.txt',
+    'fire': 'fireincident.txt',
+}
+
+
+# Columns that identify an NFIRS incident and join the raw tables.
+NFIRS_KEYS = ['state', 'fdid', 'inc_date', 'inc_no', 'exp_no']
+
+
+# Raw NFIRS columns used by src.data.nfirs, by table.
+NFIRS_COLUMNS = {
+    'basic': NFIRS_KEYS + [
+        'inc_type', 'prop_use', 'aid', 'dept_sta', 'oth_inj', 'oth_death',
+        'prop_loss', 'cont_loss',
+    ],
+    'address': NFIRS_KEYS + [
+        'num_mile', 'street_pre', 'streetname', 'streettype', 'streetsuf',
+        'apt_no', 'x_street', 'city', 'state_id', 'zip5',
+    ],
+    'fire': NFIRS_KEYS + [
+        'detector', 'det_type', 'det_power', 'det_operat', 'det_effect',
+        'det_fail', 'aes_pres', 'aes_type', 'aes_oper', 'no_spr_op',
+        'aes_fail',
+    ],
+}
+
+
+# Non-string dtypes for raw NFIRS columns. All other columns are read as str.
+NFIRS_DTYPES = {
+    'inc_type': 'Int64',
+    'oth_inj': 'float64',
+    'oth_death': 'float64',
+    'prop_loss': 'float64',
+    'cont_loss': 'float64',
+}
+
+
+# Arrow types of the NFIRS_DTYPES values, for the columnar cache.
+_ARROW_TYPES = {
+    'Int64': pa.int64(),
+    'float64': pa.float64(),
+}
+
+
+# NFIRS incident types for home fires.
+HOME_FIRE_INC_TYPES = [111, 113, 114, 115, 116, 117, 118, 119, 120, 121, 122]
+
+
+# Name of the GeoParquet store of the tract shapefiles, in the cache directory
+# of the shapefiles.
+SHAPEFILE_STORE = "tl_2010_tract10.parquet"
+
+# Version of the store layout; stores of other versions are rebuilt.
+_STORE_VERSION = 2
+
+# Maximum shapes per row group of the store.
+_STORE_ROW_GROUP_SIZE = 500
+
+
 class BadPathError(Exception):
     """An error for invalid paths."""
     pass
 
 
-def read_shapefiles(states=None, fips=None, glob=None):
+def read_shapefiles(states=None, fips=None, glob=None, cache=True, bbox=None,
+                    mask=None, geoids=None):
     """Read raw 2010 Census tract shapefiles.
 
     The project raw data includes 56 shapefiles with 2010 Census tract
@@ -92,13 +164,37 @@ def read_shapefiles(states=None, fips=None, glob=None):
     state abbreviations, a list of two-digit FIPS codes, or a glob for the file
     names of interest. The caller can only use one of these filters in a call.
 
+    The shapes can be narrowed down further to those intersecting a bounding
+    box or a mask geometry, or to some GEOIDs (e.g. a list of counties), with
+    `bbox`, `mask`, and `geoids`, alone or with the other filters.
+
+    By default, the shapes are read from a GeoParquet store of all the
+    shapefiles (see :func:`shapefile_store`), which is made the first time
+    and whenever a shapefile changes. Each shapefile's shapes are sorted by
+    GEOID and split into row groups of nearby tracts, with the bounding box
+    of each shape in a *bbox* column. Only the row groups of the selected
+    files whose GEOID and bounding box statistics can match the filters are
+    read, and only the shapes whose bounding boxes can match are decoded, so
+    a county needs a few row groups rather than its whole state.
+
     Args:
         states (list): Two-letter state abbreviation strings.
         fips (list): Two-digit state FIPS code strings.
         glob (str): A glob expression (e.g., "*.shp").
+        cache (bool): Read from (and if needed create) the GeoParquet store
+            instead of the shapefiles.
+        bbox (tuple): Bounds (minx, miny, maxx, maxy) in the coordinates of
+            the shapefiles; only shapes intersecting them are read.
+        mask (shapely.Geometry, geopandas.GeoSeries or GeoDataFrame): Only
+            shapes intersecting the mask are read. GeoSeries and GeoDataFrame
+            masks are reprojected to the CRS of the shapefiles.
+        geoids (list): GEOID prefixes, such as two-digit state, five-digit
+            county, or eleven-digit tract GEOIDs; only shapes whose GEOID10
+            starts with one of them are read.
         
     Returns:
-        geopandas.GeoDataFrame: Shapes for the states of interest.
+        geopandas.GeoDataFrame: Shapes for the states of interest, with the
+        row numbers of each shapefile as index.
     """
     # Directory with raw shapefiles.
     datadir = utils.DATA["shapefiles-census"]
@@ -137,12 +233,65 @@ def read_shapefiles(states=None, fips=None, glob=None):
             raise BadPathError(f"File {path} doesn't have extension '.shp'")
         
     # Read the data.
+    if cache and paths:
+        return _read_shapefile_store(shapefile_store(), paths, bbox, mask,
+                                     geoids)
     chunks = []
     for path in paths:
-        chunks.append(geopandas.read_file(path))
+        if bbox is None:
+            chunk = geopandas.read_file(path)
+        else:
+            # Keep the row numbers of the shapefile as index.
+            chunk = geopandas.read_file(path, bbox=bbox, fid_as_index=True)
+            chunk.index.name = None
+        chunks.append(_filter_shapes(chunk, bbox, mask, geoids))
     return pd.concat(chunks)    
 
 
+def shapefile_store():
+    """Get the path to an up-to-date GeoParquet store of the tract shapefiles.
+
+    The store holds the shapes of every shapefile read by
+    :func:`read_shapefiles`, in file name order. The shapes of each file are
+    sorted by GEOID and split into row groups of at most
+    _STORE_ROW_GROUP_SIZE shapes, with their shapefile row numbers in a *_row*
+    column and their bounding boxes in a GeoParquet *bbox* covering column.
+    It is kept in the ``.cache`` directory of the shapefiles (see
+    :mod:`src.data.cache`) and is rebuilt if a shapefile was added, removed,
+    or changed (by the size, modification time, and hash of its .shp and .dbf
+    files).
+
+    Returns:
+        pathlib.Path: The store.
+    """
+    datadir = utils.DATA["shapefiles-census"]
+    path = datadir / raw_cache.CACHE_DIR / SHAPEFILE_STORE
+    meta_path = path.with_suffix(".json")
+
+    meta = {}
+    if meta_path.exists() and path.exists():
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    keys = {"version": _STORE_VERSION}
+    for shapefile in sorted(datadir.glob("*.shp")):
+        for source in [shapefile, shapefile.with_suffix(".dbf")]:
+            if source.exists():
+                keys[source.name] = raw_cache.file_key(
+                    source, known=meta.get(source.name))
+    if keys == meta:
+        return path
+
+    path.parent.mkdir(exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    _write_shapefile_store(sorted(datadir.glob("*.shp")), temp_path)
+    os.replace(temp_path, path)
+    with open(meta_path.with_suffix(".tmp"), "w") as f:
+        json.dump(keys, f)
+    os.replace(meta_path.with_suffix(".tmp"), meta_path)
+    return path
+
+
 def read_fire_stations():
     """Read raw fire station data.
 
@@ -153,17 +302,48 @@ def read_fire_stations():
     return pd.read_csv(path)
 
 
-def read_nfirs(data_dir):
+def read_nfirs(data_dir, chunksize=None, cache=False):
     """
     Read single year of raw nfirs data.
-    
+
+    By default the three tables are read in full. If `chunksize` is given,
+    the tables are streamed `chunksize` rows at a time instead, keeping only
+    the columns in NFIRS_COLUMNS and only the rows that can survive
+    :func:`src.data.nfirs.ingest_raw_nfirs_data`:
+
+    - basic rows are de-duplicated on NFIRS_KEYS and filtered to home fires
+      (see :func:`is_home_fire`) chunk by chunk.
+    - address and fire rows are kept only if their NFIRS_KEYS match a
+      surviving basic row.
+
+    Peak memory is then bounded by the home fire subset (plus an 8 byte key
+    hash per raw basic row) rather than by the raw files.
+
+    If `cache` is True, the tables are read from typed Parquet copies kept by
+    :mod:`src.data.cache` instead of the raw text files. The copies are made
+    on the first read and rebuilt whenever a raw file changes. Cached columns
+    are typed as in NFIRS_DTYPES (str for all others) in both modes.
+
     Args:
         data_dir: nfirs directory with one year of data
-    
+        chunksize (int): Number of rows to read at a time, or None to read
+            the full tables.
+        cache (bool): Read from (and if needed create) the columnar cache.
+
     Returns:
         nfirs_dict: dictionary containing raw basic, address, and fire dataframes
     """
-    
+    if chunksize is not None:
+        return _stream_nfirs(data_dir, chunksize, cache)
+
+    if cache:
+        nfirs_dict = {}
+        for table, fname in NFIRS_FILES.items():
+            path = os.path.join(data_dir, fname)
+            nfirs_dict[table] = next(_read_nfirs_chunks(path, None, None,
+                                                        True))
+        return nfirs_dict
+
     # Read tables and switch columns to lower case
     basic = pd.read_csv(os.path.join(data_dir, 'basicincident.txt'), sep = '^', encoding = 'latin-1', low_memory = False)
     address = pd.read_csv(os.path.join(data_dir, 'incidentaddress.txt'), sep = '^', encoding = 'latin-1', low_memory = False)
@@ -175,4 +355,296 @@ def read_nfirs(data_dir):
     
     nfirs_dict = {'basic':basic, 'address':address, 'fire':fire}
     
-    return(nfirs_dict)
\ No newline at end of file
+    return(nfirs_dict)
+
+
+def is_home_fire(basic):
+    """Identify home fires in the raw NFIRS basic incident table.
+
+    Home fires have an incident type in HOME_FIRE_INC_TYPES and a property use
+    code starting with '4' (residential).
+
+    Args:
+        basic (pandas.DataFrame): Raw basic incident data.
+
+    Returns:
+        pandas.Series: Boolean mask, True for home fires.
+    """
+    mask1 = basic['inc_type'].isin(HOME_FIRE_INC_TYPES)
+    mask2 = basic['prop_use'].astype('string').str.startswith('4')
+    return mask1 & mask2.fillna(False).astype(bool)
+
+
+def hash_nfirs_keys(df):
+    """Hash the NFIRS primary key columns of each row to a 64-bit integer.
+
+    Args:
+        df (pandas.DataFrame): NFIRS data with the NFIRS_KEYS columns.
+
+    Returns:
+        numpy.ndarray: uint64 hash values, one per row.
+    """
+    return pd.util.hash_pandas_object(df[NFIRS_KEYS], index=False).values
+
+
+def _read_nfirs_chunks(path, columns, chunksize, cache=False):
+    """Iterate over a raw NFIRS table in chunks with lower case columns.
+
+    Only `columns` (all columns if None) are parsed, with the dtypes in
+    NFIRS_DTYPES so that every chunk has the same schema regardless of its
+    content. With `cache`, the chunks come from the table's Parquet copy.
+    """
+    if cache:
+        path = raw_cache.cached_path(path, _convert_nfirs)
+        if columns is not None:
+            names = pq.read_schema(path).names
+            columns = [name for name in names if name in columns]
+        yield from raw_cache.read_chunks(path, columns, chunksize)
+        return
+
+    header = pd.read_csv(path, sep='^', encoding='latin-1', nrows=0).columns
+    if columns is None:
+        names = list(header)
+    else:
+        names = [name for name in header if name.lower() in columns]
+    dtype = {name: NFIRS_DTYPES.get(name.lower(), str) for name in names}
+    reader = pd.read_csv(path, sep='^', encoding='latin-1', usecols=names,
+                         dtype=dtype, chunksize=chunksize)
+    for chunk in ([reader] if chunksize is None else reader):
+        chunk.columns = chunk.columns.str.lower()
+        yield chunk
+
+
+def _write_shapefile_store(paths, destination):
+    """Write shapefiles to one GeoParquet file with small row groups."""
+    frames = [geopandas.read_file(path) for path in paths]
+    crs = next((frame.crs for frame in frames if frame.crs is not None), None)
+    tables = []
+    for frame in frames:
+        frame = frame.assign(_row=np.arange(len(frame)))
+        if "GEOID10" in frame.columns:
+            frame = frame.sort_values("GEOID10", kind="stable")
+        bounds = shapely.bounds(frame.geometry.values)
+        table = pa.Table.from_pandas(
+            pd.DataFrame(frame.drop(columns="geometry")),
+            preserve_index=False)
+        table = table.append_column("bbox", pa.StructArray.from_arrays(
+            [pa.array(bounds[:, i]) for i in range(4)],
+            ["xmin", "ymin", "xmax", "ymax"]))
+        tables.append(table.append_column(
+            "geometry", pa.array(shapely.to_wkb(frame.geometry.values),
+                                 pa.binary())))
+    table = pa.concat_tables(tables, promote_options="permissive")
+
+    # GeoParquet metadata, so the store can also be read with
+    # geopandas.read_parquet.
+    geometry = geopandas.GeoSeries(
+        shapely.from_wkb(table["geometry"].to_numpy(zero_copy_only=False)))
+    geo = {
+        "version": "1.1.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {
+            "encoding": "WKB",
+            "geometry_types": sorted(geometry.geom_type.dropna().unique()),
+            "crs": crs.to_json_dict() if crs is not None else None,
+            "bbox": list(geometry.total_bounds),
+            "covering": {"bbox": {name: ["bbox", name] for name
+                                  in ["xmin", "ymin", "xmax", "ymax"]}},
+        }},
+    }
+    files = [{"name": path.name, "rows": len(frame),
+              "row_groups": -(-len(frame) // _STORE_ROW_GROUP_SIZE)}
+             for path, frame in zip(paths, frames)]
+    schema = table.schema.with_metadata({
+        "geo": json.dumps(geo), "files": json.dumps(files)})
+
+    with pq.ParquetWriter(destination, schema) as writer:
+        offset = 0
+        for frame in frames:
+            # Row groups never span files.
+            for start in range(0, len(frame), _STORE_ROW_GROUP_SIZE):
+                rows = min(_STORE_ROW_GROUP_SIZE, len(frame) - start)
+                writer.write_table(table.slice(offset + start, rows),
+                                   row_group_size=rows)
+            offset += len(frame)
+
+
+def _read_shapefile_store(path, paths, bbox=None, mask=None, geoids=None):
+    """Read the shapes of some shapefiles from the GeoParquet store."""
+    parquet = pq.ParquetFile(path)
+    metadata = parquet.schema_arrow.metadata
+    files = json.loads(metadata[b"files"])
+    geo = json.loads(metadata[b"geo"])["columns"]["geometry"]
+    crs = geo["crs"] and json.dumps(geo["crs"])
+
+    mask = _mask_geometry(mask, crs)
+    bounds = _query_bounds(bbox, mask)
+
+    # Row groups of each file, in file order.
+    groups, group = {}, 0
+    for file in files:
+        groups[file["name"]] = list(range(group, group + file["row_groups"]))
+        group += file["row_groups"]
+    tables = []
+    for path in paths:
+        selected = [group for group in groups.get(path.name, [])
+                    if _row_group_matches(parquet.metadata.row_group(group),
+                                          bounds, geoids)]
+        if selected:
+            tables.append(_read_store_groups(parquet, selected, bounds,
+                                             geoids))
+    table = (pa.concat_tables(tables) if tables
+             else parquet.schema_arrow.empty_table())
+
+    df = table.drop_columns(["geometry", "bbox", "_row"]).to_pandas()
+    df.index = table["_row"].to_numpy()
+    geometry = geopandas.GeoSeries.from_wkb(
+        table["geometry"].to_numpy(zero_copy_only=False), index=df.index,
+        crs=crs)
+    df = geopandas.GeoDataFrame(df, geometry=geometry)
+    return _filter_shapes(df, bbox, mask, None)
+
+
+def _read_store_groups(parquet, groups, bounds, geoids):
+    """Read the row groups of one file that can match the filters."""
+    tables = []
+    for group in groups:
+        table = parquet.read_row_group(group)
+        keep = np.ones(len(table), dtype=bool)
+        if bounds is not None:
+            box = table["bbox"].combine_chunks()
+            keep &= ((box.field("xmin").to_numpy() <= bounds[2])
+                     & (box.field("xmax").to_numpy() >= bounds[0])
+                     & (box.field("ymin").to_numpy() <= bounds[3])
+                     & (box.field("ymax").to_numpy() >= bounds[1]))
+        if geoids is not None:
+            keep &= _geoid_matches(table["GEOID10"].to_numpy(
+                zero_copy_only=False), geoids)
+        tables.append(table.filter(pa.array(keep)))
+    # Restore the order of the shapefile.
+    table = pa.concat_tables(tables)
+    return table.take(pa.array(np.argsort(table["_row"].to_numpy(),
+                                          kind="stable")))
+
+
+def _mask_geometry(mask, crs):
+    """Get the geometry of a mask in a CRS."""
+    if isinstance(mask, (geopandas.GeoSeries, geopandas.GeoDataFrame)):
+        if mask.crs is not None and crs is not None:
+            mask = mask.to_crs(crs)
+        mask = mask.union_all()
+    return mask
+
+
+def _query_bounds(bbox, mask):
+    """Get the bounds that selected shapes must intersect, if any."""
+    bounds = [np.asarray(bbox, dtype=float)] if bbox is not None else []
+    if mask is not None:
+        bounds.append(np.asarray(shapely.bounds(mask)))
+    if not bounds:
+        return None
+    bounds = np.array(bounds)
+    return np.r_[bounds[:, :2].max(axis=0), bounds[:, 2:].min(axis=0)]
+
+
+def _row_group_matches(row_group, bounds, geoids):
+    """Check whether the statistics of a row group allow matching shapes."""
+    stats = {}
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        if column.is_stats_set and column.statistics.has_min_max:
+            stats[column.path_in_schema] = (column.statistics.min,
+                                            column.statistics.max)
+    if bounds is not None and all(f"bbox.{name}" in stats for name
+                                  in ["xmin", "ymin", "xmax", "ymax"]):
+        if (stats["bbox.xmin"][0] > bounds[2]
+                or stats["bbox.xmax"][1] < bounds[0]
+                or stats["bbox.ymin"][0] > bounds[3]
+                or stats["bbox.ymax"][1] < bounds[1]):
+            return False
+    if geoids is not None and "GEOID10" in stats:
+        low, high = stats["GEOID10"]
+        if not any(low[:len(geoid)] <= geoid <= high[:len(geoid)]
+                   for geoid in geoids):
+            return False
+    return True
+
+
+def _geoid_matches(values, geoids):
+    """Check which GEOIDs start with one of some prefixes."""
+    values = pd.Series(values, dtype=object)
+    return values.str.startswith(tuple(geoids)).fillna(False).to_numpy()
+
+
+def _filter_shapes(df, bbox, mask, geoids):
+    """Keep the shapes in a bounding box and a mask, with some GEOIDs."""
+    keep = np.ones(len(df), dtype=bool)
+    if bbox is not None:
+        keep &= shapely.intersects(df.geometry.values, shapely.box(*bbox))
+    mask = _mask_geometry(mask, df.crs)
+    if mask is not None:
+        keep &= shapely.intersects(df.geometry.values, mask)
+    if geoids is not None:
+        keep &= _geoid_matches(df["GEOID10"].to_numpy(), geoids)
+    return df[keep]
+
+
+def _convert_nfirs(source, destination, chunksize=500_000):
+    """Convert a raw NFIRS table to Parquet, one row group per chunk."""
+    writer = None
+    for chunk in _read_nfirs_chunks(source, None, chunksize):
+        if writer is None:
+            schema = _nfirs_arrow_schema(chunk.columns)
+            writer = pq.ParquetWriter(destination, schema)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema,
+                                                preserve_index=False))
+    if writer is None:
+        # A table without rows (e.g. a header-only file) keeps its columns.
+        header = pd.read_csv(source, sep='^', encoding='latin-1', nrows=0)
+        schema = _nfirs_arrow_schema(header.columns.str.lower())
+        pq.write_table(schema.empty_table(), destination)
+    else:
+        writer.close()
+
+
+def _nfirs_arrow_schema(columns):
+    """Get the Arrow schema of raw NFIRS columns (see NFIRS_DTYPES)."""
+    return pa.schema([
+        (name, _ARROW_TYPES.get(NFIRS_DTYPES.get(name), pa.string()))
+        for name in columns
+    ])
+
+
+def _stream_nfirs(data_dir, chunksize, cache=False):
+    """Stream one year of raw NFIRS data, keeping only home fires."""
+    # Keep the first occurrence of each key *before* filtering, just like
+    # ingest_raw_nfirs_data does with the full table. The keys of every row
+    # are collected and deduped once at the end, with the home fires of each
+    # chunk and their row positions.
+    keys, chunks, offset = [], [], 0
+    path = os.path.join(data_dir, NFIRS_FILES['basic'])
+    columns = NFIRS_COLUMNS['basic']
+    for chunk in _read_nfirs_chunks(path, columns, chunksize, cache):
+        keys.append(hash_nfirs_keys(chunk))
+        home = np.flatnonzero(is_home_fire(chunk).values)
+        chunks.append((offset + home, chunk.iloc[home]))
+        offset += len(chunk)
+    keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)
+    first = np.zeros(len(keys), dtype=bool)
+    first[np.unique(keys, return_index=True)[1]] = True
+    basic = pd.concat([chunk[first[rows]] for rows, chunk in chunks],
+                      ignore_index=True)
+    del keys, first
+
+    # Semi-join the other tables against the surviving keys.
+    keep = np.unique(hash_nfirs_keys(basic))
+    nfirs_dict = {'basic': basic}
+    for table in ['address', 'fire']:
+        path = os.path.join(data_dir, NFIRS_FILES[table])
+        chunks = []
+        columns = NFIRS_COLUMNS[table]
+        for chunk in _read_nfirs_chunks(path, columns, chunksize, cache):
+            chunks.append(chunk[np.isin(hash_nfirs_keys(chunk), keep)])
+        nfirs_dict[table] = pd.concat(chunks, ignore_index=True)
+
+    return nfirs_dict
@@ -0,0 +1,363 @@
+"""Offline geocoding with Census TIGER/Line address ranges.
+
+The Census batch geocoder (used by :mod:`src.data.geocode_nfirs`) matches
+addresses against the TIGER/Line address ranges of street edges and
+interpolates the house number along the matched edge. This module does the
+same locally, so that a year of NFIRS addresses can be geocoded without
+network access.
+
+The geocoder reads two kinds of TIGER/Line shapefiles:
+
+- Address range features (``tl_{year}_{ssccc}_addrfeat.shp``, one file per
+  county), with the street name, ZIP code, and from/to house numbers of each
+  side of each street edge.
+- Tabulation blocks (``tl_2010_{ss}_tabblock10.shp``, one file per state),
+  used to find the 2010 Census block of each geocoded point. The blocks of
+  each state are indexed once, in a :class:`src.data.geoids.GeoidIndex`.
+
+Both are expected in ``utils.DATA["shapefiles-tiger"]`` by default.
+
+Street names are standardized with :func:`src.data.address
+.standardize_address` and combined with the ZIP code (or, as a fallback, the
+state) and the house number parity into an integer key. The ranges are sorted
+by key and first house number, so each address is matched with a vectorized
+binary search, and the house number is then interpolated along the matched
+edges all at once. ::
+
+    from src.data.tiger_geocoder import TigerGeocoder
+
+    geocoder = TigerGeocoder.from_files()
+    geocodes = geocoder.geocode(df)
+
+The result has the same columns as the Census batch geocoder output read by
+:func:`src.data.geocode_nfirs.consolidate_geocodes`.
+
+Attributes:
+    GEOCODE_COLUMNS (list): Columns of the geocoder output (see
+        :data:`src.data.interim.GEOCODE_COLUMNS`).
+
+"""
+import pathlib
+import re
+import warnings
+
+import geopandas
+import numpy as np
+import pandas as pd
+from src import utils
+from src.data import raw
+from src.data.address import standardize_address
+from src.data.geoids import GeoidIndex
+from src.data.interim import GEOCODE_COLUMNS
+
+
+# Number of overlapping ranges checked before the closest one for each
+# address. Ranges on the same side of a street rarely overlap.
+_OVERLAPS = 4
+
+
+# Map state abbreviations to FIPS codes, including lower case abbreviations.
+_STATE_FIPS = {**raw.STATES,
+               **{state.lower(): code for state, code in raw.STATES.items()}}
+
+
+class TigerGeocoder:
+    """Geocode addresses against TIGER/Line address ranges.
+
+    Args:
+        ranges (geopandas.GeoDataFrame): Address ranges, one row per side of
+            each street edge, as returned by :func:`read_address_ranges`.
+        blocks (geopandas.GeoDataFrame or dict): Census blocks with columns
+            *STATEFP10*, *COUNTYFP10*, *TRACTCE10*, and *BLOCKCE10* (or
+            their indexes by state, see :func:`index_blocks`), or None to
+            leave the tract and block of each match missing.
+    """
+
+    def __init__(self, ranges, blocks=None):
+        self.ranges = ranges.reset_index(drop=True)
+        if isinstance(blocks, pd.DataFrame):
+            blocks = index_blocks(blocks, self.ranges.crs)
+        self.blocks = blocks
+        self._indexes = {
+            level: _build_index(self.ranges, level)
+            for level in ["zip", "statefp"]
+        }
+
+    @classmethod
+    def from_files(cls, addrfeat=None, blocks=None):
+        """Create a geocoder from TIGER/Line shapefiles.
+
+        Args:
+            addrfeat (list): Paths to address range feature shapefiles
+                (default: all ``*_addrfeat.shp`` files in the TIGER
+                directory).
+            blocks (list): Paths to tabulation block shapefiles (default: all
+                ``*_tabblock10.shp`` files in the TIGER directory).
+
+        Returns:
+            TigerGeocoder: The geocoder.
+        """
+        datadir = utils.DATA["shapefiles-tiger"]
+        if addrfeat is None:
+            addrfeat = sorted(datadir.glob("*_addrfeat.shp"))
+        if blocks is None:
+            blocks = sorted(datadir.glob("*_tabblock10.shp"))
+        ranges = read_address_ranges(addrfeat)
+        # Index one state at a time, so only one state's blocks are ever
+        # held as a data frame.
+        indexes = {}
+        for path in blocks:
+            indexes.update(index_blocks(geopandas.read_file(path),
+                                        ranges.crs))
+        return cls(ranges, indexes or None)
+
+    def geocode(self, df):
+        """Geocode addresses.
+
+        Each address is first matched on street name, house number, and ZIP
+        code (``matchtype`` "Exact"). Addresses without a ZIP code match are
+        then matched on street name and house number within their state
+        ("Non_Exact").
+
+        Args:
+            df (pandas.DataFrame): Addresses, with columns *id*, *address*
+                (house number and street), *city*, *state*, and *zip*, as in
+                the Census batch geocoder input.
+
+        Returns:
+            pandas.DataFrame: The GEOCODE_COLUMNS, one row per input row.
+        """
+        df = df.reset_index(drop=True)
+        number, street = parse_address(df["address"])
+        statefp = df["state"].map(_STATE_FIPS)
+        zipcode = df["zip"].astype("string").str.strip().str[:5]
+
+        match = np.full(len(df), -1, dtype=np.int64)
+        matchtype = np.full(len(df), None, dtype=object)
+        for level, values, name in [("zip", zipcode, "Exact"),
+                                    ("statefp", statefp, "Non_Exact")]:
+            todo = np.flatnonzero((match < 0) & number.notna().to_numpy()
+                                  & values.notna().to_numpy())
+            found = _search(self._indexes[level], street.iloc[todo],
+                            values.iloc[todo], number.iloc[todo])
+            match[todo] = found
+            matchtype[todo[found >= 0]] = name
+
+        return self._result(df, number, match, matchtype)
+
+    def _result(self, df, number, match, matchtype):
+        matched = match >= 0
+        ranges = self.ranges.iloc[match[matched]]
+        result = pd.DataFrame({
+            "id": df["id"].astype(str),
+            "address": (df["address"].astype(str) + ", "
+                        + df["city"].astype(str) + ", "
+                        + df["state"].astype(str) + ", "
+                        + df["zip"].astype(str)),
+            "match": matched,
+            "matchtype": matchtype,
+        })
+        for name in GEOCODE_COLUMNS[4:]:
+            result[name] = np.nan if name in ["lat", "lon"] else None
+        if not matched.any():
+            return result[GEOCODE_COLUMNS]
+
+        # Interpolate the house number along the matched edges.
+        numbers = number.to_numpy(dtype=np.float64)[matched]
+        first = ranges["from_hn"].to_numpy(dtype=np.float64)
+        last = ranges["to_hn"].to_numpy(dtype=np.float64)
+        span = last - first
+        fraction = np.divide(numbers - first, span,
+                             out=np.full(len(span), 0.5), where=span != 0)
+        with warnings.catch_warnings():
+            # Edges are short, so interpolating in degrees (as the Census
+            # geocoder does) is accurate enough.
+            warnings.filterwarnings("ignore",
+                                    "Geometry is in a geographic CRS")
+            points = ranges.geometry.interpolate(fraction, normalized=True)
+
+        rows = np.flatnonzero(matched)
+        result.loc[rows, "parsed"] = (number.iloc[rows].astype(str).to_numpy()
+                                      + " " + ranges["street"].to_numpy()
+                                      + ", " + ranges["zip"].fillna("")
+                                      .to_numpy())
+        result.loc[rows, "tigerlineid"] = ranges["tlid"].to_numpy()
+        result.loc[rows, "side"] = ranges["side"].to_numpy()
+        result.loc[rows, "statefp"] = ranges["statefp"].to_numpy()
+        result.loc[rows, "countyfp"] = ranges["countyfp"].to_numpy()
+        result.loc[rows, "lat"] = points.y.to_numpy()
+        result.loc[rows, "lon"] = points.x.to_numpy()
+
+        if self.blocks is not None:
+            blocks = _find_blocks(points, ranges["statefp"].to_numpy(),
+                                  self.blocks)
+            for name in ["statefp", "countyfp", "tract", "block"]:
+                found = blocks[name].notna().to_numpy()
+                result.loc[rows[found], name] = blocks[name][found].to_numpy()
+        return result[GEOCODE_COLUMNS]
+
+
+def read_address_ranges(paths):
+    """Read TIGER/Line address range feature shapefiles.
+
+    Args:
+        paths (list): Paths to ``tl_{year}_{ssccc}_addrfeat.shp`` files.
+
+    Returns:
+        geopandas.GeoDataFrame: One row per side of each street edge with
+        numeric house numbers, with columns *tlid*, *side* ("L" or "R"),
+        *street* (the standardized street name), *zip*, *from_hn*, *to_hn*,
+        *statefp*, *countyfp*, and the edge geometry.
+    """
+    chunks = []
+    for path in paths:
+        edges = geopandas.read_file(path)
+        county = re.search(r"_(\d{5})_addrfeat", pathlib.Path(path).name)
+        for side in ["L", "R"]:
+            chunk = geopandas.GeoDataFrame({
+                "tlid": edges["TLID"].astype("int64").astype(str),
+                "side": side,
+                "street": edges["FULLNAME"],
+                "zip": edges[f"ZIP{side}"],
+                "from_hn": pd.to_numeric(edges[f"{side}FROMHN"],
+                                         errors="coerce"),
+                "to_hn": pd.to_numeric(edges[f"{side}TOHN"], errors="coerce"),
+                "statefp": county.group(1)[:2] if county else None,
+                "countyfp": county.group(1)[2:] if county else None,
+            }, geometry=edges.geometry, crs=edges.crs)
+            chunks.append(chunk.dropna(subset=["street", "from_hn", "to_hn"]))
+    ranges = pd.concat(chunks, ignore_index=True)
+    ranges["street"] = standardize_address(ranges["street"])
+    for name in ["from_hn", "to_hn"]:
+        ranges[name] = ranges[name].astype(np.int64)
+    return ranges.to_crs("EPSG:4269")
+
+
+def index_blocks(blocks, crs="EPSG:4269"):
+    """Index Census blocks by state.
+
+    Args:
+        blocks (geopandas.GeoDataFrame): Census blocks with columns
+            *STATEFP10*, *COUNTYFP10*, *TRACTCE10*, and *BLOCKCE10*.
+        crs: Coordinate system of the points to look up.
+
+    Returns:
+        dict: A :class:`src.data.geoids.GeoidIndex` of the blocks of each
+        state, keyed by state FIPS code, with the 15-digit block GEOIDs.
+    """
+    blocks = blocks.to_crs(crs)
+    geoid = (blocks["STATEFP10"] + blocks["COUNTYFP10"]
+             + blocks["TRACTCE10"] + blocks["BLOCKCE10"]).to_numpy()
+    return {code: GeoidIndex(geoid[rows], blocks.geometry.values[rows])
+            for code, rows in blocks.groupby("STATEFP10").indices.items()}
+
+
+def parse_address(address):
+    """Split addresses into house number and standardized street name.
+
+    Args:
+        address (pandas.Series): Addresses starting with a house number,
+            e.g. "123 N Main Street".
+
+    Returns:
+        tuple: The house numbers (pandas.Series of nullable integers, missing
+        if the address doesn't start with a number, or if the number is not
+        below 2**32) and the standardized street names (pandas.Series of
+        str). Addresses without a house number are all street name.
+    """
+    standardized = standardize_address(address).fillna("")
+    parts = standardized.str.extract(r"^(\d+)[A-Z]?\s+(.*)$")
+    # Numbers too big for the index keys (see _combined) are not house
+    # numbers; floats hold every smaller number exactly.
+    number = pd.to_numeric(parts[0], errors="coerce").astype(np.float64)
+    number = number.where(np.isfinite(number) & (number >= 0)
+                          & (number < 2**32))
+    street = parts[1].where(parts[0].notna(), standardized)
+    return number.astype("Int64"), street
+
+
+def _build_index(ranges, level):
+    """Sort the ranges by (street, `level`, parity) key and first number."""
+    first = np.minimum(ranges["from_hn"], ranges["to_hn"]).to_numpy()
+    last = np.maximum(ranges["from_hn"], ranges["to_hn"]).to_numpy()
+    # Ranges with mixed parity are indexed under both parities.
+    parities = ranges["from_hn"].to_numpy() % 2
+    mixed = parities != ranges["to_hn"].to_numpy() % 2
+    rows = np.concatenate([np.arange(len(ranges)), np.flatnonzero(mixed)])
+    parities = np.concatenate([parities, 1 - parities[mixed]])
+    known = ranges[level].notna().to_numpy()[rows]
+    rows, parities = rows[known], parities[known]
+
+    keys = pd.MultiIndex.from_arrays([
+        ranges["street"].to_numpy()[rows],
+        ranges[level].astype(str).to_numpy()[rows],
+        parities,
+    ])
+    codes, uniques = pd.factorize(keys)
+    order = np.lexsort((first[rows], codes))
+    return {
+        "keys": pd.Index(uniques),
+        "codes": codes[order],
+        "first": first[rows][order],
+        "last": last[rows][order],
+        "rows": rows[order],
+    }
+
+
+def _search(index, street, values, number):
+    """Find the range of each address in an index, or -1 if none."""
+    found = np.full(len(street), -1, dtype=np.int64)
+    if len(street) == 0:
+        return found
+    number = number.to_numpy(dtype=np.int64)
+    keys = pd.MultiIndex.from_arrays([street.to_numpy(),
+                                      values.astype(str).to_numpy(),
+                                      number % 2])
+    codes = index["keys"].get_indexer(keys)
+    known = np.flatnonzero(codes >= 0)
+    codes, number = codes[known], number[known]
+
+    # Find the last range of the same key starting at or below each number,
+    # then check it and the few ranges before it for one that covers it.
+    position = np.searchsorted(
+        _combined(index["codes"], index["first"]),
+        _combined(codes, number), side="right") - 1
+    for offset in range(_OVERLAPS):
+        candidate = position - offset
+        valid = candidate >= 0
+        candidate = np.where(valid, candidate, 0)
+        hit = (valid & (found[known] < 0)
+               & (index["codes"][candidate] == codes)
+               & (index["last"][candidate] >= number))
+        found[known[hit]] = index["rows"][candidate[hit]]
+    return found
+
+
+def _combined(codes, numbers):
+    # House numbers are below 2**32, so (code, number) pairs sort as one int.
+    return (codes.astype(np.int64) << 32) + numbers.astype(np.int64)
+
+
+def _find_blocks(points, statefp, indexes):
+    """Find the Census block containing each point."""
+    lon, lat = points.x.to_numpy(), points.y.to_numpy()
+    geoid = np.full(len(points), None, dtype=object)
+    # Look points up in the blocks of the state of their range first, then
+    # look up the rest (e.g. points across a state line) in every state.
+    for code, index in indexes.items():
+        todo = np.flatnonzero(statefp == code)
+        if len(todo):
+            geoid[todo] = index.assign(lon[todo],
+                                       lat[todo])["geoid"].to_numpy()
+    for index in indexes.values():
+        todo = np.flatnonzero(pd.isna(geoid))
+        if not len(todo):
+            break
+        geoid[todo] = index.assign(lon[todo], lat[todo])["geoid"].to_numpy()
+    geoid = pd.Series(geoid, dtype="string")
+    return pd.DataFrame({
+        "statefp": geoid.str[:2],
+        "countyfp": geoid.str[2:5],
+        "tract": geoid.str[5:11],
+        "block": geoid.str[11:15],
+    })
@@ -0,0 +1,145 @@
+"""A persistent index of NFIRS incident ids.
+
+NFIRS data are re-released and resubmitted, so the same incident can show up
+again in a later load of the same year or in another year. This module keeps
+an on-disk index of the ``unique_id`` values (state, fdid, date, incident
+number, exposure number) of each cleaned NFIRS year. It answers "have we seen
+these incidents before, and where?" for millions of ids at a time without
+reading the cleaned data.
+
+Each year's index is a pair of NumPy files in ``Data/interim/nfirs/
+unique_id_index``: the sorted 64-bit hashes of the year's ids and the row
+position of each hash in the cleaned data. Reads are memory-mapped, and
+membership tests are vectorized binary searches.
+
+- :func:`src.data.unique_id_index.build` writes the index for a year.
+- :func:`src.data.unique_id_index.contains` tests which ids are indexed.
+- :func:`src.data.unique_id_index.lookup` finds the year and row of ids.
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from src import utils
+
+
+def index_dir():
+    """Get the directory with the unique id index files.
+
+    Returns:
+        pathlib.Path: The directory.
+    """
+    return utils.DATA["interim"] / "nfirs" / "unique_id_index"
+
+
+def hash_ids(ids):
+    """Hash NFIRS unique ids to 64-bit integers.
+
+    Args:
+        ids (array-like): unique_id strings.
+
+    Returns:
+        numpy.ndarray: uint64 hashes, one per id.
+    """
+    return pd.util.hash_array(np.asarray(ids, dtype=object))
+
+
+def build(ids, year):
+    """Write the unique id index for a year of cleaned NFIRS data.
+
+    Args:
+        ids (array-like): The year's unique_id values, in row order.
+        year (int or str): The year.
+
+    Returns:
+        int: The number of ids indexed.
+    """
+    hashes = hash_ids(ids)
+    rows = np.argsort(hashes, kind="stable")
+
+    directory = index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, values in [(f"{year}.npy", hashes[rows]),
+                         (f"{year}_rows.npy", rows.astype(np.int64))]:
+        temp_path = directory / f"{name}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, values)
+        os.replace(temp_path, directory / name)
+    return len(hashes)
+
+
+def read(year):
+    """Memory-map the unique id index for a year.
+
+    Args:
+        year (int or str): The year.
+
+    Returns:
+        tuple: The sorted uint64 hashes and the row position of each hash.
+    """
+    directory = index_dir()
+    hashes = np.load(directory / f"{year}.npy", mmap_mode="r")
+    rows = np.load(directory / f"{year}_rows.npy", mmap_mode="r")
+    return hashes, rows
+
+
+def indexed_years():
+    """List the years with a unique id index.
+
+    Returns:
+        list: Year strings, sorted.
+    """
+    directory = index_dir()
+    if not directory.exists():
+        return []
+    return sorted(path.stem for path in directory.glob("*.npy")
+                  if not path.stem.endswith("_rows"))
+
+
+def contains(ids, years=None):
+    """Test which ids appear in the index.
+
+    Args:
+        ids (array-like): unique_id strings.
+        years (list): Years to search, or None for all indexed years.
+
+    Returns:
+        numpy.ndarray: Boolean array, True for ids found in any of the years.
+    """
+    return lookup(ids, years=years)["year"].notna().to_numpy()
+
+
+def lookup(ids, years=None):
+    """Find where ids appear in the cleaned NFIRS data.
+
+    If an id appears in more than one year, the earliest year is returned.
+
+    Args:
+        ids (array-like): unique_id strings.
+        years (list): Years to search, or None for all indexed years.
+
+    Returns:
+        pandas.DataFrame: Columns *year* (the year the id appears in, or
+        missing) and *row* (its row position in that year's cleaned data),
+        one row per id.
+    """
+    hashes = hash_ids(ids)
+    found_year = np.full(len(hashes), None, dtype=object)
+    found_row = np.full(len(hashes), -1, dtype=np.int64)
+    years = indexed_years() if years is None else sorted(map(str, years))
+
+    for year in years:
+        index, rows = read(year)
+        missing = np.flatnonzero(found_row < 0)
+        if len(missing) == 0 or len(index) == 0:
+            continue
+        positions = np.searchsorted(index, hashes[missing])
+        positions = np.minimum(positions, len(index) - 1)
+        hits = index[positions] == hashes[missing]
+        found_year[missing[hits]] = year
+        found_row[missing[hits]] = rows[positions[hits]]
+
+    found_row = pd.array(found_row, dtype="Int64")
+    found_row[found_row < 0] = pd.NA
+    return pd.DataFrame({"year": found_year, "row": found_row})
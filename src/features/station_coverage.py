@@ -0,0 +1,172 @@
+"""Fire station coverage features of Census block groups and tracts.
+
+Beyond the distance to the nearest fire station, the fire risk models use the
+density of fire stations around each area: the distances to its k nearest
+stations, and the number of stations within some distances of it. This module
+builds these features for every 2010 Census block group (or tract), at its
+centroid and, optionally, at its center of population, in one pass over all
+areas with the spatial index of :mod:`src.features.station_distance`.
+
+The stations are the processed fire station data (see
+:func:`src.data.fire_stations.read`), and the areas are the polygons of the
+block group (or tract) shapefiles (see :mod:`src.data.geoids`). Centers of
+population are read from the Census files of the 2010 centers of population
+by block group or tract (e.g. ``CenPop2010_Mean_BG.txt``).
+
+Features are cached in ``Data/processed/fire-station-coverage``, keyed by the
+hash of the fire station file and the feature options, so they are only
+rebuilt when the stations change. ::
+
+    $ python -m src.features.station_coverage \\
+        --population-centers CenPop2010_Mean_BG.txt
+
+Attributes:
+    RADII (list): Default distances in miles to count stations within.
+
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+import shapely
+from src import profiling, utils
+from src.data import cache, fire_stations, geoids
+from src.features.station_distance import StationIndex
+
+
+RADII = [1, 3, 5, 10]
+
+# Directory of cached coverage features.
+CACHE_DIR = utils.DATA["processed"] / "fire-station-coverage"
+
+
+def centroids(level="block_group"):
+    """Find the centroids of the block groups (or tracts) of every state.
+
+    Args:
+        level (str): Geography level (see src.data.geoids.LEVELS).
+
+    Returns:
+        pandas.DataFrame: The *lon* and *lat* of each centroid, indexed by
+        *GEOID*.
+    """
+    chunks = []
+    for code in geoids.state_codes(level):
+        index = geoids.GeoidIndex.from_state(code, level)
+        points = shapely.centroid(index.polygons)
+        chunks.append(pd.DataFrame({"GEOID": index.geoids,
+                                    "lon": shapely.get_x(points),
+                                    "lat": shapely.get_y(points)}))
+    return pd.concat(chunks, ignore_index=True).set_index("GEOID")
+
+
+def read_population_centers(path):
+    """Read a Census file of centers of population.
+
+    Args:
+        path (path-like): A block group or tract centers of population file,
+            with columns STATEFP, COUNTYFP, TRACTCE, (BLKGRPCE,) LATITUDE,
+            and LONGITUDE.
+
+    Returns:
+        pandas.DataFrame: The *lon* and *lat* of each center, indexed by
+        *GEOID*.
+    """
+    df = pd.read_csv(path, dtype=str, encoding="utf-8-sig")
+    df.columns = df.columns.str.strip()
+    parts = [name for name in ["STATEFP", "COUNTYFP", "TRACTCE", "BLKGRPCE"]
+             if name in df.columns]
+    return pd.DataFrame({
+        "GEOID": df[parts].sum(axis=1),
+        "lon": df["LONGITUDE"].astype(float),
+        "lat": df["LATITUDE"].astype(float),
+    }).set_index("GEOID")
+
+
+def coverage_features(points, stations, k=5, radii=RADII, n_jobs=4):
+    """Calculate fire station coverage features of points.
+
+    Args:
+        points (pandas.DataFrame): Points with columns *lon* and *lat*.
+        stations (pandas.DataFrame or StationIndex): Fire station data (see
+            :meth:`src.features.station_distance.StationIndex.from_stations`)
+            or an index of it.
+        k (int): Number of nearest stations.
+        radii (list): Distances in miles to count stations within.
+        n_jobs (int): Number of chunks of points queried at once.
+
+    Returns:
+        pandas.DataFrame: The distances to the k nearest stations
+        (*distance_1* to *distance_{k}*) and the station counts
+        (*within_{radius}*) of each point, with the index of `points`.
+    """
+    if not isinstance(stations, StationIndex):
+        stations = StationIndex.from_stations(stations)
+    lon, lat = points["lon"].to_numpy(), points["lat"].to_numpy()
+    return pd.concat([
+        stations.k_nearest(lon, lat, k=k, n_jobs=n_jobs),
+        stations.within(lon, lat, radii=radii, n_jobs=n_jobs),
+    ], axis=1).set_index(points.index)
+
+
+@profiling.instrument("station_coverage.build_coverage_features")
+def build_coverage_features(level="block_group", k=5, radii=RADII,
+                            population_centers=None, n_jobs=4,
+                            use_cache=True):
+    """Build the fire station coverage features of every block group (or
+    tract).
+
+    Args:
+        level (str): Geography level (see src.data.geoids.LEVELS).
+        k (int): Number of nearest stations.
+        radii (list): Distances in miles to count stations within.
+        population_centers (path-like): A Census centers of population file
+            for `level` (see read_population_centers). If given, the features
+            are also calculated at the centers of population, in columns
+            prefixed with "pop_".
+        n_jobs (int): Number of chunks of points queried at once.
+        use_cache (bool): Read the features from the cache if they were
+            built for the same stations and options.
+
+    Returns:
+        pandas.DataFrame: The features (see coverage_features) of each area,
+        indexed by *GEOID*.
+    """
+    options = {"level": level, "k": k, "radii": list(radii)}
+    if population_centers is not None:
+        options["population_centers"] = cache.file_hash(population_centers)
+    key = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+    path = CACHE_DIR / (f"{level}-{cache.file_hash(fire_stations.PATH)[:16]}"
+                        f"-{key.hexdigest()[:8]}.parquet")
+    if use_cache and path.exists():
+        return pd.read_parquet(path)
+
+    stations = StationIndex.from_stations(fire_stations.read())
+    df = coverage_features(centroids(level), stations, k, radii, n_jobs)
+    if population_centers is not None:
+        centers = read_population_centers(population_centers)
+        pop = coverage_features(centers, stations, k, radii, n_jobs)
+        df = df.join(pop.add_prefix("pop_"), how="left")
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.to_parquet(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build fire station coverage features")
+    parser.add_argument("--level", default="block_group",
+                        choices=list(geoids.LEVELS))
+    parser.add_argument("--k", type=int, default=5,
+                        help="number of nearest stations "
+                             "(default %(default)s)")
+    parser.add_argument("--population-centers",
+                        help="Census centers of population file")
+    args = parser.parse_args()
+    df = build_coverage_features(args.level, k=args.k,
+                                 population_centers=args.population_centers)
+    print(df.describe().T)
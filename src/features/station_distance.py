@@ -0,0 +1,287 @@
+"""Distances from points to the nearest fire station.
+
+The distance from a fire, or from the centroid of a block group, to the
+nearest fire station is a feature of the fire risk models. This module builds
+a KD-tree over the locations of all fire stations in the country once, and
+finds the nearest station of any number of points with it, so:
+
+- memory grows with the number of points and stations rather than their
+  product, as it does with a dense matrix of distances,
+- there is no need to split the points by state, and
+- the nearest station may be across a state line.
+
+Locations are indexed as unit vectors in 3D, where the straight-line (chord)
+distance between two points grows with their great-circle distance, so the
+nearest station by chord is the nearest station on the sphere. This is
+several times faster than a BallTree with the haversine metric. Points are
+queried in chunks, and chunks are queried in parallel threads; the KD-tree
+releases the GIL during its queries. ::
+
+    from src.features.station_distance import StationIndex
+
+    index = StationIndex.from_stations(raw.read_fire_stations())
+    nearest = index.nearest(fires["lon"], fires["lat"])
+    coverage = index.within(fires["lon"], fires["lat"], radii=[1, 5])
+
+Besides the nearest station, :meth:`StationIndex.k_nearest` finds the
+distances to the k nearest stations and :meth:`StationIndex.within` counts
+the stations within some distances (see also
+:mod:`src.features.station_coverage`).
+
+Distances are great-circle distances in miles on a sphere with the radius
+EARTH_RADIUS_MILES, calculated with :func:`haversine`, so they equal the
+distances of a brute-force search exactly.
+
+Attributes:
+    EARTH_RADIUS_MILES (float): The radius of the Earth used for distances.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+EARTH_RADIUS_MILES = 3959
+
+
+class StationIndex:
+    """A spatial index of fire station locations.
+
+    Stations at the same location are indexed once; the first of them is the
+    one returned as the nearest station. They are still counted separately
+    by :meth:`k_nearest` and :meth:`within`.
+
+    Args:
+        lon (array-like): Station longitudes.
+        lat (array-like): Station latitudes.
+        ids (array-like): Station ids, one for each station. Defaults to the
+            station positions.
+
+    Raises:
+        ValueError: If no station has coordinates.
+    """
+
+    def __init__(self, lon, lat, ids=None):
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        self.ids = np.arange(len(lon)) if ids is None else np.asarray(ids)
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        if not len(valid):
+            raise ValueError("No station has coordinates")
+
+        # The first station at each distinct location, and the number of
+        # stations there.
+        _, first, counts = np.unique(
+            np.column_stack([lon[valid], lat[valid]]), axis=0,
+            return_index=True, return_counts=True)
+        order = np.argsort(first)
+        self.stations = valid[first[order]]
+        self.counts = counts[order]
+        self.lon = lon[self.stations]
+        self.lat = lat[self.stations]
+        self.tree = cKDTree(unit_vectors(self.lon, self.lat))
+        # Every station, for counting stations within distances.
+        self._all = cKDTree(unit_vectors(lon[valid], lat[valid]))
+
+    @classmethod
+    def from_stations(cls, stations, lon="Longitude", lat="Latitude",
+                      id="ID"):
+        """Create an index of fire station data.
+
+        Args:
+            stations (pandas.DataFrame): Fire stations, such as the output of
+                :func:`src.data.raw.read_fire_stations`.
+            lon (str): Column of longitudes.
+            lat (str): Column of latitudes.
+            id (str): Column of station ids.
+
+        Returns:
+            StationIndex: The index.
+        """
+        return cls(stations[lon], stations[lat], stations[id].to_numpy())
+
+    def nearest(self, lon, lat, chunksize=100_000, n_jobs=4):
+        """Find the nearest station to each point.
+
+        Args:
+            lon (array-like): Point longitudes.
+            lat (array-like): Point latitudes.
+            chunksize (int): Number of points queried at a time.
+            n_jobs (int): Number of chunks queried at once.
+
+        Returns:
+            pandas.DataFrame: The nearest *station_id* and its *distance* in
+            miles, for each point in order. Both are missing for points
+            without coordinates.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        valid, nearest = self._query(
+            lon, lat, lambda points: self.tree.query(points, k=1)[1],
+            chunksize, n_jobs)
+
+        distance = np.full(len(lon), np.nan)
+        distance[valid] = haversine(lon[valid], lat[valid], self.lon[nearest],
+                                    self.lat[nearest])
+        ids = pd.Series(self.ids[self.stations[nearest]], index=valid)
+        if ids.dtype.kind in "iu":
+            ids = ids.astype("Int64")
+        return pd.DataFrame({
+            "station_id": ids.reindex(np.arange(len(lon))).array,
+            "distance": distance,
+        })
+
+    def k_nearest(self, lon, lat, k=5, chunksize=100_000, n_jobs=4):
+        """Find the distances to the k nearest stations of each point.
+
+        Args:
+            lon (array-like): Point longitudes.
+            lat (array-like): Point latitudes.
+            k (int): Number of stations.
+            chunksize (int): Number of points queried at a time.
+            n_jobs (int): Number of chunks queried at once.
+
+        Returns:
+            pandas.DataFrame: The distances in miles to the nearest, second
+            nearest, etc. station of each point, in columns *distance_1* to
+            *distance_{k}*. Distances are missing for points without
+            coordinates, and beyond the number of stations.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+
+        def query(points, rows):
+            # The k nearest locations hold at least k stations.
+            locations = self.tree.query(points, k=k)[1].reshape(len(rows), k)
+            found = locations < len(self.stations)
+            locations = np.where(found, locations, 0)
+            distance = haversine(lon[rows, None], lat[rows, None],
+                                 self.lon[locations], self.lat[locations])
+            distance = np.where(found, distance, np.inf)
+            order = np.argsort(distance, axis=1, kind="stable")
+            distance = np.take_along_axis(distance, order, axis=1)
+            counts = np.where(found, self.counts[locations], 0)
+            counts = np.take_along_axis(counts, order, axis=1).cumsum(axis=1)
+            # The i-th station is at the first location with more than i
+            # stations up to it.
+            result = np.full((len(rows), k), np.nan)
+            for i in range(k):
+                location = (counts <= i).sum(axis=1)
+                has = location < k
+                result[has, i] = distance[has, location[has]]
+            return result
+
+        valid, distances = self._query(lon, lat, query, chunksize, n_jobs,
+                                       rows=True)
+        result = np.full((len(lon), k), np.nan)
+        result[valid] = distances.reshape(len(valid), k)
+        return pd.DataFrame(result, columns=[f"distance_{i}"
+                                             for i in range(1, k + 1)])
+
+    def within(self, lon, lat, radii=(1, 3, 5, 10), chunksize=100_000,
+               n_jobs=4):
+        """Count the stations within distances of each point.
+
+        Args:
+            lon (array-like): Point longitudes.
+            lat (array-like): Point latitudes.
+            radii (list): Distances in miles.
+            chunksize (int): Number of points queried at a time.
+            n_jobs (int): Number of chunks queried at once.
+
+        Returns:
+            pandas.DataFrame: The number of stations at most each distance
+            from each point, in columns *within_{radius}*. Counts are missing
+            for points without coordinates.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        # The straight-line distances through the unit sphere.
+        chords = [2 * np.sin(radius / EARTH_RADIUS_MILES / 2)
+                  for radius in radii]
+
+        def query(points):
+            return np.column_stack([
+                self._all.query_ball_point(points, r=chord, return_length=True)
+                for chord in chords])
+
+        valid, counts = self._query(lon, lat, query, chunksize, n_jobs)
+        counts = counts.reshape(len(valid), len(radii))
+        return pd.DataFrame({
+            f"within_{radius:g}": pd.Series(counts[:, i], index=valid)
+                                    .reindex(np.arange(len(lon)))
+                                    .astype("Int64").array
+            for i, radius in enumerate(radii)})
+
+    def _query(self, lon, lat, function, chunksize, n_jobs, rows=False):
+        # Apply a query to the unit vectors of the points with coordinates,
+        # in chunks, and stack the results. With rows, the query also gets the
+        # positions of the points in the chunk.
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+
+        def query(start):
+            chunk = valid[start:start + chunksize]
+            points = unit_vectors(lon[chunk], lat[chunk])
+            return function(points, chunk) if rows else function(points)
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            chunks = list(executor.map(query, range(0, len(valid), chunksize)))
+        if not chunks:
+            chunks = [np.zeros((0,), dtype=np.int64)]
+        return valid, np.concatenate(chunks)
+
+
+def nearest_stations(df, stations, lon="lon", lat="lat", **kwargs):
+    """Find the nearest fire station to each point of a dataframe.
+
+    Args:
+        df (pandas.DataFrame): The points, e.g. geocoded fires or block group
+            centroids.
+        stations (pandas.DataFrame or StationIndex): Fire station data (see
+            :meth:`StationIndex.from_stations`) or an index of it.
+        lon (str): Column of longitudes in `df`.
+        lat (str): Column of latitudes in `df`.
+        kwargs: Keyword arguments passed to :meth:`StationIndex.nearest`.
+
+    Returns:
+        pandas.DataFrame: The *station_id* and *distance* of the nearest
+        station to each point, with the index of `df`.
+    """
+    if not isinstance(stations, StationIndex):
+        stations = StationIndex.from_stations(stations)
+    return stations.nearest(df[lon], df[lat], **kwargs).set_index(df.index)
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Calculate great-circle distances between points.
+
+    Args:
+        lon1 (array-like): Longitudes of the first points, in degrees.
+        lat1 (array-like): Latitudes of the first points, in degrees.
+        lon2 (array-like): Longitudes of the second points, in degrees.
+        lat2 (array-like): Latitudes of the second points, in degrees.
+
+    Returns:
+        numpy.ndarray: The distances in miles, broadcast like the inputs.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    hav = (np.sin((lat2 - lat1) / 2) ** 2
+           + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(hav))
+
+
+def unit_vectors(lon, lat):
+    """Convert longitudes and latitudes to points on the unit sphere.
+
+    Args:
+        lon (array-like): Longitudes, in degrees.
+        lat (array-like): Latitudes, in degrees.
+
+    Returns:
+        numpy.ndarray: The x, y, and z coordinates of each point.
+    """
+    lon, lat = np.radians(lon), np.radians(lat)
+    return np.column_stack([np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon), np.sin(lat)])
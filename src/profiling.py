@@ -0,0 +1,234 @@
+"""Timing and memory instrumentation for pipeline stages.
+
+Wrap a pipeline stage with :func:`src.profiling.stage` (a context manager) or
+:func:`src.profiling.instrument` (a decorator) to record its wall time, CPU
+time, peak memory, and the number of rows it read and produced. Each record is
+appended as a line of JSON to the run log, ``pipeline_runs.jsonl`` in the
+interim data directory by default. ::
+
+    from src import profiling
+
+    @profiling.instrument("nfirs.ingest_all")
+    def ingest_all_nfirs():
+        ...
+
+    with profiling.stage("geocode.batch", rows_in=len(df)) as record:
+        result = geocode(df)
+        record["rows_out"] = len(result)
+
+Records from the same process (and its child processes) share a run id. Run
+this module as a script to summarize the slowest stages across runs and flag
+stages that got slower in the latest run. ::
+
+  $ python -m src.profiling --top 10
+
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import json
+import os
+import pathlib
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+
+import pandas as pd
+from src import utils
+
+
+def default_log():
+    """Get the path to the default run log.
+
+    Returns:
+        pathlib.Path: ``pipeline_runs.jsonl`` in the interim data directory.
+    """
+    return utils.DATA["interim"] / "pipeline_runs.jsonl"
+
+
+def run_id():
+    """Get the id of the current run.
+
+    The id is created on first use and stored in an environment variable, so
+    that worker processes started afterwards report the same run.
+
+    Returns:
+        str: The run id.
+    """
+    if "RCP2_RUN_ID" not in os.environ:
+        now = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+        os.environ["RCP2_RUN_ID"] = f"{now}-{uuid.uuid4().hex[:8]}"
+    return os.environ["RCP2_RUN_ID"]
+
+
+def peak_rss_mb():
+    """Get the peak resident set size of the current process in MB.
+
+    Returns:
+        float: The peak memory use.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == "darwin":
+        return peak / 2**20
+    return peak / 2**10
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None, trace_memory=False, log=None):
+    """Record the resource use of a pipeline stage.
+
+    The context manager yields the record (a dict), so the caller can fill in
+    ``rows_in`` and ``rows_out`` once they are known. The record is appended to
+    the run log when the stage ends, also if it raises an exception.
+
+    The peak RSS is the high-water mark of the whole process so far, which is
+    cheap to read but can include earlier stages. With `trace_memory`, the
+    record also has the peak memory allocated through Python (including NumPy
+    and pandas buffers) during the stage, measured with tracemalloc, at the
+    cost of slowing the stage down.
+
+    Args:
+        name (str): The stage name, e.g. "nfirs.ingest_all".
+        rows_in (int): Number of input rows, if known.
+        trace_memory (bool): Also measure peak traced memory.
+        log (path-like): Run log to append to (default: see default_log).
+
+    Yields:
+        dict: The record for the stage.
+    """
+    record = {
+        "run_id": run_id(),
+        "stage": name,
+        "pid": os.getpid(),
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows_in": rows_in,
+        "rows_out": None,
+    }
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    except BaseException as error:
+        record["error"] = type(error).__name__
+        raise
+    finally:
+        record["wall_s"] = time.perf_counter() - wall
+        record["cpu_s"] = time.process_time() - cpu
+        record["peak_rss_mb"] = peak_rss_mb()
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            record["traced_peak_mb"] = peak / 2**20
+            tracemalloc.stop()
+        _append(record, default_log() if log is None else log)
+
+
+def instrument(name=None, trace_memory=False, log=None):
+    """Decorate a function to record its resource use as a pipeline stage.
+
+    The input rows are the length of the first positional argument and the
+    output rows are the length of the return value, when they have one (e.g.
+    pandas.DataFrame).
+
+    Args:
+        name (str): The stage name (default: the function's qualified name).
+        trace_memory (bool): Also measure peak traced memory.
+        log (path-like): Run log to append to (default: see default_log).
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = _length(args[0]) if args else None
+            with stage(stage_name, rows_in, trace_memory, log) as record:
+                result = func(*args, **kwargs)
+                record["rows_out"] = _length(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def read_log(log=None):
+    """Read a run log.
+
+    Args:
+        log (path-like): The run log (default: see default_log).
+
+    Returns:
+        pandas.DataFrame: One row per recorded stage.
+    """
+    path = default_log() if log is None else log
+    return pd.read_json(path, lines=True, convert_dates=["started_at"])
+
+
+def summarize(records, top=None):
+    """Summarize stage records across runs, slowest stages first.
+
+    Args:
+        records (pandas.DataFrame): Stage records (see read_log).
+        top (int): Number of stages to keep, or None for all.
+
+    Returns:
+        pandas.DataFrame: For each stage, the number of runs, the median and
+        latest wall time, the latest wall time relative to the median of the
+        earlier runs (``slowdown``), and the median and maximum peak RSS.
+    """
+    records = records.sort_values("started_at")
+    rows = []
+    for name, group in records.groupby("stage"):
+        runs = group.groupby("run_id", sort=False)["wall_s"].sum()
+        earlier = runs.iloc[:-1]
+        rows.append({
+            "stage": name,
+            "runs": len(runs),
+            "median_wall_s": runs.median(),
+            "latest_wall_s": runs.iloc[-1],
+            "slowdown": (runs.iloc[-1] / earlier.median()
+                         if len(earlier) else float("nan")),
+            "median_peak_rss_mb": group["peak_rss_mb"].median(),
+            "max_peak_rss_mb": group["peak_rss_mb"].max(),
+        })
+    summary = pd.DataFrame(rows).sort_values("median_wall_s",
+                                             ascending=False)
+    return summary.head(top) if top else summary
+
+
+def _length(value):
+    if isinstance(value, (str, bytes)):
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _append(record, log):
+    log = pathlib.Path(log)
+    log.parent.mkdir(parents=True, exist_ok=True)
+    # A single write of a short line keeps records from concurrent processes
+    # intact in a file opened for appending.
+    with open(log, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarize the slowest pipeline stages across runs")
+    parser.add_argument("--log", default=default_log(),
+                        help="run log (default %(default)s)")
+    parser.add_argument("--top", type=int, default=20,
+                        help="number of stages to show (default %(default)s)")
+    args = parser.parse_args()
+    summary = summarize(read_log(args.log), top=args.top)
+    print(summary.to_string(index=False, float_format="{:.2f}".format))
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from src.benchmarks.bench_address import (legacy_build_address,
+                                          random_address_parts)
+from src.data import address
+
+
+def test_build_address():
+    df = pd.DataFrame({
+        "num_mile": ["12", "12", None, " 7 ", "3"],
+        "street_pre": ["N", "n", "E", None, "W"],
+        "streetname": ["N Main", "Main", "E  John", None, "Oak\tHill"],
+        "streettype": ["St", "st", "Blvd", "Rd", None],
+        "streetsuf": [None, "", "SW", None, "  "],
+    })
+    result = address.build_address(df)
+    assert result.tolist() == ["12 N MAIN ST", "12 N MAIN ST",
+                               "E JOHN BLVD SW", "7 RD", "3 W OAK HILL"]
+
+
+def test_build_address_matches_legacy():
+    df = random_address_parts(5_000)
+    df.loc[::13, "num_mile"] = np.nan
+    expected = legacy_build_address(df)
+    pd.testing.assert_series_equal(address.build_address(df), expected)
+
+
+def test_standardize_address():
+    result = address.standardize_address(pd.Series(
+        ["123 North Main Street.", "123 N MAIN ST", None, "9 sw Oak avenue",
+         ""]))
+    assert result.tolist()[:2] == ["123 N MAIN ST", "123 N MAIN ST"]
+    assert pd.isna(result[2])
+    assert result.tolist()[3:] == ["9 SW OAK AVE", ""]
+
+
+def test_standardize_address_positions():
+    result = address.standardize_address(pd.Series(
+        ["12 North St", "12 Court Street", "12 Main Street North",
+         "3 Elm Street Apt 2", "12 Main St No 4", "Avenue of the Americas",
+         "12 West North Avenue"]))
+    assert result.tolist() == ["12 NORTH ST", "12 COURT ST", "12 MAIN ST N",
+                               "3 ELM ST APT 2", "12 MAIN ST NO 4",
+                               "AVENUE OF THE AMERICAS", "12 W NORTH AVE"]
+
+
+def test_strip_unit():
+    result = address.strip_unit(pd.Series(
+        ["12 MAIN ST APT 3B", "12 Main St apt. 4", "12 MAIN ST #3B",
+         "7 OAK ST STE# 5", "1 ELM ST UNIT B", "5 PARKING LOT RD",
+         "9 APTOS WAY", None]))
+    assert result[:7].tolist() == ["12 MAIN ST", "12 Main St", "12 MAIN ST",
+                                   "7 OAK ST", "1 ELM ST", "5 PARKING LOT RD",
+                                   "9 APTOS WAY"]
+    assert pd.isna(result[7])
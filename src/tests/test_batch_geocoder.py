@@ -0,0 +1,135 @@
+import email
+import http.server
+import threading
+import time
+
+import pandas as pd
+import pytest
+from src.data import batch_geocoder
+from src.data.tiger_geocoder import GEOCODE_COLUMNS
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answer like the Census batch geocoder, failing the first requests."""
+
+    failures = 0
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        message = email.message_from_bytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            + body)
+        address_file = next(part for part in message.walk()
+                            if part.get_filename() == "batch.csv")
+        type(self).requests.append(self.path)
+        if type(self).failures > 0:
+            type(self).failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        rows = []
+        payload = address_file.get_payload(decode=True).decode()
+        for line in payload.splitlines():
+            id_, address, city, state, zipcode = line.split(",")
+            if address.startswith("10"):
+                rows.append(f'"{id_}","{address}, {city}, {state}, '
+                            f'{zipcode}","Tie"')
+            elif address.startswith("1"):
+                rows.append(f'"{id_}","{address}, {city}, {state}, {zipcode}",'
+                            f'"Match","Exact","{address}","-77.1,38.8",'
+                            f'"101","L","51","013","100100","1000"')
+            else:
+                rows.append(f'"{id_}","{address}, {city}, {state}, '
+                            f'{zipcode}","No_Match"')
+        body = "\n".join(rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StubHandler.failures = 0
+    StubHandler.requests = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/geocoder"
+    httpd.shutdown()
+
+
+def batches(n, rows=3):
+    for i in range(n):
+        yield f"part_{i}", pd.DataFrame({
+            "id": [str(i * rows + j) for j in range(rows)],
+            "address": ["1 MAIN ST", "2 OAK AVE", "10 ELM ST"][:rows],
+            "city": "ARLINGTON",
+            "state": "VA",
+            "zip": "22201",
+        })
+
+
+def test_geocode_batches(server):
+    StubHandler.failures = 2
+    results = {}
+    stats = batch_geocoder.geocode_batches(
+        batches(5), batch_geocoder.CensusBackend(server),
+        callback=results.__setitem__, max_in_flight=2, rate=None,
+        base_delay=0.01)
+    assert sorted(results) == [f"part_{i}" for i in range(5)]
+    assert len(StubHandler.requests) == 7
+    assert StubHandler.requests[0] == "/geocoder/geographies/addressbatch"
+    assert stats.error.isna().all()
+    assert stats.attempts.sum() == 7
+    assert (stats.rows_per_s > 0).all()
+
+    result = results["part_0"]
+    assert list(result.columns) == GEOCODE_COLUMNS
+    assert result.match.tolist() == [True, False, False]
+    assert result.matchtype[[0, 2]].tolist() == ["Exact", "Tie"]
+    assert result.lon[0] == -77.1
+    assert result.lat[0] == 38.8
+    assert result.tract[0] == "100100"
+
+
+def test_geocode_batches_failures(server):
+    StubHandler.failures = 100
+    results = {}
+    breaker = batch_geocoder.CircuitBreaker(threshold=3, reset_timeout=60)
+    stats = batch_geocoder.geocode_batches(
+        batches(2), batch_geocoder.CensusBackend(server),
+        callback=results.__setitem__, max_in_flight=1, rate=None,
+        max_retries=3, base_delay=0.01, breaker=breaker)
+    assert results == {}
+    assert stats.attempts.tolist() == [4, 4]
+    # The breaker opens after three failures and refuses later requests.
+    assert len(StubHandler.requests) == 3
+    assert breaker.is_open
+    assert stats.error.str.contains("Circuit open").all()
+
+
+def test_token_bucket():
+    bucket = batch_geocoder.TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # Two tokens are available at once, the other five take 1/50 s each.
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+
+def test_circuit_breaker():
+    breaker = batch_geocoder.CircuitBreaker(threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    with pytest.raises(batch_geocoder.CircuitOpenError):
+        breaker.before_request()
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_success()
+    assert not breaker.is_open
@@ -1,7 +1,10 @@
 import geopandas
 import numpy as np
+import pandas as pd
 import shapely
-from src.data import fire_stations
+from src import utils
+from src.benchmarks import synthetic
+from src.data import fire_stations, raw
 
 
 def test_calculate_points():
@@ -10,4 +13,41 @@ def test_calculate_points():
     result = fire_stations.calculate_points(lon, lat)
     assert type(result) == geopandas.GeoSeries
     assert result.shape == (2,)
-    assert type(result.iloc[0]) == shapely.geometry.point.Point
\ No newline at end of file
+    assert type(result.iloc[0]) == shapely.geometry.point.Point
+
+
+def test_process(tmp_path, monkeypatch):
+    synthetic.write_tracts(tmp_path / "tracts", scale=0.25)
+    synthetic.write_fire_stations(tmp_path / "Fire Station Location Data.csv",
+                                  scale=0.05)
+    monkeypatch.setitem(utils.DATA, "shapefiles-census", tmp_path / "tracts")
+    monkeypatch.setitem(utils.DATA, "master", tmp_path)
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+    # Same tracts as a spatial join against every tract. The synthetic states
+    # overlap, so only stations in at most one tract are compared.
+    stations = raw.read_fire_stations()
+    tracts = raw.read_shapefiles()[["GEOID10", "geometry"]]
+    points = geopandas.GeoDataFrame(stations, geometry=fire_stations
+                                    .calculate_points(stations.Longitude,
+                                                      stations.Latitude,
+                                                      crs=tracts.crs))
+    expected = geopandas.sjoin(points, tracts, predicate="within", how="left")
+    expected = expected.GEOID10[~expected.index.duplicated(keep=False)]
+
+    # A station without a known state is still found.
+    unknown = expected.dropna().index[0]
+    stations.loc[unknown, "STATE"] = "ZZ"
+    # A station in a state without a shapefile has no tract.
+    stations.loc[len(stations)] = stations.iloc[0]
+    stations.loc[len(stations) - 1, ["STATE", "Longitude", "Latitude"]] = [
+        "PR", -66.1, 18.4]
+    expected[len(stations) - 1] = None
+    stations.to_csv(tmp_path / "Fire Station Location Data.csv", index=False)
+
+    result = fire_stations.process(n_jobs=2)
+    assert len(result) == len(stations)
+    assert list(result.columns) == list(stations.columns) + ["GEOID10"]
+    assert result.GEOID10.notna().any()
+    pd.testing.assert_series_equal(
+        result.GEOID10[expected.index].astype(object).fillna("none"),
+        expected.astype(object).fillna("none"), check_names=False)
@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+from src.data import fuzzy_match
+
+
+@pytest.fixture
+def reference():
+    return pd.DataFrame({
+        "address": ["12 MAPLE AVE", "40 MAPLE AVE", "12 OAK ST", "7 PINE RD"],
+        "city": ["Arlington", "Arlington", "Arlington", "Bethesda"],
+        "state": ["VA", "VA", "VA", "MD"],
+        "zip": ["22201", "22201", "22201", "20814"],
+        "lat": [38.1, 38.2, 38.3, 39.0],
+        "lon": [-77.1, -77.2, -77.3, -77.0],
+    })
+
+
+def test_soundex():
+    words = pd.Series(["ROBERT", "Rupert", "ASHCRAFT", "TYMCZAK", "PFISTER",
+                       "123", None])
+    assert fuzzy_match.soundex(words).tolist()[:6] == [
+        "R163", "R163", "A261", "T522", "P236", ""]
+    assert pd.isna(fuzzy_match.soundex(words).iloc[6])
+
+
+def test_match(reference):
+    matcher = fuzzy_match.FuzzyMatcher(reference)
+    df = pd.DataFrame({
+        "address": ["12 Mapel Avenue", "41 MAPLE AVE", "12 OAK ST",
+                    "7 ELM RD", "12 MAPLE AVE"],
+        "city": ["ARLINGTON", "Arlington", "Falls Church", "Bethesda",
+                 "Bethesda"],
+        "state": ["VA", "VA", "VA", "MD", "MD"],
+        # A wrong ZIP code is still blocked by city and state.
+        "zip": ["22201", "22201", "22201", "20814", "99999"],
+    }, index=[5, 6, 7, 8, 9])
+    matches = matcher.match(df)
+    assert matches.index.tolist() == [5, 6, 7, 8, 9]
+    assert matches.reference.tolist() == [0, 1, 2, -1, -1]
+    assert matches.match.tolist() == [True, True, True, False, False]
+    assert matches.confidence[7] == pytest.approx(1)
+    assert matches.number_score[6] < 1
+    # No reference street sounds like ELM, and no MAPLE AVE is in Bethesda.
+    assert matches.candidates[8] == matches.candidates[9] == 0
+
+
+def test_match_oversized_number(reference):
+    matcher = fuzzy_match.FuzzyMatcher(reference)
+    df = pd.DataFrame({"address": ["12345678901234567890 MAPLE AVE"],
+                       "city": ["Arlington"], "state": ["VA"],
+                       "zip": ["22201"]})
+    matches = matcher.match(df)
+    # The number is dropped and the address matched on its street.
+    assert matches.candidates[0] > 0
+    assert matches.street_score[0] == pytest.approx(1)
+    assert matches.number_score[0] == 0.5
+
+
+def test_match_empty_reference(reference):
+    matcher = fuzzy_match.FuzzyMatcher(reference.iloc[:0])
+    matches = matcher.match(reference)
+    assert matches.reference.tolist() == [-1] * 4
+    assert not matches.match.any()
+    assert (matches.candidates == 0).all()
+    assert not matcher.geocode(reference.assign(id="0")).match.any()
+
+
+def test_geocode(reference):
+    matcher = fuzzy_match.FuzzyMatcher(reference)
+    df = pd.DataFrame({"id": [3, 4], "address": ["7 PINE ROAD", "9 ELM ST"],
+                       "city": ["Bethesda"] * 2, "state": ["MD"] * 2,
+                       "zip": ["20814"] * 2})
+    geocodes = matcher.geocode(df)
+    assert geocodes.id.tolist() == ["3", "4"]
+    assert geocodes.match.tolist() == [True, False]
+    assert geocodes.matchtype.tolist() == ["Fuzzy", None]
+    assert geocodes.parsed[0] == "7 PINE RD"
+    assert geocodes.lat[0] == 39.0
+    assert pd.isna(geocodes.lat[1])
+
+
+def test_reference_from_geocodes():
+    geocodes = pd.DataFrame({
+        "id": ["1", "2", "3"],
+        "address": ["12 MAPLE AVE, Arlington, VA, 22201",
+                    "12 MAPLE AVE, Arlington, VA, 22201",
+                    "9 ELM ST, Bethesda, MD, 20814"],
+        "match": [True, True, False],
+        "lat": [38.1, 38.1, None],
+    })
+    reference = fuzzy_match.reference_from_geocodes(geocodes)
+    assert reference.to_dict("records") == [
+        {"address": "12 MAPLE AVE", "city": "Arlington", "state": "VA",
+         "zip": "22201", "lat": 38.1}]
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from src import utils
+from src.data import geocode_cache
+
+
+@pytest.fixture(autouse=True)
+def interim(tmp_path, monkeypatch):
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+    return tmp_path
+
+
+def responses(matches):
+    n = len(matches)
+    return pd.DataFrame({
+        "match": matches,
+        "matchtype": ["Exact" if match else None for match in matches],
+        "parsed": ["12 N MAIN ST" if match else None for match in matches],
+        "tigerlineid": ["101" if match else None for match in matches],
+        "side": ["L" if match else None for match in matches],
+        "statefp": ["51" if match else None for match in matches],
+        "countyfp": ["013" if match else None for match in matches],
+        "tract": ["100100" if match else None for match in matches],
+        "block": ["1000" if match else None for match in matches],
+        "lat": np.where(matches, 38.88, np.nan),
+        "lon": np.where(matches, -77.1, np.nan),
+    }, index=range(n))
+
+
+def test_address_keys():
+    keys = geocode_cache.address_keys(
+        pd.Series(["12 North Main Street", "12 N MAIN ST", np.nan]),
+        pd.Series(["Arlington ", "ARLINGTON", "Bethesda"]),
+        pd.Series(["va", "VA", "MD"]),
+        pd.Series(["22201", "22201-1234", np.nan]))
+    assert keys[0] == keys[1] == "12 N MAIN ST|ARLINGTON|VA|22201"
+    assert keys[2] == "|BETHESDA|MD|"
+
+
+def test_store_and_lookup():
+    keys = pd.Series(["a", "b", "c"])
+    assert geocode_cache.store(keys, responses([True, False, True])) == 3
+    assert geocode_cache.cache_path().exists()
+
+    result = geocode_cache.lookup(pd.Series(["c", "x", "a", "b"],
+                                            index=[10, 11, 12, 13]))
+    assert list(result.columns) == geocode_cache.RESPONSE_COLUMNS
+    assert result.index.tolist() == [10, 12, 13]
+    assert result.match.tolist() == [True, True, False]
+    assert result.tract.tolist() == ["100100", "100100", None]
+    assert result.lat[10] == 38.88
+
+    # Non-matches expire, matches don't.
+    later = time.time() + 100 * 86400
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(time, "time", lambda: later)
+        result = geocode_cache.lookup(keys, ttl_days=90)
+    assert result.index.tolist() == [0, 2]
+
+    # Newer responses replace older ones.
+    geocode_cache.store(pd.Series(["b"]), responses([True]))
+    assert geocode_cache.lookup(pd.Series(["b"])).match.all()
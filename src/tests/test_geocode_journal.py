@@ -0,0 +1,30 @@
+from src.data.geocode_journal import GeocodeJournal
+
+
+def test_geocode_journal(tmp_path):
+    journal = GeocodeJournal(tmp_path / "journal.sqlite")
+    journal.add([0, 1, 2, 3])
+    journal.record([0, 1], ["matched", "no_match"], "original", "part-0")
+    journal.record([2], "error", "original", error="ConnectionError")
+    assert journal.select(["pending", "error"]).tolist() == [2, 3]
+
+    # Retries keep better results, and only try each form once.
+    journal.record([0, 1], ["no_match", "tie"], "no_zip", "part-1",
+                   only_improve=True)
+    assert journal.statuses([0, 1, 9]) == ["matched", "tie", None]
+    assert journal.parts().values.tolist() == [[0, "part-0"], [1, "part-1"]]
+    assert journal.select(["tie"], form="no_zip").tolist() == []
+    assert journal.select(["tie"], form="no_apartment").tolist() == [1]
+
+    # Failed attempts don't count as tries of a form.
+    journal.record([1], "error", "no_apartment", error="Timeout",
+                   only_improve=True)
+    assert journal.select(["tie"], form="no_apartment").tolist() == [1]
+    journal.close()
+
+    # The journal persists.
+    journal = GeocodeJournal(tmp_path / "journal.sqlite")
+    journal.add([3, 4])
+    assert journal.counts().to_dict() == {"pending": 2, "error": 1,
+                                          "no_match": 0, "tie": 1,
+                                          "matched": 1}
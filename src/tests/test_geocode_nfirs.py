@@ -0,0 +1,172 @@
+import pandas as pd
+import pytest
+from src import utils
+from src.data import batch_geocoder, geocode_nfirs, interim
+from src.data.tiger_geocoder import GEOCODE_COLUMNS
+
+
+class FakeGeocoder:
+    """Match addresses starting with "1" and count the rows geocoded."""
+
+    def __init__(self, fail=(), match=None):
+        self.rows = 0
+        self.fail = fail
+        self.match = match or (lambda df: df["address"].str.startswith("1"))
+
+    def geocode(self, df):
+        if df["address"].isin(self.fail).any():
+            raise ConnectionError("geocoder unavailable")
+        self.rows += len(df)
+        result = pd.DataFrame({name: None for name in GEOCODE_COLUMNS},
+                              index=df.index)
+        result["id"] = df["id"]
+        result["address"] = df["address"]
+        result["match"] = self.match(df)
+        result["tract"] = "100100"
+        result["lat"] = df["id"].astype(float)
+        result["lon"] = -77.0
+        return result
+
+
+@pytest.fixture
+def cleaned(tmp_path, monkeypatch):
+    (tmp_path / "nfirs").mkdir()
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+    return pd.DataFrame({
+        "address": ["1 MAIN ST", "2 OAK AVE", "1 Main Street", "3 ELM ST",
+                    "2 OAK AVE"],
+        "city": ["Arlington", "Arlington", "ARLINGTON", "Bethesda",
+                 "Arlington"],
+        "state_id": ["VA", "VA", "VA", "MD", "VA"],
+        "zip5": ["22201", "22201", "22201", "20814", "22201"],
+    }, index=[10, 11, 12, 13, 14])
+
+
+def test_geocode_distinct_addresses(cleaned):
+    geocoder = FakeGeocoder()
+    summary = geocode_nfirs.geocode_nfirs(cleaned, 2015, geocoder,
+                                          batch_size=2)
+    assert summary["rows"] == 5
+    assert summary["distinct"] == 3
+    assert summary["reduction"] == pytest.approx(0.4)
+    assert summary["geocoded"] == geocoder.rows == 3
+
+    # Results fan back out to every row of the cleaned data.
+    geocodes = geocode_nfirs.consolidate_geocodes(2015).sort_values("id")
+    assert list(geocodes.columns) == GEOCODE_COLUMNS
+    assert geocodes.id.tolist() == ["10", "11", "12", "13", "14"]
+    assert geocodes.match.tolist() == [True, False, True, False, False]
+    assert geocodes.matchtype.isna().all()
+    assert geocodes.lat[0] == geocodes.lat[2]
+    assert geocodes.lat[1] == geocodes.lat[4]
+
+
+def test_geocode_cached_addresses(cleaned):
+    geocode_nfirs.geocode_nfirs(cleaned, 2015, FakeGeocoder())
+
+    # Only addresses new in the later year are geocoded.
+    later = pd.concat([cleaned, pd.DataFrame(
+        {"address": ["1 PINE LN"], "city": ["Bethesda"], "state_id": ["MD"],
+         "zip5": ["20814"]}, index=[15])])
+    geocoder = FakeGeocoder()
+    summary = geocode_nfirs.geocode_nfirs(later, 2016, geocoder)
+    assert summary["cached"] == 3
+    assert geocoder.rows == 1
+
+    geocodes = geocode_nfirs.consolidate_geocodes(2016).sort_values("id")
+    assert geocodes.id.tolist() == ["10", "11", "12", "13", "14", "15"]
+    assert geocodes.match.tolist() == [True, False, True, False, False, True]
+    assert geocodes.tract.eq("100100").all()
+
+
+def test_geocode_resumes(cleaned, monkeypatch):
+    # Retry failed batches without waiting.
+    monkeypatch.setattr(batch_geocoder.random, "uniform", lambda a, b: 0)
+
+    # The batch with "3 ELM ST" fails; the other batch is committed.
+    summary = geocode_nfirs.geocode_nfirs(
+        cleaned, 2015, FakeGeocoder(fail=["3 ELM ST"]), use_cache=False,
+        batch_size=2, flush_rows=1)
+    assert summary["failed_batches"] == 1
+    assert summary["statuses"] == {"pending": 0, "error": 1, "no_match": 1,
+                                   "tie": 0, "matched": 1}
+    assert len(geocode_nfirs.consolidate_geocodes(2015)) == 4
+
+    # Only the failed batch is geocoded on the next run.
+    geocoder = FakeGeocoder()
+    summary = geocode_nfirs.geocode_nfirs(cleaned, 2015, geocoder,
+                                          use_cache=False, batch_size=2)
+    assert summary["failed_batches"] == 0
+    assert summary["statuses"]["error"] == 0
+    assert geocoder.rows == 1
+    geocodes = geocode_nfirs.consolidate_geocodes(2015).sort_values("id")
+    assert geocodes.id.tolist() == ["10", "11", "12", "13", "14"]
+
+
+def test_retry_geocodes(cleaned):
+    cleaned.loc[13, "address"] = "3 ELM ST APT 2"
+    geocoder = FakeGeocoder(match=lambda df: df["address"].str.endswith("ST"))
+    summary = geocode_nfirs.geocode_nfirs(cleaned, 2015, geocoder,
+                                          use_cache=False)
+    assert summary["statuses"]["no_match"] == 2
+
+    # Only the unmatched addresses are sent again, without the apartment.
+    geocoder.rows = 0
+    summary = geocode_nfirs.retry_geocodes(2015, "no_apartment",
+                                           geocoder=geocoder, use_cache=False)
+    assert summary["addresses"] == geocoder.rows == 2
+    assert summary["matched"] == 1
+    assert geocode_nfirs.retry_geocodes(2015, "no_apartment",
+                                        geocoder=geocoder)["addresses"] == 0
+
+    # A retry that matches nothing keeps the earlier result.
+    summary = geocode_nfirs.retry_geocodes(2015, "no_zip", geocoder=geocoder,
+                                           use_cache=False)
+    assert summary["addresses"] == 1
+    assert summary["matched"] == 0
+
+    geocodes = geocode_nfirs.consolidate_geocodes(2015).sort_values("id")
+    assert geocodes.id.tolist() == ["10", "11", "12", "13", "14"]
+    assert geocodes.match.tolist() == [True, False, True, True, False]
+    assert geocodes.address[3] == "3 ELM ST"
+    assert geocodes.address[1] == "2 OAK AVE"
+
+
+def test_address_form():
+    addresses = pd.DataFrame({"address": ["3 Elm Street Apt 2"],
+                              "city": ["Bethesda"], "state": ["MD"],
+                              "zip": ["20814"]})
+    assert geocode_nfirs.address_form(addresses, "no_apartment").address[0] \
+        == "3 Elm Street"
+    assert geocode_nfirs.address_form(addresses, "street_types").address[0] \
+        == "3 ELM ST APT 2"
+    assert geocode_nfirs.address_form(addresses, "no_zip").zip[0] == ""
+    with pytest.raises(ValueError):
+        geocode_nfirs.address_form(addresses, "no_city")
+
+
+def test_write_geocodes(cleaned):
+    geocode_nfirs.geocode_nfirs(cleaned, 2015, FakeGeocoder(), use_cache=False)
+    geocodes = geocode_nfirs.consolidate_geocodes(2015)
+    geocodes["statefp"] = geocodes["match"].map({True: "51", False: None})
+    geocodes.loc[geocodes.id == "13", ["statefp", "match"]] = ["24", True]
+    summary = geocode_nfirs.write_geocodes(geocodes, 2015)
+
+    assert summary.loc["51", "rows"] == 2
+    assert summary.loc["total", "rows"] == 5
+    assert summary.loc["total", "match_rate"] == pytest.approx(0.6)
+    path = interim.geocoded_nfirs_path(2015)
+    assert sorted(p.name for p in path.glob("statefp=*")) == [
+        "statefp=24", "statefp=51", "statefp=__HIVE_DEFAULT_PARTITION__"]
+
+    # One state is read without the others.
+    virginia = interim.read_geocoded_nfirs(2015, states=["VA"])
+    assert list(virginia.columns) == GEOCODE_COLUMNS
+    assert sorted(virginia.id) == ["10", "12"]
+    assert virginia.statefp.eq("51").all()
+    assert len(interim.read_geocoded_nfirs(2015, fips=["24", "51"])) == 3
+
+    everything = interim.read_geocoded_nfirs(2015).sort_values("id")
+    assert everything.id.tolist() == ["10", "11", "12", "13", "14"]
+    assert everything.statefp.isna().sum() == 2
+    assert everything.lat.dtype == "float64"
@@ -0,0 +1,89 @@
+import geopandas
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from src import utils
+from src.benchmarks import synthetic
+from src.data import geoids, raw
+
+
+@pytest.fixture
+def block_groups(tmp_path, monkeypatch):
+    synthetic.write_block_groups(tmp_path, scale=0.25)
+    monkeypatch.setitem(utils.DATA, "shapefiles-census-bg", tmp_path)
+    return tmp_path
+
+
+def test_geoid_index():
+    index = geoids.GeoidIndex(
+        ["511", "510"],
+        [shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)])
+    result = index.assign([0.5, 1.0, 1.5, 3.0, np.nan],
+                          [0.5, 0.5, 0.5, 0.5, 0.5])
+    assert result.geoid.tolist() == ["511", "510", "510", None, None]
+    assert result.status.tolist() == ["matched", "boundary", "matched",
+                                      "no_match", "missing"]
+
+    result = index.assign([3.0, 2.5], [0.5, 0.5], max_distance=0.75)
+    assert result.geoid.tolist() == [None, "510"]
+    assert result.status.tolist() == ["no_match", "nearest"]
+
+
+def test_assign_geoids(block_groups):
+    # Points in the middle of each block group of Virginia and Maryland.
+    polygons = pd.concat([
+        geopandas.read_file(block_groups / f"tl_2010_{code}_bg10.shp")
+        for code in ["51", "24"]], ignore_index=True)
+    centers = polygons.geometry.representative_point()
+    points = pd.DataFrame({"lon": centers.x, "lat": centers.y,
+                           "statefp": polygons.GEOID10.str[:2]})
+    points.loc[len(points)] = [-77.0, 38.9, None]
+    points.loc[len(points)] = [np.nan, np.nan, "51"]
+    points.index = points.index + 100
+
+    result = geoids.assign_geoids(points, n_jobs=2)
+    assert result.index.equals(points.index)
+    assert result.bg_geoid.iloc[:-2].tolist() == polygons.GEOID10.tolist()
+    assert result.tract_geoid.iloc[0] == polygons.GEOID10[0][:11]
+    assert result.status.iloc[-2:].tolist() == ["no_state", "missing"]
+
+    summary = geoids.diagnostics(result, points.statefp)
+    assert summary.loc["51", "matched"] == (points.statefp == "51").sum() - 1
+    assert summary.loc["none", "no_state"] == 1
+    assert summary.loc["total", "rows"] == len(points)
+    assert summary.loc["total", "match_rate"] == pytest.approx(
+        (len(points) - 2) / len(points))
+
+    # The polygons are cached next to the shapefiles.
+    assert len(list((block_groups / ".cache").glob("*.parquet"))) == 2
+
+
+def test_assign_geoids_missing_state(block_groups):
+    with pytest.raises(raw.BadPathError):
+        geoids.GeoidIndex.from_state("31")
+
+    # States without a shapefile have no matches, unless found elsewhere.
+    points = pd.DataFrame({"lon": [-100.0, -82.0, np.nan],
+                           "lat": [40.0, 37.0, np.nan],
+                           "statefp": ["31", "72", "72"]})
+    result = geoids.assign_geoids(points)
+    assert result.status.tolist() == ["no_match", "no_match", "missing"]
+    assert result.bg_geoid.isna().all()
+    result = geoids.assign_geoids(points, search_all=True)
+    assert result.status.tolist() == ["no_match", "matched", "missing"]
+    assert result.bg_geoid[1].startswith("51")
+
+
+def test_assign_geoids_search_all(block_groups):
+    # Points in Virginia without a state or with the wrong state, and a point
+    # where the synthetic Virginia and Maryland overlap.
+    points = pd.DataFrame({"lon": [-82.0, -82.0, -77.3],
+                           "lat": [37.0, 37.0, 38.9],
+                           "statefp": [None, "24", None]})
+    result = geoids.assign_geoids(points, search_all=True)
+    assert result.status.tolist() == ["matched", "matched", "boundary"]
+    assert result.bg_geoid.str[:2].tolist() == ["51", "51", "24"]
+
+    result = geoids.assign_geoids(points)
+    assert result.status.tolist() == ["no_state", "no_match", "no_state"]
@@ -0,0 +1,27 @@
+import pandas as pd
+from src import utils
+from src.benchmarks.bench_dedupe import random_cleaned_nfirs
+from src.data import interim, nfirs
+
+
+def test_read_cleaned_nfirs(tmp_path, monkeypatch):
+    df = nfirs.dedupe_nfirs(random_cleaned_nfirs(1_000))
+    (tmp_path / "nfirs").mkdir()
+    interim.apply_nfirs_schema(df).to_csv(
+        tmp_path / "nfirs" / "nfirs_cleaned_2016.csv", index=False)
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+
+    result = interim.read_cleaned_nfirs(2016)
+    expected = interim.apply_nfirs_schema(df).reset_index(drop=True)
+    for col, dtype in interim.NFIRS_SCHEMA.items():
+        if col in result.columns:
+            assert result[col].dtype == dtype
+    pd.testing.assert_frame_equal(result, expected, check_categorical=False)
+
+
+def test_nfirs_memory_savings():
+    df = nfirs.dedupe_nfirs(random_cleaned_nfirs(1_000))
+    report = interim.nfirs_memory_savings(df)
+    assert report.loc["total", "ratio"] < 0.5
+    assert (report.loc["oth_inj", "after_mb"]
+            < report.loc["oth_inj", "before_mb"])
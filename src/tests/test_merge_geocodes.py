@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src import utils
+from src.benchmarks import synthetic
+from src.benchmarks.bench_dedupe import random_cleaned_nfirs
+from src.data import geocode_nfirs, interim, merge_geocodes, nfirs
+from src.data.tiger_geocoder import GEOCODE_COLUMNS
+
+
+@pytest.fixture
+def cleaned(tmp_path, monkeypatch):
+    (tmp_path / "nfirs").mkdir()
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+    monkeypatch.setitem(utils.DATA, "processed", tmp_path / "processed")
+    df = interim.apply_nfirs_schema(
+        nfirs.dedupe_nfirs(random_cleaned_nfirs(200)))
+    df.to_csv(tmp_path / "nfirs" / "nfirs_cleaned_2016.csv", index=False)
+    return interim.read_cleaned_nfirs(2016)
+
+
+def geocodes(rows, **values):
+    result = pd.DataFrame({name: None for name in GEOCODE_COLUMNS},
+                          index=range(len(rows)))
+    result["id"] = [str(row) for row in rows]
+    result["match"] = True
+    result["lat"] = 38.9
+    result["lon"] = -77.1
+    for name, value in values.items():
+        result[name] = value
+    return result
+
+
+def test_build_geocoded_nfirs(cleaned):
+    # Every other row is geocoded, in reverse order.
+    rows = np.arange(len(cleaned))[::-2]
+    result = geocodes(rows, statefp="51", countyfp="013", tract="100100",
+                      block="2001")
+    result.loc[0, "match"] = False
+    result.loc[0, ["statefp", "countyfp", "tract", "block"]] = None
+    geocode_nfirs.write_geocodes(result, 2016)
+
+    df = merge_geocodes.build_geocoded_nfirs(2016)
+    assert len(df) == len(cleaned)
+    pd.testing.assert_frame_equal(df[cleaned.columns], cleaned)
+    for name, dtype in merge_geocodes.GEOID_SCHEMA.items():
+        assert df[name].dtype == dtype
+    assert df.match.sum() == len(rows) - 1
+    assert df.bg_geoid[rows[1]] == "510131001002"
+    assert df.tract_geoid[rows[1]] == "51013100100"
+    assert df.county_geoid[rows[1]] == "51013"
+    assert df.state_geoid[rows[1]] == "51"
+    assert df.bg_geoid.isna().sum() == len(cleaned) - len(rows) + 1
+
+    read = merge_geocodes.read_processed_nfirs(2016, columns=["bg_geoid"])
+    pd.testing.assert_series_equal(read.bg_geoid, df.bg_geoid)
+
+
+def test_merge_geocodes_locate(cleaned, tmp_path, monkeypatch):
+    synthetic.write_block_groups(tmp_path / "bg", scale=0.25)
+    monkeypatch.setitem(utils.DATA, "shapefiles-census-bg", tmp_path / "bg")
+    result = geocodes([0, 1], statefp="51")
+    result.loc[1, ["lat", "lon"]] = np.nan
+
+    df = merge_geocodes.merge_geocodes(cleaned, result, locate=True)
+    assert df.bg_geoid[0].startswith("51")
+    assert len(df.bg_geoid[0]) == 12
+    assert df.state_geoid[0] == "51"
+    assert pd.isna(df.bg_geoid[1])
+
+
+def test_merge_geocodes_bad_ids(cleaned):
+    with pytest.raises(ValueError):
+        merge_geocodes.merge_geocodes(cleaned, geocodes([0, len(cleaned)]))
+    with pytest.raises(ValueError):
+        merge_geocodes.merge_geocodes(cleaned, geocodes([0, 0]))
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from src import utils
+from src.benchmarks.bench_dedupe import (legacy_dedupe_nfirs,
+                                         random_cleaned_nfirs)
+from src.data import nfirs, raw
+
+
+BASIC = ("STATE^FDID^INC_DATE^INC_NO^EXP_NO^INC_TYPE^PROP_USE^AID^DEPT_STA^"
+         "OTH_INJ^OTH_DEATH^PROP_LOSS^CONT_LOSS^VERSION\n" + """\
+VA^00123^1012016^A000001^0^111^419^N^1^^^1000^500^5.0
+VA^00123^1012016^0000002^0^111^429^N^1^1^^2000^^5.0
+VA^00123^1012016^0000002^0^111^429^N^1^1^^2000^^5.0
+VA^00123^1022016^0000003^0^131^419^N^1^^^^^5.0
+MD^04567^1032016^0000004^0^113^^N^^^^^^5.0
+MD^04567^1032016^0000005^0^118^400^N^2^^1^300^^5.0
+MD^04567^1032016^0000006^1^111^419^N^2^^^^^5.0
+MD^04567^1032016^0000006^1^131^419^N^2^^^^^5.0
+""")
+
+ADDRESS = ("STATE^FDID^INC_DATE^INC_NO^EXP_NO^LOC_TYPE^NUM_MILE^STREET_PRE^"
+           "STREETNAME^STREETTYPE^STREETSUF^APT_NO^CITY^STATE_ID^ZIP5^ZIP4^"
+           "X_STREET\n" + """\
+VA^00123^1012016^A000001^0^1^12^N^Main^St^^1A^Arlington^VA^22201^^
+VA^00123^1012016^0000002^0^1^12^N^N Main^St^^2B^Arlington^VA^22201^^
+VA^00123^1022016^0000003^0^1^7^^Oak^Ave^^^Arlington^VA^00000^^
+MD^04567^1032016^0000005^0^1^9^^Elm^Rd^SW^^Bethesda^^20814^^
+MD^04567^1032016^0000006^1^1^3^E^Pine^Ln^^^Bethesda^MD^20814^^
+""")
+
+FIRE = ("STATE^FDID^INC_DATE^INC_NO^EXP_NO^DETECTOR^DET_TYPE^DET_POWER^"
+        "DET_OPERAT^DET_EFFECT^DET_FAIL^AES_PRES^AES_TYPE^AES_OPER^NO_SPR_OP^"
+        "AES_FAIL^FIRE_SPRD\n" + """\
+VA^00123^1012016^A000001^0^1^1^1^1^1^^N^^^^^1
+MD^04567^1032016^0000005^0^N^^^^^^N^^^^^2
+""")
+
+
+@pytest.fixture
+def nfirs_dir(tmp_path):
+    """Write one year of tiny raw NFIRS tables."""
+    for name, text in [("basicincident.txt", BASIC),
+                       ("incidentaddress.txt", ADDRESS),
+                       ("fireincident.txt", FIRE)]:
+        (tmp_path / name).write_text(text, encoding="latin-1")
+    return tmp_path
+
+
+def test_read_nfirs_streaming(nfirs_dir):
+    nfirs_dict = raw.read_nfirs(nfirs_dir, chunksize=2)
+    basic = nfirs_dict["basic"]
+    assert list(basic.columns) == raw.NFIRS_COLUMNS["basic"]
+    assert list(basic.inc_no) == ["A000001", "0000002", "0000005", "0000006"]
+    assert list(nfirs_dict["address"].inc_no) == [
+        "A000001", "0000002", "0000005", "0000006"]
+    assert list(nfirs_dict["fire"].inc_no) == ["A000001", "0000005"]
+
+
+def test_ingest_streaming_matches_full_read(nfirs_dir):
+    full = nfirs.ingest_raw_nfirs_data(raw.read_nfirs(nfirs_dir))
+    streamed = nfirs.ingest_raw_nfirs_data(
+        raw.read_nfirs(nfirs_dir, chunksize=3))
+    assert list(full.columns) == list(streamed.columns)
+    assert list(full.unique_id) == list(streamed.unique_id)
+    assert list(full.address) == list(streamed.address)
+    assert full.tot_loss.tolist() == streamed.tot_loss.tolist()
+
+
+def test_ingest_all_nfirs(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    (raw_dir / "nfirs").mkdir(parents=True)
+    for year in ["2015", "2016"]:
+        year_dir = raw_dir / "nfirs" / year
+        year_dir.mkdir()
+        for name, text in [("basicincident.txt", BASIC),
+                           ("incidentaddress.txt", ADDRESS),
+                           ("fireincident.txt", FIRE)]:
+            (year_dir / name).write_text(text, encoding="latin-1")
+    (tmp_path / "interim" / "nfirs").mkdir(parents=True)
+    monkeypatch.setitem(utils.DATA, "raw", raw_dir)
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path / "interim")
+
+    summary = nfirs.ingest_all_nfirs()
+    assert list(summary.year) == ["2015", "2016"]
+    assert summary.error.isna().all()
+    assert (summary.rows == 3).all()
+    assert not summary.skipped.any()
+    for year in ["2015", "2016"]:
+        path = tmp_path / "interim" / "nfirs" / f"nfirs_cleaned_{year}.csv"
+        assert path.exists()
+
+    # Only stale years are re-ingested.
+    assert nfirs.ingest_all_nfirs().skipped.all()
+    with open(raw_dir / "nfirs" / "2016" / "fireincident.txt", "a") as f:
+        f.write("VA^00123^1012016^0000002^0^1^^^^^^N^^^^^1\n")
+    summary = nfirs.ingest_all_nfirs()
+    assert summary.skipped.tolist() == [True, False]
+    summary = nfirs.ingest_all_nfirs(force=True)
+    assert summary.skipped.tolist() == [False, False]
+    manifest = nfirs.read_manifest()
+    assert manifest["2016"]["code_version"] == nfirs.cleaning_code_version()
+
+
+def test_ingest_all_nfirs_failed_year(tmp_path, monkeypatch, capsys):
+    raw_dir = tmp_path / "raw"
+    for year, basic in [("2015", BASIC), ("2016", "not^nfirs\n1^2\n")]:
+        year_dir = raw_dir / "nfirs" / year
+        year_dir.mkdir(parents=True)
+        for name, text in [("basicincident.txt", basic),
+                           ("incidentaddress.txt", ADDRESS),
+                           ("fireincident.txt", FIRE)]:
+            (year_dir / name).write_text(text, encoding="latin-1")
+    (tmp_path / "interim" / "nfirs").mkdir(parents=True)
+    monkeypatch.setitem(utils.DATA, "raw", raw_dir)
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path / "interim")
+
+    summary = nfirs.ingest_all_nfirs()
+    assert summary.error.isna().tolist() == [True, False]
+    assert "Failed years: 2016" in capsys.readouterr().out
+    assert list(nfirs.read_manifest()) == ["2015"]
+    assert not list((tmp_path / "interim" / "nfirs").glob("*.tmp"))
+
+
+def test_read_nfirs_cache(nfirs_dir):
+    streamed = raw.read_nfirs(nfirs_dir, chunksize=3)
+    cached = raw.read_nfirs(nfirs_dir, chunksize=3, cache=True)
+    for table in ["basic", "address", "fire"]:
+        pd.testing.assert_frame_equal(streamed[table], cached[table])
+    cache_dir = nfirs_dir / ".cache"
+    assert len(list(cache_dir.glob("basicincident.txt.*.parquet"))) == 1
+
+    # Reading again uses the cache; changing the source rebuilds it.
+    old_path = next(cache_dir.glob("basicincident.txt.*.parquet"))
+    raw.read_nfirs(nfirs_dir, cache=True)
+    assert old_path.exists()
+    with open(nfirs_dir / "basicincident.txt", "a") as f:
+        f.write("VA^00123^1052016^0000009^0^111^419^N^1^^^^^5.0\n")
+    cached = raw.read_nfirs(nfirs_dir, chunksize=3, cache=True)
+    assert not old_path.exists()
+    assert len(list(cache_dir.glob("basicincident.txt.*.parquet"))) == 1
+    assert "0000009" in cached["basic"].inc_no.tolist()
+
+
+def test_convert_nfirs_header_only(tmp_path):
+    header = BASIC.splitlines()[0]
+    source = tmp_path / "basicincident.txt"
+    source.write_text(header + "\n", encoding="latin-1")
+    raw._convert_nfirs(source, tmp_path / "basic.parquet")
+    table = pq.read_table(tmp_path / "basic.parquet")
+    assert table.num_rows == 0
+    assert table.schema.names == header.lower().split("^")
+    assert table.schema.field("inc_type").type == pa.int64()
+
+    # The cached copy of a header-only table reads as an empty table.
+    df = next(raw._read_nfirs_chunks(source, None, None, cache=True))
+    assert len(df) == 0 and list(df.columns) == table.schema.names
+
+
+def test_ingest_cache_matches_full_read(nfirs_dir):
+    full = nfirs.ingest_raw_nfirs_data(raw.read_nfirs(nfirs_dir))
+    cached = nfirs.ingest_raw_nfirs_data(raw.read_nfirs(nfirs_dir, cache=True))
+    for name in ["unique_id", "address", "tot_loss"]:
+        assert full[name].tolist() == cached[name].tolist()
+    assert cached.dept_sta.tolist() == ["001", "001", "002", "002"]
+
+
+def test_dedupe_nfirs_matches_legacy():
+    df = random_cleaned_nfirs(5_000)
+    df.loc[::97, "state_id"] = np.nan
+    expected = legacy_dedupe_nfirs(df)
+    pd.testing.assert_frame_equal(nfirs.dedupe_nfirs(df), expected)
@@ -0,0 +1,60 @@
+import json
+
+import pandas as pd
+import pytest
+from src import profiling
+
+
+def test_stage(tmp_path):
+    log = tmp_path / "runs.jsonl"
+    with profiling.stage("load", rows_in=10, trace_memory=True,
+                         log=log) as record:
+        data = list(range(100_000))
+        record["rows_out"] = len(data)
+    with pytest.raises(ValueError):
+        with profiling.stage("fail", log=log):
+            raise ValueError("bad row")
+
+    records = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [r["stage"] for r in records] == ["load", "fail"]
+    assert records[0]["rows_in"] == 10
+    assert records[0]["rows_out"] == 100_000
+    assert records[0]["traced_peak_mb"] > 0
+    assert records[0]["wall_s"] >= 0
+    assert "error" not in records[0]
+    assert records[1]["error"] == "ValueError"
+    assert records[0]["run_id"] == records[1]["run_id"]
+
+
+def test_instrument(tmp_path):
+    log = tmp_path / "runs.jsonl"
+
+    @profiling.instrument("double", log=log)
+    def double(df):
+        return pd.concat([df, df])
+
+    assert len(double(pd.DataFrame({"a": [1, 2, 3]}))) == 6
+    record = profiling.read_log(log).iloc[0]
+    assert record["stage"] == "double"
+    assert record["rows_in"] == 3
+    assert record["rows_out"] == 6
+
+
+def test_summarize():
+    records = pd.DataFrame({
+        "run_id": ["a", "a", "b", "b", "c"],
+        "stage": ["read", "clean", "read", "clean", "read"],
+        "started_at": pd.to_datetime(["2020-01-01", "2020-01-01",
+                                      "2020-01-02", "2020-01-02",
+                                      "2020-01-03"]),
+        "wall_s": [10.0, 1.0, 12.0, 1.0, 22.0],
+        "peak_rss_mb": [100.0, 50.0, 110.0, 60.0, 120.0],
+    })
+    summary = profiling.summarize(records)
+    assert summary.stage.tolist() == ["read", "clean"]
+    read = summary.iloc[0]
+    assert read.runs == 3
+    assert read.latest_wall_s == 22.0
+    assert read.slowdown == pytest.approx(2.0)
+    assert read.max_peak_rss_mb == 120.0
+    assert len(profiling.summarize(records, top=1)) == 1
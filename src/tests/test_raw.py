@@ -1,5 +1,9 @@
 import geopandas
+import pandas as pd
 import pytest
+import shapely
+from src import utils
+from src.benchmarks import synthetic
 from src.data import raw
 
 
@@ -30,4 +34,60 @@ def test_read_shapefiles_errors():
     with pytest.raises(raw.BadPathError):
         raw.read_shapefiles(fips=["ZZ"])
     with pytest.raises(raw.BadPathError):
-        raw.read_shapefiles(glob="*")
\ No newline at end of file
+        raw.read_shapefiles(glob="*")
+
+
+def test_shapefile_store(tmp_path, monkeypatch):
+    synthetic.write_tracts(tmp_path, scale=0.25)
+    monkeypatch.setitem(utils.DATA, "shapefiles-census", tmp_path)
+
+    for kwargs in [{}, {"states": ["VA", "DC"]}, {"fips": ["24"]},
+                   {"glob": "tl_2010_5*.shp"}]:
+        expected = raw.read_shapefiles(cache=False, **kwargs)
+        df = raw.read_shapefiles(**kwargs)
+        assert type(df) == geopandas.GeoDataFrame
+        assert df.crs == expected.crs
+        pd.testing.assert_frame_equal(pd.DataFrame(df),
+                                      pd.DataFrame(expected))
+    # The store is also a GeoParquet file.
+    store = geopandas.read_parquet(raw.shapefile_store())
+    assert len(store) == len(raw.read_shapefiles(cache=False))
+
+    # The store is rebuilt when a shapefile changes.
+    tracts = geopandas.read_file(tmp_path / "tl_2010_11_tract10.shp")
+    tracts.iloc[:2].to_file(tmp_path / "tl_2010_11_tract10.shp")
+    assert len(raw.read_shapefiles(states=["DC"])) == 2
+    with pytest.raises(raw.BadPathError):
+        raw.read_shapefiles(fips=["ZZ"])
+
+
+def test_read_shapefiles_pushdown(tmp_path, monkeypatch):
+    synthetic.write_tracts(tmp_path, scale=1)
+    monkeypatch.setitem(utils.DATA, "shapefiles-census", tmp_path)
+    # Count the row groups read from the store.
+    groups = []
+    read_row_group = raw.pq.ParquetFile.read_row_group
+    monkeypatch.setattr(raw.pq.ParquetFile, "read_row_group",
+                        lambda self, i, **kwargs: groups.append(i)
+                        or read_row_group(self, i, **kwargs))
+    monkeypatch.setattr(raw, "_STORE_ROW_GROUP_SIZE", 8)
+
+    mask = geopandas.GeoSeries([shapely.box(-77.2, 38.8, -77.0, 39.0)],
+                               crs="EPSG:4326")
+    for kwargs in [{"bbox": (-77.5, 38.5, -77.0, 39.0)},
+                   {"bbox": (-77.5, 38.5, -77.0, 39.0), "states": ["VA"]},
+                   {"mask": mask},
+                   {"geoids": ["51001", "24"]},
+                   {"geoids": ["99"]}]:
+        expected = raw.read_shapefiles(cache=False, **kwargs)
+        df = raw.read_shapefiles(**kwargs)
+        pd.testing.assert_frame_equal(pd.DataFrame(df),
+                                      pd.DataFrame(expected))
+    assert len(expected) == 0
+    assert df.crs == raw.read_shapefiles().crs
+
+    # A county reads its own row groups only.
+    groups.clear()
+    county = raw.read_shapefiles(geoids=["51001"])
+    assert county.GEOID10.str.startswith("51001").all()
+    assert len(groups) == -(-len(county) // 8)
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from src import utils
+from src.benchmarks import synthetic
+from src.data import fire_stations
+from src.features import station_coverage
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    synthetic.write_block_groups(tmp_path / "bg", scale=0.1)
+    synthetic.write_fire_stations(tmp_path / "fire-stations.csv", scale=0.2)
+    monkeypatch.setitem(utils.DATA, "shapefiles-census-bg", tmp_path / "bg")
+    monkeypatch.setattr(fire_stations, "PATH", tmp_path / "fire-stations.csv")
+    monkeypatch.setattr(station_coverage, "CACHE_DIR", tmp_path / "coverage")
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+    return tmp_path
+
+
+def test_build_coverage_features(data):
+    centers = pd.DataFrame({"STATEFP": ["51"], "COUNTYFP": ["001"],
+                            "TRACTCE": ["000100"], "BLKGRPCE": ["1"],
+                            "POPULATION": ["1200"], "LATITUDE": ["+38.9"],
+                            "LONGITUDE": ["-77.3"]})
+    centers.to_csv(data / "CenPop2010_Mean_BG.txt", index=False)
+
+    df = station_coverage.build_coverage_features(
+        k=3, radii=[5, 50], population_centers=data / "CenPop2010_Mean_BG.txt")
+    centroids = station_coverage.centroids()
+    assert df.index.equals(centroids.index)
+    assert list(df.columns[:5]) == ["distance_1", "distance_2", "distance_3",
+                                    "within_5", "within_50"]
+    assert (df.distance_1 <= df.distance_2).all()
+    assert (df.within_5 <= df.within_50).all()
+    assert df.pop_distance_1.notna().sum() == 1
+    assert df.pop_within_50["510010001001"] >= 0
+
+    # Cached until the stations change.
+    assert len(list((data / "coverage").glob("*.parquet"))) == 1
+    pd.testing.assert_frame_equal(
+        station_coverage.build_coverage_features(
+            k=3, radii=[5, 50],
+            population_centers=data / "CenPop2010_Mean_BG.txt"), df)
+    stations = pd.read_csv(fire_stations.PATH).iloc[:10]
+    stations.to_csv(fire_stations.PATH, index=False)
+    changed = station_coverage.build_coverage_features(k=3, radii=[5, 50])
+    assert len(list((data / "coverage").glob("*.parquet"))) == 2
+    assert (changed.within_50 <= df.within_50).all()
+    assert "pop_distance_1" not in changed.columns
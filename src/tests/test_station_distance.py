@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.features import station_distance
+
+
+def brute_force(lon, lat, stations):
+    distance = station_distance.haversine(
+        lon[:, None], lat[:, None], stations.Longitude.to_numpy()[None, :],
+        stations.Latitude.to_numpy()[None, :])
+    nearest = distance.argmin(axis=1)
+    return stations.ID.to_numpy()[nearest], distance.min(axis=1)
+
+
+def test_haversine():
+    # Washington, DC to Baltimore, MD is about 35 miles.
+    assert station_distance.haversine(-77.04, 38.91, -76.61, 39.29) \
+        == pytest.approx(35, abs=1)
+    assert station_distance.haversine(0, 0, 180, 0) \
+        == pytest.approx(np.pi * station_distance.EARTH_RADIUS_MILES)
+
+
+def test_nearest():
+    rng = np.random.default_rng(0)
+    stations = pd.DataFrame({"ID": np.arange(500) + 1000,
+                             "Longitude": rng.uniform(-125, -67, 500),
+                             "Latitude": rng.uniform(25, 49, 500)})
+    # A station without coordinates, and one at the same place as another.
+    stations.loc[3, "Latitude"] = np.nan
+    stations.loc[len(stations)] = [9999, *stations.loc[7, ["Longitude",
+                                                           "Latitude"]]]
+    lon = rng.uniform(-130, -60, 2000)
+    lat = rng.uniform(20, 55, 2000)
+    lon[5] = np.nan
+    lon[6:8] = stations.Longitude[7]
+    lat[6:8] = stations.Latitude[7]
+
+    index = station_distance.StationIndex.from_stations(stations)
+    result = index.nearest(lon, lat, chunksize=300, n_jobs=3)
+    valid = np.isfinite(lon)
+    ids, distance = brute_force(lon[valid], lat[valid], stations.dropna())
+    assert result.station_id[valid].tolist() == ids.tolist()
+    assert np.array_equal(result.distance[valid], distance)
+    assert pd.isna(result.station_id[5]) and np.isnan(result.distance[5])
+    assert result.station_id[6] == 1007 and result.distance[6] == 0
+
+
+def test_nearest_stations():
+    stations = pd.DataFrame({"ID": ["a", "b"], "Longitude": [-77.0, -76.6],
+                             "Latitude": [38.9, 39.3]})
+    df = pd.DataFrame({"lon": [-76.7, -77.1], "lat": [39.2, 38.8]},
+                      index=[10, 20])
+    result = station_distance.nearest_stations(df, stations)
+    assert result.index.tolist() == [10, 20]
+    assert result.station_id.tolist() == ["b", "a"]
+    with pytest.raises(ValueError):
+        station_distance.StationIndex([np.nan], [np.nan])
+
+
+def test_k_nearest_and_within():
+    rng = np.random.default_rng(1)
+    stations = pd.DataFrame({"ID": np.arange(300),
+                             "Longitude": rng.uniform(-78, -76, 300),
+                             "Latitude": rng.uniform(38, 40, 300)})
+    # Two stations at the same place are two stations.
+    stations.loc[len(stations)] = [300, *stations.loc[0, ["Longitude",
+                                                          "Latitude"]]]
+    lon = rng.uniform(-78.5, -75.5, 1000)
+    lat = rng.uniform(37.5, 40.5, 1000)
+    lon[0], lat[0] = stations.Longitude[0], stations.Latitude[0]
+    lon[1] = np.nan
+
+    index = station_distance.StationIndex.from_stations(stations)
+    distances = station_distance.haversine(
+        lon[:, None], lat[:, None], stations.Longitude.to_numpy()[None, :],
+        stations.Latitude.to_numpy()[None, :])
+
+    nearest = index.k_nearest(lon, lat, k=4, chunksize=300)
+    assert list(nearest.columns) == [f"distance_{i}" for i in range(1, 5)]
+    assert np.array_equal(nearest.to_numpy()[2:],
+                          np.sort(distances, axis=1)[2:, :4])
+    assert nearest.iloc[0, :2].tolist() == [0, 0]
+    assert nearest.iloc[1].isna().all()
+
+    within = index.within(lon, lat, radii=[1, 5, 10.5], chunksize=300)
+    assert list(within.columns) == ["within_1", "within_5", "within_10.5"]
+    for radius, name in zip([1, 5, 10.5], within.columns):
+        expected = (distances[2:] <= radius).sum(axis=1)
+        assert within[name][2:].tolist() == expected.tolist()
+    assert within.within_1[0] >= 2
+    assert within.iloc[1].isna().all()
+
+    # Fewer stations than k.
+    few = station_distance.StationIndex([-77.0, -77.0], [38.9, 38.9])
+    result = few.k_nearest([-77.0], [38.9], k=3)
+    assert result.iloc[0, :2].tolist() == [0, 0]
+    assert np.isnan(result.iloc[0, 2])
@@ -0,0 +1,110 @@
+import geopandas
+import numpy as np
+import pandas as pd
+import pytest
+import shapely.geometry
+from src.data import tiger_geocoder
+
+
+@pytest.fixture
+def geocoder(tmp_path):
+    """Index two blocks of Main St and one of Oak Ave in county 51013."""
+    edges = geopandas.GeoDataFrame({
+        "TLID": [101, 102, 201],
+        "FULLNAME": ["N Main St", "N Main St", "Oak Avenue"],
+        "LFROMHN": ["1", "101", "2"],
+        "LTOHN": ["99", "199", "98"],
+        "RFROMHN": ["2", "102", None],
+        "RTOHN": ["100", "200", None],
+        "ZIPL": ["22201", "22201", "22203"],
+        "ZIPR": ["22201", "22201", None],
+    }, geometry=[
+        shapely.geometry.LineString([(-77.10, 38.88), (-77.10, 38.89)]),
+        shapely.geometry.LineString([(-77.10, 38.89), (-77.10, 38.90)]),
+        shapely.geometry.LineString([(-77.12, 38.88), (-77.11, 38.88)]),
+    ], crs="EPSG:4269")
+    path = tmp_path / "tl_2019_51013_addrfeat.shp"
+    edges.to_file(path)
+
+    blocks = geopandas.GeoDataFrame({
+        "STATEFP10": ["51", "51", "24"],
+        "COUNTYFP10": ["013", "013", "031"],
+        "TRACTCE10": ["100100", "100200", "700100"],
+        "BLOCKCE10": ["1000", "2000", "3000"],
+    }, geometry=[shapely.geometry.box(-77.2, 38.8, -77.0, 38.885),
+                 shapely.geometry.box(-77.2, 38.885, -77.0, 39.0),
+                 shapely.geometry.box(-77.2, 39.0, -77.0, 39.1)],
+        crs="EPSG:4269")
+    for code in ["24", "51"]:
+        blocks[blocks.STATEFP10 == code].to_file(
+            tmp_path / f"tl_2010_{code}_tabblock10.shp")
+    ranges = tiger_geocoder.read_address_ranges([path])
+    return tiger_geocoder.TigerGeocoder(ranges, blocks)
+
+
+def test_parse_address():
+    number, street = tiger_geocoder.parse_address(
+        pd.Series(["123 North Main Street", "12B Oak Ave.", "Rural Route 1",
+                   np.nan]))
+    assert number.tolist()[:2] == [123, 12]
+    assert number.isna().tolist() == [False, False, True, True]
+    assert street.tolist()[:2] == ["N MAIN ST", "OAK AVE"]
+    assert street[2].startswith("RURAL R")
+    assert street[3] == ""
+
+
+def test_parse_address_oversized_number():
+    number, street = tiger_geocoder.parse_address(
+        pd.Series(["12345678901234567890 MAIN ST", "5000000000 MAIN ST",
+                   "4294967295 MAIN ST"]))
+    assert number.isna().tolist() == [True, True, False]
+    assert number[2] == 2**32 - 1
+    assert street.tolist() == ["MAIN ST"] * 3
+
+
+def test_geocode(geocoder):
+    df = pd.DataFrame({
+        "id": ["0", "1", "2", "3", "4"],
+        "address": ["50 North Main Street", "150 N MAIN ST", "51 N Main St",
+                    "10 Oak Ave", "500 N Main St"],
+        "city": ["Arlington"] * 5,
+        "state": ["VA", "VA", "VA", "VA", "VA"],
+        "zip": ["22201", "22201", "22201", "99999", "22201"],
+    })
+    result = geocoder.geocode(df)
+    assert list(result.columns) == tiger_geocoder.GEOCODE_COLUMNS
+    assert result.match.tolist() == [True, True, True, True, False]
+    assert result.matchtype.tolist()[:4] == ["Exact", "Exact", "Exact",
+                                             "Non_Exact"]
+    assert result.tigerlineid.tolist()[:4] == ["101", "102", "101", "201"]
+    assert result.side.tolist()[:4] == ["R", "R", "L", "L"]
+
+    # House numbers are interpolated along the edge.
+    assert result.lon[0] == pytest.approx(-77.10)
+    assert result.lat[0] == pytest.approx(38.88 + 0.01 * 48 / 98)
+    assert result.lat[1] == pytest.approx(38.89 + 0.01 * 48 / 98)
+    assert result.lon[3] == pytest.approx(-77.12 + 0.01 * 8 / 96)
+
+    # Matches get the Census block of their point.
+    assert result.statefp.tolist()[:4] == ["51"] * 4
+    assert result.countyfp.tolist()[:4] == ["013"] * 4
+    assert result.tract.tolist()[:4] == ["100100", "100200", "100200",
+                                         "100100"]
+    assert result.block[0] == "1000"
+    assert result.loc[4, ["lat", "lon"]].isna().all()
+
+
+def test_from_files(geocoder, tmp_path, monkeypatch):
+    monkeypatch.setitem(tiger_geocoder.utils.DATA, "shapefiles-tiger",
+                        tmp_path)
+    loaded = tiger_geocoder.TigerGeocoder.from_files()
+    # The blocks are indexed once per state.
+    assert sorted(loaded.blocks) == ["24", "51"]
+    assert sorted(geocoder.blocks) == ["24", "51"]
+    df = pd.DataFrame({"id": ["0", "1"],
+                       "address": ["50 N Main St", "150 N Main St"],
+                       "city": ["Arlington"] * 2, "state": ["VA"] * 2,
+                       "zip": ["22201"] * 2})
+    result = loaded.geocode(df)
+    assert result.tract.tolist() == ["100100", "100200"]
+    assert result.block.tolist() == ["1000", "2000"]
@@ -0,0 +1,24 @@
+import numpy as np
+from src import utils
+from src.data import unique_id_index
+
+
+def test_lookup(tmp_path, monkeypatch):
+    monkeypatch.setitem(utils.DATA, "interim", tmp_path)
+    ids_2015 = [f"VA_00123_2015-01-01_{i:07}_000" for i in range(1000)]
+    ids_2016 = [f"VA_00123_2016-01-01_{i:07}_000" for i in range(500)]
+    assert unique_id_index.build(ids_2015[::-1], 2015) == 1000
+    assert unique_id_index.build(ids_2016, 2016) == 500
+    assert unique_id_index.indexed_years() == ["2015", "2016"]
+
+    query = [ids_2016[7], "VA_00123_2017-01-01_0000001_000", ids_2015[0]]
+    result = unique_id_index.lookup(query)
+    assert result.year.tolist() == ["2016", None, "2015"]
+    assert result.row.tolist()[0] == 7
+    assert result.row.tolist()[2] == 999
+    assert result.row.isna().tolist() == [False, True, False]
+
+    assert unique_id_index.contains(query).tolist() == [True, False, True]
+    assert unique_id_index.contains(query, years=[2015]).tolist() == [
+        False, False, True]
+    assert not unique_id_index.contains(np.array([], dtype=object)).any()
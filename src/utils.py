@@ -12,8 +12,10 @@ directories in other scripts and notebooks:
 
      Data/
      ├── 03_Shapefiles
+     │   ├── 2010_Census_block_group_shapefiles
      │   ├── 2010_Census_shapefiles
-     │   └── SVI2016_US_shapefiles
+     │   ├── SVI2016_US_shapefiles
+     │   └── TIGER_shapefiles
      ├── Master Project Data
      ├── processed
      └── raw
@@ -35,5 +37,7 @@ DATA = {
     "processed": ROOT / "Data" / "processed",
     "shapefiles": ROOT / "Data" / "03_Shapefiles",
     "shapefiles-census": ROOT / "Data" / "03_Shapefiles" / "2010_Census_shapefiles",
+    "shapefiles-census-bg": ROOT / "Data" / "03_Shapefiles" / "2010_Census_block_group_shapefiles",
     "shapefiles-svi": ROOT / "Data" / "03_Shapefiles" / "SVI2016_US_shapefiles",
+    "shapefiles-tiger": ROOT / "Data" / "03_Shapefiles" / "TIGER_shapefiles",
 }
\ No newline at end of file